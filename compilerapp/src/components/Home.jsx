@@ -1,7 +1,7 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from './AuthContext';
-import { apiRequest } from '../utils/api';
+import { apiRequest, streamJob } from '../utils/api';
 import CodeMirror from '@uiw/react-codemirror';
 import { javascript } from '@codemirror/lang-javascript';
 import { python } from '@codemirror/lang-python';
@@ -26,10 +26,10 @@ const Home = () => {
       try {
         const [challengesRes, leaderboardRes] = await Promise.all([
           apiRequest('challenges/'),
-          apiRequest('leaderboard/')
+          apiRequest('leaderboard/?limit=10')
         ]);
         setProblems(challengesRes);
-        setLeaderboard(leaderboardRes);
+        setLeaderboard(leaderboardRes.results);
       } catch (error) {
         console.error('Error fetching data:', error);
       }
@@ -69,15 +69,24 @@ const Home = () => {
   const handleSubmit = async () => {
     setStatus('Submitting...');
     try {
-      const result = await apiRequest('compile/', 'POST', {
+      const job = await apiRequest('compile/', 'POST', {
         code,
         language: selectedLanguage,
-        stdin: ''
+        stdin: '',
+        async: true
+      });
+      const { result } = await streamJob(job.id, (event, data) => {
+        if (event === 'status') setStatus(data.status === 'queued' ? 'Queued...' : 'Running...');
+        if (event === 'compile') setStatus(data.ok ? 'Compiled, running...' : '❌ Compilation failed');
       });
       
-      setStatus(result.result.stderr 
-        ? `❌ Error: ${result.result.stderr}`
-        : `✅ Output: ${result.result.stdout}`);
+      if (result.error) {
+        setStatus(`❌ Error: ${result.error}`);
+      } else {
+        setStatus(result.result.stderr 
+          ? `❌ Error: ${result.result.stderr}`
+          : `✅ Output: ${result.result.stdout}`);
+      }
     } catch (error) {
       setStatus(`❌ Error: ${error.message}`);
     }
@@ -52,4 +52,52 @@ export async function apiRequest(endpoint, method = 'GET', body = null) {
       window.location.href = '/login';
       return null;
     }
-  }
\ No newline at end of file
+  }
+
+// Follow a queued job's events (see "Live Job Events" in the README).
+// onEvent(name, data) is called for each one; resolves with the final result event.
+export async function streamJob(jobId, onEvent) {
+    const url = `http://localhost:8000/api/jobs/${jobId}/events/`;
+    let lastEventId = null;
+
+    for (;;) {
+      const headers = { Authorization: `Bearer ${localStorage.getItem('accessToken')}` };
+      if (lastEventId !== null) headers['Last-Event-ID'] = lastEventId;
+      let response = await fetch(url, { headers });
+      if (response.status === 401) {
+        const newToken = await refreshToken();
+        if (!newToken) throw new Error('Not logged in');
+        response = await fetch(url, { headers: { ...headers, Authorization: `Bearer ${newToken}` } });
+      }
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.detail || errorData.error || 'Request failed');
+      }
+
+      const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+      let buffer = '';
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += value;
+        let end;
+        while ((end = buffer.indexOf('\n\n')) !== -1) {
+          const message = buffer.slice(0, end);
+          buffer = buffer.slice(end + 2);
+          const fields = {};
+          for (const line of message.split('\n')) {
+            if (line.startsWith(':')) continue;
+            const colon = line.indexOf(': ');
+            if (colon !== -1) fields[line.slice(0, colon)] = line.slice(colon + 2);
+          }
+          if (fields.id !== undefined) lastEventId = fields.id;
+          if (!fields.event || fields.data === undefined) continue;
+          const data = JSON.parse(fields.data);
+          onEvent(fields.event, data);
+          if (fields.event === 'result') return data;
+          if (fields.event === 'error') throw new Error(data.error);
+        }
+      }
+      // The server closes long streams; pick up where we left off
+    }
+  }
@@ -0,0 +1,258 @@
+import asyncio
+import contextlib
+import functools
+import itertools
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from . import metrics
+
+# Seconds a judging is assumed to take until some have been timed
+TYPICAL_SECONDS = 2.0
+
+# Weight of the latest judging in the running estimate of how long one takes
+SMOOTHING = 0.2
+
+
+class Overloaded(Exception):
+    """The judge won't take the submission now; it can be sent again in ``retry_after`` seconds.
+
+    ``queue_position`` is where it stood (or would have stood) among the
+    submissions waiting, 1 being next.
+    """
+
+    def __init__(self, message, retry_after, queue_position=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.queue_position = queue_position
+
+    def payload(self):
+        return {"error": str(self), "retry_after": self.retry_after, "queue_position": self.queue_position}
+
+
+def retry_after(position, slots, typical=TYPICAL_SECONDS):
+    """Whole seconds until ``position`` submissions ahead have gone through ``slots`` at a time."""
+    return max(1, math.ceil(typical * position / max(1, slots)))
+
+
+class _Waiter:
+    __slots__ = ("key", "tag", "seq", "wake", "granted")
+
+    def __init__(self, key, tag, seq, wake):
+        self.key = key
+        self.tag = tag
+        self.seq = seq
+        self.wake = wake
+        self.granted = False
+
+
+class Scheduler:
+    """Admits judgings: at most ``max_active`` at once, and ``max_active_per_user`` of one user.
+
+    The rest wait, and are let in fairly between users (start-time fair
+    queuing): a user's submissions are tagged ``1 / weight`` apart, starting
+    no earlier than the tag last let in, and the lowest tag of a user under
+    their cap goes next. A user with fifty submissions waiting so gets one
+    turn per turn of a user with one, instead of fifty turns ahead of them.
+    A user who already has ``max_waiting_per_user`` waiting, a full queue
+    (``max_waiting``) or ``max_wait`` seconds spent waiting raise
+    ``Overloaded``. Threads and event loops of the process share one
+    scheduler; use ``admit()`` or ``aadmit()`` around each judging. Other
+    processes have schedulers of their own, so every cap is per process.
+    """
+
+    def __init__(self, max_active, max_active_per_user, max_waiting=100, max_waiting_per_user=4, max_wait=10):
+        self.max_active = max_active
+        self.max_active_per_user = max_active_per_user
+        self.max_waiting = max_waiting
+        self.max_waiting_per_user = max_waiting_per_user
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._active = defaultdict(int)
+        self._total_active = 0
+        self._waiting = []
+        self._finish = {}  # Tag after each user's last submission
+        self._virtual = 0.0  # Tag last let in
+        self._seq = itertools.count()
+        self._typical = TYPICAL_SECONDS
+
+    # Called with the lock held
+    def _ahead(self, tag, seq):
+        return sum(1 for waiter in self._waiting if (waiter.tag, waiter.seq) < (tag, seq))
+
+    def _retry_after(self, position):
+        return retry_after(position, self.max_active, self._typical)
+
+    def _dispatch(self):
+        while self._total_active < self.max_active:
+            eligible = [waiter for waiter in self._waiting if self._active[waiter.key] < self.max_active_per_user]
+            if not eligible:
+                return
+            waiter = min(eligible, key=lambda w: (w.tag, w.seq))
+            self._waiting.remove(waiter)
+            self._grant(waiter)
+            waiter.wake()
+
+    def _grant(self, waiter):
+        waiter.granted = True
+        self._active[waiter.key] += 1
+        self._total_active += 1
+        self._virtual = max(self._virtual, waiter.tag)
+
+    def _enqueue(self, key, weight, wake):
+        """A waiter for ``key``: let in already, or queued to be woken with ``wake()``."""
+        with self._lock:
+            tag = max(self._virtual, self._finish.get(key, 0.0))
+            waiter = _Waiter(key, tag, next(self._seq), wake)
+            if self._total_active < self.max_active and self._active[key] < self.max_active_per_user:
+                self._finish[key] = tag + 1 / weight
+                self._grant(waiter)
+                return waiter
+            position = self._ahead(tag, waiter.seq) + 1
+            if sum(1 for w in self._waiting if w.key == key) >= self.max_waiting_per_user:
+                raise Overloaded("You have too many submissions waiting to be judged.",
+                                 self._retry_after(position), position)
+            if len(self._waiting) >= self.max_waiting:
+                raise Overloaded("The judge is busy.", self._retry_after(position), position)
+            self._finish[key] = tag + 1 / weight
+            self._waiting.append(waiter)
+            return waiter
+
+    def _withdraw(self, waiter):
+        """Stop waiting; ``True`` if the waiter was let in meanwhile and holds a slot."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiting.remove(waiter)
+            return False
+
+    def _give_up(self, waiter):
+        # Let in just as the wait ran out: go ahead
+        with self._lock:
+            if waiter.granted:
+                return
+            position = self._ahead(waiter.tag, waiter.seq) + 1
+            self._waiting.remove(waiter)
+        metrics.inc("judge_admissions_total", result="timeout")
+        raise Overloaded("The judge is busy.", self._retry_after(position), position)
+
+    def _release(self, key, seconds):
+        with self._lock:
+            self._active[key] -= 1
+            if not self._active[key]:
+                del self._active[key]
+                if not any(waiter.key == key for waiter in self._waiting):
+                    # Idle again: their next submission starts from the current tag, like a new user's
+                    self._finish.pop(key, None)
+            self._total_active -= 1
+            if seconds is not None:
+                self._typical += SMOOTHING * (seconds - self._typical)
+            self._dispatch()
+
+    def _admitted(self, queued_at):
+        metrics.inc("judge_admissions_total", result="admitted")
+        metrics.observe("judge_admission_wait_seconds", time.monotonic() - queued_at)
+
+    @contextlib.contextmanager
+    def admit(self, key, weight=1):
+        """Hold one of ``key``'s judging slots for the ``with`` block, waiting for it if need be."""
+        queued_at = time.monotonic()
+        event = threading.Event()
+        try:
+            waiter = self._enqueue(key, weight, event.set)
+        except Overloaded:
+            metrics.inc("judge_admissions_total", result="rejected")
+            raise
+        if not waiter.granted:
+            event.wait(self.max_wait)
+            self._give_up(waiter)
+        self._admitted(queued_at)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(key, time.monotonic() - started)
+
+    @contextlib.asynccontextmanager
+    async def aadmit(self, key, weight=1):
+        """``admit()`` for the event loop; a waiting request holds no thread."""
+        queued_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(_resolve, admitted)
+
+        try:
+            waiter = self._enqueue(key, weight, wake)
+        except Overloaded:
+            metrics.inc("judge_admissions_total", result="rejected")
+            raise
+        if not waiter.granted:
+            try:
+                await asyncio.wait_for(admitted, self.max_wait)
+            except asyncio.TimeoutError:
+                self._give_up(waiter)
+            except asyncio.CancelledError:
+                # The client went away; hand back the slot if it was given meanwhile
+                if self._withdraw(waiter):
+                    self._release(key, None)
+                raise
+        self._admitted(queued_at)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(key, time.monotonic() - started)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+@functools.lru_cache(maxsize=None)
+def get_scheduler():
+    """The process-wide scheduler, or ``None`` when ``JUDGE_ADMISSION_ENABLED`` is off.
+
+    Its caps are the ``JUDGE_PROCESS_MAX_*`` settings: nothing is shared with the
+    host's other server processes.
+    """
+    if not getattr(settings, "JUDGE_ADMISSION_ENABLED", True):
+        return None
+    return Scheduler(
+        max_active=getattr(settings, "JUDGE_PROCESS_MAX_ACTIVE", os.cpu_count() or 1),
+        max_active_per_user=getattr(settings, "JUDGE_PROCESS_MAX_ACTIVE_PER_USER", 2),
+        max_waiting=getattr(settings, "JUDGE_PROCESS_MAX_WAITING", 100),
+        max_waiting_per_user=getattr(settings, "JUDGE_PROCESS_MAX_WAITING_PER_USER", 4),
+        max_wait=getattr(settings, "JUDGE_MAX_WAIT_SECONDS", 10)
+    )
+
+
+# A forked worker starts with no judgings of its parent in flight
+os.register_at_fork(after_in_child=get_scheduler.cache_clear)
+
+
+def user_weight(user):
+    """Share of the judge ``user`` gets while others are waiting too: ``JUDGE_STAFF_WEIGHT`` for staff, else 1."""
+    return getattr(settings, "JUDGE_STAFF_WEIGHT", 2) if user.is_staff else 1
+
+
+def admit(user):
+    """``Scheduler.admit()`` of the process-wide scheduler for ``user``; does nothing when admission is off."""
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return contextlib.nullcontext()
+    return scheduler.admit(user.pk, user_weight(user))
+
+
+def aadmit(user):
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return contextlib.nullcontext()
+    return scheduler.aadmit(user.pk, user_weight(user))
@@ -1,5 +1,17 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 class CompilerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'compiler'
+
+    def ready(self):
+        from .db import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='compiler.configure_sqlite')
+
+        from .challenge_cache import challenges_changed
+        post_save.connect(challenges_changed, sender='compiler.CodingChallenge',
+                          dispatch_uid='compiler.challenge_saved')
+        post_delete.connect(challenges_changed, sender='compiler.CodingChallenge',
+                            dispatch_uid='compiler.challenge_deleted')
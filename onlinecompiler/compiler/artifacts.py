@@ -0,0 +1,195 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import uuid
+
+from django.conf import settings
+
+from . import metrics
+from .datadir import data_path, private_dir
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "meta.json"
+
+# Eviction empties the cache down to this share of its size limit, so the
+# next stores don't each have to look through every entry again
+LOW_WATER = 0.8
+
+
+# ----- Toolchain -----
+@functools.lru_cache(maxsize=None)
+def toolchain_version(executable):
+    """First line of the compiler's version banner, e.g. ``g++ (Debian 12.2.0-14) 12.2.0``."""
+    flag = "-version" if os.path.basename(executable) == "javac" else "--version"
+    proc = subprocess.run([executable, flag], capture_output=True, text=True)
+    # javac prints its version on stderr for older JDKs
+    banner = (proc.stdout or proc.stderr).strip()
+    return banner.splitlines()[0] if banner else "unknown"
+
+
+def artifact_key(language, compile_command, code):
+    """Content address of a build: language, compiler version, flags and source."""
+    digest = hashlib.sha256()
+    for part in (language, toolchain_version(compile_command[0]), "\0".join(compile_command)):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(hashlib.sha256(code.encode()).digest())
+    return digest.hexdigest()
+
+
+# ----- Artifact Cache -----
+class ArtifactCache:
+    """Size-bounded on-disk LRU of compiled outputs.
+
+    Each entry is a directory ``<root>/<key>`` holding the files the compiler
+    produced plus ``meta.json`` with the compiler's stdout/stderr/returncode.
+    Entries are staged under a unique temporary name and published with a
+    single ``rename``, so concurrent workers only ever see complete entries.
+    The entry's mtime is bumped on every hit and is what eviction orders by.
+
+    The cache's size is estimated without looking at it: a full scan when the
+    process first stores, plus whatever it stores after. Only an estimate over
+    ``max_bytes`` triggers a scan and eviction, down to ``LOW_WATER`` of it.
+    Other processes' stores show up at the next scan, so the directory may run
+    over by what they stored since. Hits, misses, stores and evictions are
+    counted in ``compiler.metrics``, which adds up every process's counts.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._estimate = None  # Bytes, or None until the first scan
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def fetch(self, key, workdir):
+        """Materialize a cached build into ``workdir``; return its compile result or ``None``."""
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, META_FILE)) as f:
+                compile_result = json.load(f)
+            _copy_tree(entry, workdir, skip={META_FILE})
+            os.utime(entry)
+        except (OSError, ValueError):
+            # Missing, or evicted while we were reading it
+            metrics.inc("judge_cache_requests_total", cache="artifact", result="miss")
+            return None
+        metrics.inc("judge_cache_requests_total", cache="artifact", result="hit")
+        return compile_result
+
+    def store(self, key, workdir, compile_result, exclude=()):
+        """Publish everything in ``workdir`` except ``exclude`` under ``key``."""
+        private_dir(self.root)
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.root)
+        try:
+            size = _copy_tree(workdir, staging, skip=set(exclude))
+            with open(os.path.join(staging, META_FILE), "w") as f:
+                json.dump(compile_result, f)
+            os.rename(staging, self._entry(key))
+        except OSError:
+            # Another worker published the same key first, or the copy failed
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        metrics.inc("judge_cache_stores_total", cache="artifact")
+        with self._lock:
+            if self._estimate is not None:
+                self._estimate += size
+            over = self._estimate is None or self._estimate > self.max_bytes
+        if over:
+            self.evict()
+
+    def _scan(self):
+        """``(mtime, path, size)`` of every published entry, least recently used first."""
+        entries = []
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return entries
+        for name in names:
+            if name.startswith("."):
+                continue
+            path = self._entry(name)
+            try:
+                size = _tree_size(path)
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            entries.append((mtime, path, size))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """Drop least recently used entries if the cache is over ``max_bytes``, down to ``LOW_WATER`` of it."""
+        entries = self._scan()
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes if total <= self.max_bytes else self.max_bytes * LOW_WATER
+        for _, path, size in entries:
+            if total <= target:
+                break
+            # Rename first so readers never see a half-deleted entry
+            doomed = os.path.join(self.root, f".evict-{uuid.uuid4().hex}")
+            try:
+                os.rename(path, doomed)
+            except OSError:
+                continue
+            shutil.rmtree(doomed, ignore_errors=True)
+            total -= size
+            metrics.inc("judge_cache_evictions_total", cache="artifact")
+        with self._lock:
+            self._estimate = total
+
+
+def _copy_tree(src, dst, skip=frozenset()):
+    """Copy every file under ``src`` into ``dst``; return how many bytes were copied.
+
+    Files are copied rather than hard-linked so a running submission can never
+    modify a published entry through its own work directory.
+    """
+    size = 0
+    for dirpath, _, filenames in os.walk(src):
+        rel = os.path.relpath(dirpath, src)
+        target_dir = dst if rel == "." else os.path.join(dst, rel)
+        os.makedirs(target_dir, exist_ok=True)
+        for name in filenames:
+            if rel == "." and name in skip:
+                continue
+            source = os.path.join(dirpath, name)
+            shutil.copy2(source, os.path.join(target_dir, name))
+            size += os.path.getsize(source)
+    return size
+
+
+def _tree_size(path):
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            size += os.path.getsize(os.path.join(dirpath, name))
+    return size
+
+
+@functools.lru_cache(maxsize=None)
+def get_artifact_cache():
+    """The process-wide cache configured in settings, or ``None`` when disabled.
+
+    It is also disabled, with an error logged, when its directory isn't
+    private (see ``datadir.private_dir``): builds found there would be run.
+    """
+    if not getattr(settings, "JUDGE_ARTIFACT_CACHE_ENABLED", True):
+        return None
+    root = str(getattr(settings, "JUDGE_ARTIFACT_CACHE_DIR", None) or data_path("artifacts"))
+    try:
+        private_dir(root)
+    except OSError:
+        logger.exception("Compiled artifacts are not cached")
+        return None
+    max_bytes = getattr(settings, "JUDGE_ARTIFACT_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+    return ArtifactCache(root, max_bytes)
@@ -0,0 +1,411 @@
+import contextlib
+import itertools
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from .challenge_data import replace_test_cases
+from .leaderboard import update_ranking
+from .models import CodingChallenge
+from .runners import get_runner
+from .runners.cpp import get_precompiled_headers
+from .timing import record_phases
+
+PHASES = ("write", "compile", "run", "db")
+ENDPOINTS = ("compile", "solve")
+
+# Toolchain each language needs on the node; languages without it are skipped
+TOOLCHAINS = {"python": "python", "java": "javac", "cpp": "g++"}
+COMMENT = {"python": "#", "java": "//", "cpp": "//"}
+
+WORKLOAD_NAMES = ("trivial", "headers", "cpu", "large_io", "compile_error", "timeout")
+
+CPU_N = 3_000_000
+IO_LINES = 200_000
+
+
+# ----- Workloads -----
+class Workload:
+    """One kind of submission, written in each benchmarked language.
+
+    ``stdin`` is the program's input (the solve endpoint's only test case) and
+    ``expected`` its correct output; a workload whose programs are meant to
+    fail has ``passes = False``.
+    """
+
+    def __init__(self, name, sources, stdin="", expected="", passes=True):
+        self.name = name
+        self.sources = sources
+        self.stdin = stdin
+        self.expected = expected
+        self.passes = passes
+
+
+def _workloads():
+    io_input = "".join(f"{i}\n" for i in range(IO_LINES))
+    return [
+        Workload("trivial", {
+            "python": "print(int(input()) * 2)",
+            "java": (
+                "import java.util.Scanner;\n"
+                "public class Main {\n"
+                "  public static void main(String[] args) {\n"
+                "    System.out.println(new Scanner(System.in).nextInt() * 2);\n"
+                "  }\n"
+                "}\n"
+            ),
+            "cpp": (
+                "#include <cstdio>\n"
+                "int main() { int n; scanf(\"%d\", &n); printf(\"%d\\n\", n * 2); }\n"
+            ),
+        }, stdin="21\n", expected="42\n"),
+        # What most submissions start with; dominates a cold C++ build
+        Workload("headers", {
+            "python": "import collections, heapq, itertools, math\nprint(int(input()) * 2)",
+            "java": (
+                "import java.io.*;\n"
+                "import java.util.*;\n"
+                "public class Main {\n"
+                "  public static void main(String[] args) {\n"
+                "    System.out.println(new Scanner(System.in).nextInt() * 2);\n"
+                "  }\n"
+                "}\n"
+            ),
+            "cpp": (
+                "#include <bits/stdc++.h>\n"
+                "using namespace std;\n"
+                "int main() { int n; cin >> n; cout << n * 2 << endl; }\n"
+            ),
+        }, stdin="21\n", expected="42\n"),
+        Workload("cpu", {
+            "python": "n = int(input())\nprint(sum(i * i % 7 for i in range(n)))",
+            "java": (
+                "import java.util.Scanner;\n"
+                "public class Main {\n"
+                "  public static void main(String[] args) {\n"
+                "    int n = new Scanner(System.in).nextInt();\n"
+                "    long total = 0;\n"
+                "    for (long i = 0; i < n; i++) total += i * i % 7;\n"
+                "    System.out.println(total);\n"
+                "  }\n"
+                "}\n"
+            ),
+            "cpp": (
+                "#include <cstdio>\n"
+                "int main() {\n"
+                "  long long n, total = 0; scanf(\"%lld\", &n);\n"
+                "  for (long long i = 0; i < n; i++) total += i * i % 7;\n"
+                "  printf(\"%lld\\n\", total);\n"
+                "}\n"
+            ),
+        }, stdin=f"{CPU_N}\n", expected=f"{sum(i * i % 7 for i in range(CPU_N))}\n"),
+        Workload("large_io", {
+            "python": "import sys\nsys.stdout.write(''.join(f'{int(line) + 1}\\n' for line in sys.stdin))",
+            "java": (
+                "import java.io.*;\n"
+                "public class Main {\n"
+                "  public static void main(String[] args) throws IOException {\n"
+                "    BufferedReader in = new BufferedReader(new InputStreamReader(System.in));\n"
+                "    StringBuilder out = new StringBuilder();\n"
+                "    for (String line; (line = in.readLine()) != null; )\n"
+                "      out.append(Integer.parseInt(line) + 1).append('\\n');\n"
+                "    System.out.print(out);\n"
+                "  }\n"
+                "}\n"
+            ),
+            "cpp": (
+                "#include <cstdio>\n"
+                "int main() { int n; while (scanf(\"%d\", &n) == 1) printf(\"%d\\n\", n + 1); }\n"
+            ),
+        }, stdin=io_input, expected="".join(f"{i + 1}\n" for i in range(IO_LINES))),
+        Workload("compile_error", {
+            "python": "print(int(input()) * 2",
+            "java": "public class Main { public static void main(String[] args) { int x = } }\n",
+            "cpp": "int main() { return x; }\n",
+        }, stdin="21\n", expected="42\n", passes=False),
+        Workload("timeout", {
+            "python": "while True:\n    pass",
+            "java": "public class Main { public static void main(String[] args) { while (true) {} } }\n",
+            "cpp": "int main() { volatile unsigned x = 0; while (true) x++; }\n",
+        }, stdin="21\n", expected="42\n", passes=False),
+    ]
+
+
+def available_languages(languages):
+    return [language for language in languages if shutil.which(TOOLCHAINS[language])]
+
+
+# ----- Statistics -----
+def percentiles(values):
+    """p50/p95/p99 of ``values``; ``None`` for each when there are none."""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0]}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def summarize(samples, elapsed):
+    """Collapse one scenario's ``samples`` into latency percentiles, throughput and mean phase times.
+
+    Each sample is ``{"latency", "status", "ok", "phases"}`` with times in
+    seconds; the summary is in milliseconds and requests per second.
+    """
+    latencies = [sample["latency"] for sample in samples]
+    phases = {name: statistics.mean(sample["phases"].get(name, 0.0) for sample in samples) * 1000
+              for name in PHASES}
+    phases["other"] = statistics.mean(latencies) * 1000 - sum(phases.values())
+    return {
+        "requests": len(samples),
+        "unexpected": sum(not sample["ok"] for sample in samples),
+        "statuses": dict(Counter(str(sample["status"]) for sample in samples)),
+        "throughput": round(len(samples) / elapsed, 2) if elapsed else None,
+        "latency_ms": {name: round(value * 1000, 1) if value is not None else None
+                       for name, value in percentiles(latencies).items()},
+        "mean_phase_ms": {name: round(value, 1) for name, value in phases.items()},
+    }
+
+
+# ----- Load generator -----
+class Benchmark:
+    """Drive the compile and solve endpoints in-process with a fixed number of concurrent clients.
+
+    Requests go through the whole Django/DRF request path (view, serializer,
+    database), each client as a throwaway user of its own, so the numbers
+    include everything but the network and the WSGI server, and the per-user
+    admission caps (``JUDGE_PROCESS_MAX_ACTIVE_PER_USER``) don't hold the
+    clients back. Every request's source differs by a comment unless
+    ``reuse_source`` is set, so the compile artifact cache and the verdict
+    cache don't turn the benchmark into a cache benchmark. Everything the run
+    creates is deleted afterwards, except the test data blobs; run it inside
+    ``scratch_database()`` so real users never see its challenges.
+
+    With ``pch_modes`` (e.g. ``(False, True)``) the C++ scenarios run once per
+    mode, with precompiled headers off or built beforehand, and are named
+    ``...[no-pch]`` / ``...[pch]``; otherwise C++ runs as configured.
+    """
+
+    def __init__(self, languages, workloads, endpoints, requests=20, concurrency=4,
+                 time_limit=1.0, reuse_source=False, pch_modes=None):
+        self.languages = languages
+        self.workloads = [workload for workload in _workloads() if workload.name in workloads]
+        self.endpoints = endpoints
+        self.requests = requests
+        self.concurrency = max(1, concurrency)
+        self.time_limit = time_limit
+        self.reuse_source = reuse_source
+        self.pch_modes = pch_modes
+        self._run_id = uuid.uuid4().hex[:12]
+        self._serial = itertools.count()
+        self._serial_lock = threading.Lock()
+
+    def _source(self, workload, language):
+        code = workload.sources[language]
+        if self.reuse_source:
+            return code
+        with self._serial_lock:
+            serial = next(self._serial)
+        return f"{code}\n{COMMENT[language]} benchmark {self._run_id}-{serial}\n"
+
+    def _check(self, workload, endpoint, response):
+        # A run cut off by its time limit can also come back as 400/408
+        if response.status_code != 200:
+            return response.status_code < 500 and not workload.passes
+        data = response.data
+        if endpoint == "solve":
+            return data["all_tests_passed"] == workload.passes
+        # Big outputs come back cut down to their head and tail, so only the
+        # first line is compared
+        result = data["result"]
+        first_line = result.get("stdout", "").strip().partition("\n")[0]
+        output_ok = (result.get("returncode") == 0 and "limit_exceeded" not in result
+                     and first_line == workload.expected.strip().partition("\n")[0])
+        return output_ok == workload.passes
+
+    def _request(self, client, workload, language, endpoint, challenge):
+        code = self._source(workload, language)
+        if endpoint == "solve":
+            url, body = f"/api/challenges/{challenge.pk}/solve/", {"code": code, "language": language}
+        else:
+            url, body = "/api/compile/", {"code": code, "language": language, "stdin": workload.stdin}
+
+        with record_phases() as phases:
+            started = time.perf_counter()
+            try:
+                response = client.post(url, body, format="json")
+            except Exception as e:
+                # The test client re-raises what the view raised; count it as a failed request
+                status, ok = type(e).__name__, False
+            else:
+                status, ok = response.status_code, self._check(workload, endpoint, response)
+            latency = time.perf_counter() - started
+        return {"latency": latency, "status": status, "ok": ok, "phases": dict(phases)}
+
+    def _scenario(self, users, workload, language, endpoint, challenge):
+        remaining = iter(range(self.requests))
+        lock = threading.Lock()
+        samples = []
+
+        def client_loop(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            return
+                    sample = self._request(client, workload, language, endpoint, challenge)
+                    with lock:
+                        samples.append(sample)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=client_loop, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(samples, time.perf_counter() - started)
+
+    def run(self, progress=None):
+        """Run every scenario; return ``{"<endpoint>/<language>/<workload>": summary}``."""
+        users = [User.objects.create_user(f"benchmark-{self._run_id}-{client}")
+                 for client in range(self.concurrency)]
+        results = {}
+        try:
+            challenges = {}
+            for workload in self.workloads:
+                challenge = CodingChallenge.objects.create(
+                    title=f"Benchmark: {workload.name}", description="", created_by=users[0],
+                    is_active=True, time_limit=self.time_limit
+                )
+                replace_test_cases(challenge, [(workload.stdin, workload.expected)])
+                challenges[workload.name] = challenge
+
+            limits = {"JUDGE_CPU_TIME_LIMIT": self.time_limit, "JUDGE_WALL_TIME_LIMIT": 2 * self.time_limit}
+            with override_settings(**limits):
+                for endpoint, language, workload in itertools.product(self.endpoints, self.languages, self.workloads):
+                    name = f"{endpoint}/{language}/{workload.name}"
+                    if language != "cpp" or self.pch_modes is None:
+                        modes = [(name, contextlib.nullcontext())]
+                    else:
+                        modes = [(f"{name}[{'pch' if pch else 'no-pch'}]", _pch_mode(pch)) for pch in self.pch_modes]
+                    for name, mode in modes:
+                        with mode:
+                            results[name] = self._scenario(users, workload, language, endpoint,
+                                                           challenges[workload.name])
+                        if progress is not None:
+                            progress(name, results[name])
+        finally:
+            for user in users:
+                user_id = user.pk
+                user.delete()
+                update_ranking(user_id)
+        return results
+
+
+@contextlib.contextmanager
+def scratch_database():
+    """Run the ``with`` block against a new, empty database and a cache of its own, and drop both afterwards.
+
+    The benchmark's challenges have to be active to be solved, so on the real
+    database users would see them while it runs; its cache entries (ranking,
+    verdicts) would name rows that only exist here. A SQLite database is a
+    file in a temporary directory rather than Django's in-memory test
+    database, so concurrent writers behave as they do in production.
+    """
+    connection = connections["default"]
+    test_settings = connection.settings_dict["TEST"]
+    directory = None
+    if connection.vendor == "sqlite":
+        directory = tempfile.mkdtemp(prefix="judge-benchmark-")
+        connection.settings_dict["TEST"] = {**test_settings, "NAME": os.path.join(directory, "db.sqlite3")}
+    try:
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                                       "LOCATION": "judge-benchmark"}}):
+                yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    finally:
+        connection.settings_dict["TEST"] = test_settings
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def _pch_mode(enabled):
+    """C++ builds with precompiled headers off, or on and already built, so no request waits for them."""
+    with override_settings(JUDGE_CPP_PCH_ENABLED=enabled):
+        get_precompiled_headers.cache_clear()
+        try:
+            runner = get_runner("cpp")
+            if enabled and hasattr(runner, "precompile"):
+                runner.precompile()
+            yield
+        finally:
+            get_precompiled_headers.cache_clear()
+
+
+# ----- Results -----
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def save_results(results, options, directory):
+    """Write ``results`` with the commit and machine they were measured on; return the file path."""
+    commit = _git_commit()
+    document = {
+        "commit": commit,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": socket.gethostname(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "database": connections["default"].vendor,
+        "options": options,
+        "results": results,
+    }
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'unknown'}.json")
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+    return path
+
+
+def compare_results(baseline, results):
+    """Per scenario in both runs: relative change of p50, p95 and throughput (``+0.10`` is 10% higher)."""
+    changes = defaultdict(dict)
+    for name, summary in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        for metric, old, new in (
+            ("p50", before["latency_ms"]["p50"], summary["latency_ms"]["p50"]),
+            ("p95", before["latency_ms"]["p95"], summary["latency_ms"]["p95"]),
+            ("throughput", before["throughput"], summary["throughput"]),
+        ):
+            if old and new is not None:
+                changes[name][metric] = (new - old) / old
+    return dict(changes)
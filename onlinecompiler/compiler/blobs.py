@@ -0,0 +1,76 @@
+import functools
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+
+COPY_CHUNK = 1024 * 1024
+
+
+# ----- Blob Store -----
+class BlobStore:
+    """Content-addressed files on disk, each stored once under its SHA-256.
+
+    A blob lives at ``<root>/<digest[:2]>/<digest>``. Writes are staged under
+    a unique temporary name and published with a single ``rename``, so readers
+    only ever see complete blobs, and storing the same content twice is a no-op.
+    Blobs are never modified, only added.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, source):
+        """Store ``source`` (``str``, ``bytes`` or a binary file object); return ``(digest, size)``.
+
+        File objects are copied in chunks, so a blob never has to fit in memory.
+        """
+        if isinstance(source, str):
+            source = source.encode()
+        os.makedirs(self.root, exist_ok=True)
+        fd, staging = tempfile.mkstemp(prefix=".staging-", dir=self.root)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as out:
+                if isinstance(source, bytes):
+                    chunks = [source]
+                else:
+                    chunks = iter(lambda: source.read(COPY_CHUNK), b"")
+                for chunk in chunks:
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            digest = digest.hexdigest()
+            path = self.path(digest)
+            if os.path.exists(path):
+                os.unlink(staging)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.rename(staging, path)
+        except BaseException:
+            if os.path.exists(staging):
+                os.unlink(staging)
+            raise
+        return digest, size
+
+    def open(self, digest):
+        return open(self.path(digest), "rb")
+
+    def read_text(self, digest, limit=None):
+        """The blob decoded as text; past ``limit`` bytes it is cut off with a marker."""
+        with self.open(digest) as f:
+            data = f.read() if limit is None else f.read(limit + 1)
+            if limit is None or len(data) <= limit:
+                return data.decode(errors="replace")
+            omitted = os.fstat(f.fileno()).st_size - limit
+        return data[:limit].decode(errors="replace") + f"\n... [{omitted} bytes truncated] ..."
+
+
+@functools.lru_cache(maxsize=None)
+def get_blob_store():
+    return BlobStore(settings.JUDGE_BLOB_DIR)
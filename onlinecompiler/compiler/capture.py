@@ -0,0 +1,462 @@
+import asyncio
+import os
+import selectors
+import signal
+import subprocess
+import time
+import weakref
+
+from django.conf import settings
+
+from .limits import guard_command, parse_report, usage_dict
+
+WHITESPACE = b" \t\n\r\x0b\x0c"
+READ_CHUNK = 65536
+WRITE_CHUNK = 65536
+
+# Why pump() stopped before the process closed its output
+STOPPED_TIMEOUT = "timeout"
+STOPPED_OUTPUT_LIMIT = "output_limit"
+STOPPED_MISMATCH = "mismatch"
+
+
+def output_limit():
+    return getattr(settings, "JUDGE_OUTPUT_LIMIT_BYTES", 16 * 1024 * 1024)
+
+
+def output_keep():
+    return getattr(settings, "JUDGE_OUTPUT_KEEP_BYTES", 64 * 1024)
+
+
+# ----- Capture -----
+class StreamCapture:
+    """Counts everything written to a stream but only keeps its head and tail.
+
+    ``feed`` returns ``False`` once more than ``limit`` bytes have arrived, which
+    is the caller's cue to kill the writer.
+    """
+
+    def __init__(self, limit=None, keep=None):
+        self.limit = output_limit() if limit is None else limit
+        keep = output_keep() if keep is None else keep
+        self.head_size = keep // 2
+        self.tail_size = keep - self.head_size
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def feed(self, data):
+        self.total += len(data)
+        room = self.head_size - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            if len(self.tail) > self.tail_size:
+                del self.tail[:len(self.tail) - self.tail_size]
+        return self.total <= self.limit
+
+    @property
+    def truncated(self):
+        return self.total > len(self.head) + len(self.tail)
+
+    def text(self):
+        if not self.truncated:
+            return (bytes(self.head) + bytes(self.tail)).decode(errors="replace")
+        omitted = self.total - len(self.head) - len(self.tail)
+        return (
+            self.head.decode(errors="replace")
+            + f"\n... [{omitted} bytes truncated] ...\n"
+            + self.tail.decode(errors="replace")
+        )
+
+
+class StrippedFile:
+    """Read-only ``bytes``-like view of a file with surrounding whitespace removed.
+
+    Supports ``len()`` and slicing, reading the requested range from disk each
+    time, so ``OutputMatcher`` can check against an expected output of any size.
+    """
+
+    def __init__(self, f):
+        self.fd = f.fileno()
+        size = os.fstat(self.fd).st_size
+        start, end = 0, size
+        while start < end:
+            chunk = os.pread(self.fd, min(READ_CHUNK, end - start), start)
+            kept = chunk.lstrip(WHITESPACE)
+            start += len(chunk) - len(kept)
+            if kept:
+                break
+        while end > start:
+            chunk = os.pread(self.fd, min(READ_CHUNK, end - start), end - min(READ_CHUNK, end - start))
+            kept = chunk.rstrip(WHITESPACE)
+            end -= len(chunk) - len(kept)
+            if kept:
+                break
+        self.start = start
+        self.length = end - start
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(self.length)
+        return os.pread(self.fd, max(stop - start, 0), self.start + start)
+
+
+class OutputMatcher:
+    """Compares a stream against the expected output as it arrives.
+
+    Equivalent to ``actual.strip() == expected.strip()`` but without holding
+    either side in memory: leading whitespace is skipped, trailing whitespace
+    is held back until more output shows it wasn't trailing, and everything
+    else is checked against ``expected`` immediately. ``feed`` returns
+    ``False`` as soon as the output can no longer match. ``expected`` may be a
+    string or a binary file, which is then read piecemeal.
+    """
+
+    def __init__(self, expected):
+        if hasattr(expected, "fileno"):
+            self.expected = StrippedFile(expected)
+        else:
+            self.expected = expected.strip().encode()
+        self.position = 0
+        self.pending = bytearray()
+        self.started = False
+        self.mismatch = False
+
+    def feed(self, data):
+        if self.mismatch:
+            return False
+        if not self.started:
+            data = data.lstrip(WHITESPACE)
+            if not data:
+                return True
+            self.started = True
+        self.pending += data
+        settled = len(self.pending.rstrip(WHITESPACE))
+        if settled:
+            end = self.position + settled
+            if end > len(self.expected) or self.expected[self.position:end] != self.pending[:settled]:
+                self.mismatch = True
+                return False
+            self.position = end
+            del self.pending[:settled]
+        return True
+
+    def finish(self):
+        return not self.mismatch and self.position == len(self.expected)
+
+
+def as_matcher(expected_output):
+    """A matcher for ``expected_output``: a string or file gets an ``OutputMatcher``; a matcher (see ``checkers``) is used as is."""
+    if expected_output is None or hasattr(expected_output, "feed"):
+        return expected_output
+    return OutputMatcher(expected_output)
+
+
+# ----- Pump -----
+class PumpResult:
+    def __init__(self, stdout, stderr, stopped=None):
+        self.stdout = stdout
+        self.stderr = stderr
+        self.stopped = stopped
+
+    def to_result(self, returncode, matcher=None, usage=None, limit_exceeded=None):
+        result = {
+            "stdout": self.stdout.text(),
+            "stderr": self.stderr.text(),
+            "returncode": returncode
+        }
+        if usage is not None:
+            result["usage"] = usage
+        if self.stopped == STOPPED_OUTPUT_LIMIT:
+            result["output_limit_exceeded"] = True
+        if limit_exceeded is not None:
+            result["limit_exceeded"] = limit_exceeded
+        if matcher is not None:
+            result["matched"] = (self.stopped is None and limit_exceeded is None
+                                 and returncode == 0 and matcher.finish())
+        return result
+
+
+def pump(out_fd, err_fd, deadline, kill, stdin_fd=None, input_bytes=b"", matcher=None):
+    """Feed ``input_bytes`` to ``stdin_fd`` and drain ``out_fd``/``err_fd`` until EOF.
+
+    All three fds are read/written incrementally from a single selector loop,
+    so neither side can deadlock on a full pipe. ``kill`` is called when the
+    deadline passes, an output limit is hit or ``matcher`` rejects stdout.
+    ``stdin_fd`` is closed once all input is written.
+    """
+    captures = {out_fd: StreamCapture(), err_fd: StreamCapture()}
+    stopped = None
+    view = memoryview(input_bytes)
+    offset = 0
+
+    with selectors.DefaultSelector() as selector:
+        selector.register(out_fd, selectors.EVENT_READ)
+        selector.register(err_fd, selectors.EVENT_READ)
+        if stdin_fd is not None:
+            if view:
+                os.set_blocking(stdin_fd, False)
+                selector.register(stdin_fd, selectors.EVENT_WRITE)
+            else:
+                os.close(stdin_fd)
+                stdin_fd = None
+
+        readers = 2
+        while readers and stopped is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                stopped = STOPPED_TIMEOUT
+                break
+            for key, _ in selector.select(remaining):
+                if key.fd == stdin_fd:
+                    try:
+                        offset += os.write(stdin_fd, view[offset:offset + WRITE_CHUNK])
+                    except BrokenPipeError:
+                        # The program stopped reading; that's its business
+                        offset = len(view)
+                    if offset >= len(view):
+                        selector.unregister(stdin_fd)
+                        os.close(stdin_fd)
+                        stdin_fd = None
+                    continue
+
+                data = os.read(key.fd, READ_CHUNK)
+                if not data:
+                    selector.unregister(key.fd)
+                    readers -= 1
+                    continue
+                if not captures[key.fd].feed(data):
+                    stopped = STOPPED_OUTPUT_LIMIT
+                    break
+                if key.fd == out_fd and matcher is not None and not matcher.feed(data):
+                    stopped = STOPPED_MISMATCH
+                    break
+
+    if stdin_fd is not None:
+        os.close(stdin_fd)
+    if stopped is not None:
+        kill()
+    return PumpResult(captures[out_fd], captures[err_fd], stopped)
+
+
+def run_process(command, input_data, timeout, cwd=None, expected_output=None, limits=None):
+    """``subprocess.run`` replacement that streams and caps the child's output.
+
+    Raises ``subprocess.TimeoutExpired`` like ``subprocess.run``. When
+    ``expected_output`` (see ``as_matcher``) is given the result carries
+    ``matched`` and the child is killed at the first byte that cannot match.
+    ``input_data`` may be a string or a binary file, which becomes the child's
+    stdin as is, so it is never read into memory here. With ``limits`` (a
+    ``limits.ResourceLimits``) the child runs under the guard and the result
+    carries its ``usage`` and any ``limit_exceeded``.
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    matcher = as_matcher(expected_output)
+    argv = command
+    report_r = report_w = None
+    if limits is not None:
+        report_r, report_w = os.pipe()
+        argv = guard_command(limits, report_w, command)
+    if hasattr(input_data, "fileno"):
+        stdin, in_r, in_w, input_bytes = input_data, None, None, b""
+    else:
+        in_r, in_w = os.pipe()
+        stdin, input_bytes = in_r, (input_data or "").encode()
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    try:
+        # Own session so a kill also takes down anything the program spawned
+        proc = subprocess.Popen(argv, stdin=stdin, stdout=out_w, stderr=err_w, cwd=cwd, start_new_session=True,
+                                pass_fds=() if report_w is None else (report_w,))
+    except BaseException:
+        for fd in (in_w, out_r, err_r, report_r):
+            if fd is not None:
+                os.close(fd)
+        raise
+    finally:
+        for fd in (in_r, out_w, err_w, report_w):
+            if fd is not None:
+                os.close(fd)
+
+    def kill():
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    try:
+        outcome = pump(out_r, err_r, deadline, kill, stdin_fd=in_w, input_bytes=input_bytes, matcher=matcher)
+    finally:
+        os.close(out_r)
+        os.close(err_r)
+
+    try:
+        try:
+            returncode = proc.wait(timeout=max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            # Closed its output but kept running
+            kill()
+            proc.wait()
+            outcome.stopped = STOPPED_TIMEOUT
+        if outcome.stopped == STOPPED_TIMEOUT:
+            raise subprocess.TimeoutExpired(command, timeout)
+        wall_time = time.monotonic() - started
+        if limits is None:
+            return outcome.to_result(returncode, matcher)
+        report = parse_report(_read_all(report_r))
+    finally:
+        if report_r is not None:
+            os.close(report_r)
+
+    return _guarded_result(outcome, returncode, matcher, limits, report, wall_time)
+
+
+def _guarded_result(outcome, returncode, matcher, limits, report, wall_time):
+    # The guard reports the program's own exit status along with its usage
+    if report is None:
+        usage = usage_dict(wall_time=wall_time)
+    else:
+        returncode, cpu_time, peak_memory_kb = report
+        usage = usage_dict(cpu_time, wall_time, peak_memory_kb)
+    return outcome.to_result(returncode, matcher, usage, limits.exceeded(returncode, usage))
+
+
+# ----- Async -----
+_run_slots = weakref.WeakKeyDictionary()
+
+
+def run_slots():
+    """The running event loop's cap on programs executing at once (``JUDGE_ASYNC_MAX_RUNS``).
+
+    Enter it with ``async with`` around each compile or run on the async path.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _run_slots:
+        _run_slots[loop] = asyncio.Semaphore(getattr(settings, "JUDGE_ASYNC_MAX_RUNS", os.cpu_count() or 1))
+    return _run_slots[loop]
+
+
+async def arun_process(command, input_data, timeout, cwd=None, expected_output=None, limits=None):
+    """``run_process`` for the event loop; same arguments, result and ``TimeoutExpired``.
+
+    The child is started with ``asyncio.create_subprocess_exec`` and its stdin
+    written and output drained by tasks on the running loop, so a waiting run
+    holds no thread. Cancelling the call kills the child's process group.
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    matcher = as_matcher(expected_output)
+    argv = command
+    report_r = report_w = None
+    if limits is not None:
+        report_r, report_w = os.pipe()
+        argv = guard_command(limits, report_w, command)
+    if hasattr(input_data, "fileno"):
+        stdin, input_bytes = input_data, b""
+    else:
+        stdin, input_bytes = asyncio.subprocess.PIPE, (input_data or "").encode()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *argv, stdin=stdin, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, cwd=cwd,
+            start_new_session=True, pass_fds=() if report_w is None else (report_w,))
+    except BaseException:
+        if report_r is not None:
+            os.close(report_r)
+        raise
+    finally:
+        if report_w is not None:
+            os.close(report_w)
+
+    captures = (StreamCapture(), StreamCapture())
+    stopped = None
+    feeding = None
+    tasks = []
+
+    def stop(reason):
+        # The drains go on emptying the pipes: until they see EOF, proc.wait() doesn't return
+        nonlocal stopped
+        if stopped is None:
+            stopped = reason
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        if feeding is not None:
+            feeding.cancel()
+
+    async def feed():
+        try:
+            view = memoryview(input_bytes)
+            for offset in range(0, len(view), WRITE_CHUNK):
+                proc.stdin.write(view[offset:offset + WRITE_CHUNK])
+                await proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # The program stopped reading; that's its business
+            pass
+        finally:
+            proc.stdin.close()
+
+    async def drain(stream, capture, matcher=None):
+        while True:
+            data = await stream.read(READ_CHUNK)
+            if not data:
+                return
+            if stopped is not None:
+                continue
+            if not capture.feed(data):
+                stop(STOPPED_OUTPUT_LIMIT)
+            elif matcher is not None and not matcher.feed(data):
+                stop(STOPPED_MISMATCH)
+
+    try:
+        try:
+            drains = [asyncio.ensure_future(drain(proc.stdout, captures[0], matcher)),
+                      asyncio.ensure_future(drain(proc.stderr, captures[1]))]
+            tasks.extend(drains)
+            if proc.stdin is not None:
+                feeding = asyncio.ensure_future(feed())
+                tasks.append(feeding)
+            _, pending = await asyncio.wait(drains, timeout=max(deadline - time.monotonic(), 0))
+            if pending:
+                stop(STOPPED_TIMEOUT)
+            try:
+                returncode = await asyncio.wait_for(proc.wait(), max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                # Closed its output but kept running
+                stop(STOPPED_TIMEOUT)
+                stopped = STOPPED_TIMEOUT
+                returncode = await proc.wait()
+        except BaseException:
+            stop(None)
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        outcome = PumpResult(*captures, stopped=stopped)
+        if stopped == STOPPED_TIMEOUT:
+            raise subprocess.TimeoutExpired(command, timeout)
+        wall_time = time.monotonic() - started
+        if limits is None:
+            return outcome.to_result(returncode, matcher)
+        report = parse_report(_read_all(report_r))
+    finally:
+        if report_r is not None:
+            os.close(report_r)
+
+    return _guarded_result(outcome, returncode, matcher, limits, report, wall_time)
+
+
+def _read_all(fd):
+    chunks = []
+    while True:
+        chunk = os.read(fd, 4096)
+        if not chunk:
+            return b"".join(chunks).decode()
+        chunks.append(chunk)
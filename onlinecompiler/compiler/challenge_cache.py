@@ -0,0 +1,103 @@
+import hashlib
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from . import metrics
+from .models import CodingChallenge
+
+KEY_PREFIX = "challenges:"
+
+# (version, time of the last change) of the challenges as a whole; every
+# cached representation is keyed by the version, so replacing it drops them all
+STATE_KEY = KEY_PREFIX + "state"
+
+
+# ----- Invalidation -----
+def invalidate_challenges():
+    """Start a new version of the challenges, so no representation cached before is served again."""
+    cache.set(STATE_KEY, (uuid.uuid4().hex, time.time()), timeout=None)
+
+
+def challenges_changed(sender=None, **kwargs):
+    """``post_save`` / ``post_delete`` receiver: invalidate now, and again once the change is committed.
+
+    The second time drops whatever a request in between cached of the
+    challenges as they were before the commit.
+    """
+    invalidate_challenges()
+    transaction.on_commit(invalidate_challenges)
+
+
+def _state():
+    state = cache.get(STATE_KEY)
+    if state is None:
+        # First use, or evicted: any version other than the last one will do
+        cache.add(STATE_KEY, (uuid.uuid4().hex, time.time()), timeout=None)
+        state = cache.get(STATE_KEY)
+    return state
+
+
+# ----- Cached Responses -----
+def _timeout():
+    return getattr(settings, "CHALLENGE_CACHE_SECONDS", 3600)
+
+
+def audience(user, version):
+    """Which representation of the challenges ``user`` gets.
+
+    Superusers see every challenge with its tests and checker, creators the
+    tests and checkers of their own, and everyone else the same public view.
+    """
+    if user.is_superuser:
+        return "admin"
+    key = f"{KEY_PREFIX}{version}:creators"
+    creators = cache.get(key)
+    if creators is None:
+        creators = frozenset(CodingChallenge.objects.order_by().values_list("created_by_id", flat=True).distinct())
+        cache.set(key, creators, timeout=_timeout())
+    return f"creator:{user.pk}" if user.pk in creators else "public"
+
+
+def cached_response(request, respond):
+    """What the view method ``respond`` answers ``request`` with, cached while no challenge changes.
+
+    Entries are kept per audience and full path, so query parameters like
+    ``?difficulty=`` are cached apart. The response carries an ``ETag`` of
+    its body and the time the challenges last changed as ``Last-Modified``,
+    and a client whose copy is current gets ``304 Not Modified``. Details
+    that carry the test data (only their owners get it) can run to many MB
+    and are answered afresh every time instead.
+    """
+    if not getattr(settings, "CHALLENGE_CACHE_ENABLED", True):
+        return respond()
+    version, modified = _state()
+    digest = hashlib.sha256(f"{version}\0{audience(request.user, version)}\0{request.get_full_path()}".encode())
+    key = KEY_PREFIX + digest.hexdigest()
+    entry = cache.get(key)
+    metrics.inc("judge_cache_requests_total", cache="challenge", result="miss" if entry is None else "hit")
+    if entry is None:
+        response = respond()
+        if response.status_code != 200 or "test_cases" in response.data:
+            return response
+        body = JSONRenderer().render(response.data)
+        entry = (json.loads(body), f'"{hashlib.sha256(body).hexdigest()}"')
+        cache.set(key, entry, timeout=_timeout())
+
+    data, etag = entry
+    response = Response(data, headers={
+        "ETag": etag,
+        "Last-Modified": http_date(int(modified)),
+        # Depends on who asks, so only the client may keep it, and it checks back every time
+        "Cache-Control": "private, no-cache",
+    })
+    patch_vary_headers(response, ["Authorization"])
+    return get_conditional_response(request, etag=etag, last_modified=int(modified), response=response)
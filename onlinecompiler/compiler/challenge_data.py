@@ -0,0 +1,108 @@
+import posixpath
+import re
+import tarfile
+import zipfile
+
+from django.db import transaction
+
+from .blobs import get_blob_store
+from .challenge_cache import challenges_changed
+from .models import ChallengeTestCase
+
+INPUT_SUFFIXES = (".in",)
+OUTPUT_SUFFIXES = (".out", ".ans")
+
+
+class InvalidTestBundle(Exception):
+    pass
+
+
+# ----- Storing -----
+def replace_test_cases(challenge, pairs):
+    """Make ``pairs`` of ``(input, expected output)`` the test cases of ``challenge``.
+
+    Each side may be ``str``, ``bytes`` or a binary file object, which is
+    streamed into the blob store. The old cases are swapped out in one
+    transaction; their blobs stay, as other challenges may share them.
+    """
+    store = get_blob_store()
+    cases = []
+    for position, (input_source, output_source) in enumerate(pairs):
+        input_blob, input_size = store.put(input_source)
+        output_blob, output_size = store.put(output_source)
+        cases.append(ChallengeTestCase(
+            challenge=challenge, position=position,
+            input_blob=input_blob, input_size=input_size,
+            output_blob=output_blob, output_size=output_size,
+        ))
+    with transaction.atomic():
+        ChallengeTestCase.objects.filter(challenge=challenge).delete()
+        ChallengeTestCase.objects.bulk_create(cases)
+        # bulk_create sends no signals; creators see their tests in the challenge's details
+        challenges_changed()
+    return cases
+
+
+def export_test_cases(challenge):
+    """The ``[{"input": ..., "output": ...}]`` form the API accepts, read back from the blob store."""
+    store = get_blob_store()
+    return [
+        {"input": store.read_text(case.input_blob), "output": store.read_text(case.output_blob)}
+        for case in challenge.cases.all()
+    ]
+
+
+# ----- Bundles -----
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+def _pair_names(names):
+    """Match ``<stem>.in`` with ``<stem>.out`` (or ``.ans``), in natural stem order."""
+    inputs, outputs = {}, {}
+    for name in names:
+        base = posixpath.basename(name)
+        if not base or base.startswith(".") or name.startswith("__MACOSX/"):
+            continue
+        stem, suffix = posixpath.splitext(name)
+        if suffix in INPUT_SUFFIXES:
+            inputs[stem] = name
+        elif suffix in OUTPUT_SUFFIXES:
+            outputs[stem] = name
+
+    unmatched = sorted(set(inputs) ^ set(outputs), key=_natural_key)
+    if unmatched:
+        raise InvalidTestBundle(f"No matching input/output file for: {', '.join(unmatched[:5])}")
+    if not inputs:
+        raise InvalidTestBundle("No test cases found; expected <name>.in / <name>.out pairs.")
+    return [(inputs[stem], outputs[stem]) for stem in sorted(inputs, key=_natural_key)]
+
+
+def read_test_bundle(fileobj):
+    """Iterator of ``(input, output)`` file objects, one per test case in a zip or tar archive.
+
+    Members are read straight out of the archive, one pair at a time. Raises
+    ``InvalidTestBundle`` up front if the archive is unusable.
+    """
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        archive = zipfile.ZipFile(fileobj)
+        names = [info.filename for info in archive.infolist() if not info.is_dir()]
+        open_member = archive.open
+    else:
+        fileobj.seek(0)
+        try:
+            archive = tarfile.open(fileobj=fileobj, mode="r:*")
+        except tarfile.TarError:
+            raise InvalidTestBundle("Test bundle must be a zip or tar archive.")
+        names = [member.name for member in archive.getmembers() if member.isfile()]
+        open_member = archive.extractfile
+    pairs = _pair_names(names)
+
+    def members():
+        with archive:
+            for input_name, output_name in pairs:
+                with open_member(input_name) as input_file, open_member(output_name) as output_file:
+                    yield input_file, output_file
+
+    return members()
@@ -0,0 +1,259 @@
+import contextlib
+import os
+import subprocess
+import tempfile
+
+from .capture import READ_CHUNK, OutputMatcher, arun_process, run_process
+from .execution import acompile_program, compile_program
+from .limits import ResourceLimits
+
+CHECKER_EXACT = "exact"
+CHECKER_WHITESPACE = "whitespace"
+CHECKER_FLOAT = "float"
+CHECKER_CUSTOM = "custom"
+
+DEFAULT_TOLERANCE = 1e-6
+
+# How much longer than the expected token a number may be written (extra
+# digits of precision) before it is rejected without reading on
+NUMBER_SLACK = 64
+
+
+class CheckerError(Exception):
+    """The challenge's checker could not be built or did not give a verdict."""
+
+
+# ----- Token Matcher -----
+def _tokens(expected):
+    """Whitespace-separated tokens of a string or binary file, read a chunk at a time."""
+    if not hasattr(expected, "read"):
+        yield from expected.encode().split()
+        return
+    partial = b""
+    while True:
+        chunk = expected.read(READ_CHUNK)
+        if not chunk:
+            break
+        tokens = (partial + chunk).split()
+        partial = tokens.pop() if tokens and not chunk[-1:].isspace() else b""
+        yield from tokens
+    if partial:
+        yield partial
+
+
+class TokenMatcher:
+    """Compares the output with the expected one token by token, as it arrives.
+
+    Tokens are separated by any run of whitespace, so spacing, trailing blanks
+    and line breaks don't matter. With ``tolerance``, two tokens that both
+    parse as numbers also match when they differ by at most ``tolerance``,
+    absolutely or relative to the expected value. Only the token being read is
+    held, and ``feed`` returns ``False`` at the first one that can't match.
+    Same interface as ``capture.OutputMatcher``.
+    """
+
+    def __init__(self, expected, tolerance=None):
+        self.expected = _tokens(expected)
+        self.tolerance = tolerance
+        self.partial = bytearray()
+        self.mismatch = False
+        self._next = None
+
+    def _peek(self):
+        if self._next is None:
+            self._next = next(self.expected, b"")
+        return self._next
+
+    def _same(self, actual, expected):
+        if actual == expected:
+            return True
+        if self.tolerance is None:
+            return False
+        try:
+            a, b = float(actual), float(expected)
+        except ValueError:
+            return False
+        return abs(a - b) <= self.tolerance * max(1.0, abs(b))
+
+    def _take(self, token):
+        expected = self._peek()
+        self._next = None
+        if not expected or not self._same(token, expected):
+            self.mismatch = True
+        return not self.mismatch
+
+    def feed(self, data):
+        if self.mismatch:
+            return False
+        if not data:
+            return True
+        tokens = data.split()
+        if self.partial:
+            if data[:1].isspace() or not tokens:
+                self._take(bytes(self.partial))
+            else:
+                tokens[0] = bytes(self.partial) + tokens[0]
+            self.partial.clear()
+        partial = tokens.pop() if tokens and not data[-1:].isspace() else None
+        for token in tokens:
+            if not self._take(token):
+                return False
+        if partial is not None:
+            # Measured against the token expected after the complete ones above
+            self.partial += partial
+            longest = len(self._peek()) + (NUMBER_SLACK if self.tolerance is not None else 0)
+            if len(self.partial) > longest:
+                self.mismatch = True
+        return not self.mismatch
+
+    def finish(self):
+        if self.partial and not self.mismatch:
+            self._take(bytes(self.partial))
+            self.partial.clear()
+        return not self.mismatch and not self._peek()
+
+
+class OutputSpool:
+    """Writes the output to ``path`` for a checker program; the verdict is the checker's."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+
+    def feed(self, data):
+        self.file.write(data)
+        return True
+
+    def finish(self):
+        self.file.close()
+        return True
+
+
+# ----- Checkers -----
+class Checker:
+    """How a challenge compares a run's output with a test case's expected output.
+
+    ``matching(expected_file)`` yields the matcher a run streams its stdout
+    into (pass it as ``expected_output``); the run's ``matched`` is then the
+    verdict. Checkers that need the whole output decide in ``check()`` /
+    ``acheck()`` after the run instead. A checker is used for one judging and
+    closed after it.
+    """
+
+    deferred = False
+
+    def __init__(self, tolerance=None):
+        self.tolerance = tolerance
+
+    @contextlib.contextmanager
+    def matching(self, expected_file):
+        yield OutputMatcher(expected_file)
+
+    def check(self, matcher, input_path, answer_path):
+        return True
+
+    async def acheck(self, matcher, input_path, answer_path):
+        return True
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class TokenChecker(Checker):
+    @contextlib.contextmanager
+    def matching(self, expected_file):
+        yield TokenMatcher(expected_file, self.tolerance)
+
+
+class ProgramChecker(Checker):
+    """A checker program written by the challenge's author.
+
+    It is run as ``<checker> <input> <output> <answer>`` with the paths of the
+    test input, the submission's output and the expected output, and accepts
+    by exiting with 0. Exit status 1 or 2 is a wrong answer; anything else,
+    or running out of time, means the checker itself failed.
+    """
+
+    deferred = True
+
+    def __init__(self, program):
+        super().__init__()
+        self.program = program
+
+    @contextlib.contextmanager
+    def matching(self, expected_file):
+        fd, path = tempfile.mkstemp(prefix="output-", dir=self.program.workdir)
+        os.close(fd)
+        spool = OutputSpool(path)
+        try:
+            yield spool
+        finally:
+            spool.file.close()
+            os.unlink(path)
+
+    def _command(self, matcher, input_path, answer_path):
+        return self.program.command + [input_path, matcher.path, answer_path]
+
+    def _verdict(self, result):
+        if result["returncode"] == 0:
+            return True
+        if result["returncode"] in (1, 2):
+            return False
+        raise CheckerError(f"Checker failed with exit status {result['returncode']}: {result['stderr'][:500]}")
+
+    def check(self, matcher, input_path, answer_path):
+        try:
+            result = run_process(self._command(matcher, input_path, answer_path), "", self.program.limits.wall_time,
+                                 cwd=self.program.workdir, limits=self.program.limits)
+        except subprocess.TimeoutExpired:
+            raise CheckerError("Checker timed out.")
+        return self._verdict(result)
+
+    async def acheck(self, matcher, input_path, answer_path):
+        try:
+            result = await arun_process(self._command(matcher, input_path, answer_path), "",
+                                        self.program.limits.wall_time, cwd=self.program.workdir,
+                                        limits=self.program.limits)
+        except subprocess.TimeoutExpired:
+            raise CheckerError("Checker timed out.")
+        return self._verdict(result)
+
+    def close(self):
+        self.program.cleanup()
+
+
+def _simple_checker(challenge):
+    if challenge.checker == CHECKER_WHITESPACE:
+        return TokenChecker()
+    if challenge.checker == CHECKER_FLOAT:
+        tolerance = challenge.checker_tolerance
+        return TokenChecker(DEFAULT_TOLERANCE if tolerance is None else tolerance)
+    return Checker()
+
+
+def _checker_program(program):
+    if program.compile_failed:
+        program.cleanup()
+        raise CheckerError(f"Checker does not compile: {program.compile_result['stderr'][:500]}")
+    return ProgramChecker(program)
+
+
+def build_checker(challenge):
+    """The checker ``challenge`` is configured with, built if it is a program (``CheckerError`` if it won't)."""
+    if challenge.checker != CHECKER_CUSTOM:
+        return _simple_checker(challenge)
+    return _checker_program(compile_program(challenge.checker_code, challenge.checker_language,
+                                            ResourceLimits.for_challenge()))
+
+
+async def abuild_checker(challenge):
+    if challenge.checker != CHECKER_CUSTOM:
+        return _simple_checker(challenge)
+    return _checker_program(await acompile_program(challenge.checker_code, challenge.checker_language,
+                                                   ResourceLimits.for_challenge()))
@@ -0,0 +1,27 @@
+import os
+import stat
+
+from django.conf import settings
+
+
+def data_path(*parts):
+    """``parts`` under ``JUDGE_DATA_DIR``, the judge's private working data on this host."""
+    root = getattr(settings, "JUDGE_DATA_DIR", None) or os.path.join(settings.BASE_DIR, "judge-data")
+    return os.path.join(str(root), *parts)
+
+
+def private_dir(path):
+    """Create ``path`` owner-only (0700) if missing, and make sure nobody else can write into it.
+
+    What the judge keeps here (compiled submissions, runguard, runtime
+    classes) is executed later, so a directory another user could have
+    written into is refused with ``PermissionError`` rather than trusted. One
+    of ours that only we could write to is tightened to 0700.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.geteuid() or info.st_mode & 0o022:
+        raise PermissionError(f"{path} must be a directory of this user that no one else can write to.")
+    if info.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
@@ -0,0 +1,19 @@
+from .runners import get_runner
+
+
+def compile_program(code, language, limits=None, profile=None):
+    """Write ``code`` to an empty work directory and build it once.
+
+    ``language`` is looked up in the ``JUDGE_LANGUAGES`` runner registry
+    (``UnsupportedLanguage`` if it isn't there). The caller owns the returned
+    program and must ``cleanup()`` it (or use it as a context manager).
+    Compile errors do not raise; check ``program.compile_failed``. Runs are
+    held to ``limits`` (a ``ResourceLimits``), the configured defaults when
+    omitted. ``profile`` names the language's compile profile to build with.
+    """
+    return get_runner(language).build(code, limits, profile)
+
+
+async def acompile_program(code, language, limits=None, profile=None):
+    """``compile_program`` for the event loop: the compiler is awaited rather than waited on."""
+    return await get_runner(language).abuild(code, limits, profile)
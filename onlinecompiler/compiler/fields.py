@@ -0,0 +1,65 @@
+import gzip
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+
+try:
+    import zstandard
+except ImportError:  # Optional; only needed for JUDGE_OUTPUT_COMPRESSION = "zstd"
+    zstandard = None
+
+# Neither can start valid UTF-8, so compressed values need no extra tag
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def _compress(data):
+    method = getattr(settings, "JUDGE_OUTPUT_COMPRESSION", "gzip")
+    if method == "gzip":
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if method == "zstd":
+        if zstandard is None:
+            raise ImproperlyConfigured('JUDGE_OUTPUT_COMPRESSION = "zstd" needs the zstandard package.')
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def _decompress(data):
+    if data.startswith(GZIP_MAGIC):
+        return gzip.decompress(data)
+    if data.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise ImproperlyConfigured("Reading zstd-compressed output needs the zstandard package.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+class CompressedTextField(models.TextField):
+    """Text stored as bytes, compressed once it reaches ``JUDGE_OUTPUT_COMPRESS_MIN_BYTES``.
+
+    Reads and writes plain ``str`` like a ``TextField``; only the column is
+    binary. Values are compressed with ``JUDGE_OUTPUT_COMPRESSION`` ("gzip",
+    "zstd" or "none") and kept as plain UTF-8 when that doesn't make them
+    smaller. Anything already stored is readable whatever the setting says now.
+    The column can't be searched with text lookups.
+    """
+
+    def get_internal_type(self):
+        return "BinaryField"
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is None:
+            return None
+        data = value.encode()
+        if len(data) >= getattr(settings, "JUDGE_OUTPUT_COMPRESS_MIN_BYTES", 1024):
+            packed = _compress(data)
+            if len(packed) < len(data):
+                data = packed
+        return connection.Database.Binary(data)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(value, str):
+            return value
+        return _decompress(bytes(value)).decode(errors="replace")
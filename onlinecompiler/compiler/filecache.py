@@ -0,0 +1,26 @@
+import os
+
+from django.core.cache.backends.filebased import FileBasedCache
+
+from .datadir import private_dir
+
+
+class PrivateFileBasedCache(FileBasedCache):
+    """Django's file-based cache, in a directory only this user can write to.
+
+    Entries are unpickled when read, and the verdicts, challenge responses and
+    leaderboard kept here are served as they are, so a directory another user
+    could write to is refused with ``PermissionError`` (see
+    ``datadir.private_dir``) rather than read from. A directory that already
+    exists is checked when the cache is set up; a missing one is only created
+    by the first write.
+    """
+
+    def __init__(self, dir, params):
+        self._set_up = False
+        super().__init__(dir, params)
+        self._set_up = True
+
+    def _createdir(self):
+        if self._set_up or os.path.lexists(self._dir):
+            private_dir(self._dir)
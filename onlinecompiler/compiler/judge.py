@@ -0,0 +1,524 @@
+import asyncio
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from rest_framework import status
+
+from .blobs import get_blob_store
+from .capture import output_keep
+from .checkers import Checker, CheckerError, abuild_checker, build_checker
+from .execution import acompile_program, compile_program
+from .limits import EXCEEDED_CPU_TIME, EXCEEDED_DISK_QUOTA, EXCEEDED_FILE_SIZE, EXCEEDED_MEMORY, ResourceLimits
+from .leaderboard import update_ranking
+from .models import Submission, ChallengeSolution
+from .runners import UnsupportedLanguage, get_runner
+from .serializers import SubmissionSerializer, ChallengeSolutionSerializer
+from .stats import bump_user_stats
+from .metrics import record_judgement
+from .timing import phase, record_phases
+from .verdicts import alookup_verdict, aremember_verdict, lookup_verdict, remember_verdict, verdict_key
+
+# Shared by the request views and the queue workers. Each function returns
+# ``(payload, http_status)`` so either side can hand the result straight back.
+# ``progress``, when given, is called with an event dict as each step finishes
+# (the build, then every test case in the order they complete). The ``a``-prefixed
+# coroutines do the same for the async views; only their bookkeeping goes to a thread.
+
+# Verdict reported in the metrics for a run stopped by a limit
+LIMIT_VERDICTS = {
+    EXCEEDED_CPU_TIME: "time_limit_exceeded",
+    EXCEEDED_FILE_SIZE: "file_size_limit_exceeded",
+    EXCEEDED_DISK_QUOTA: "disk_quota_exceeded",
+    EXCEEDED_MEMORY: "memory_limit_exceeded",
+}
+
+
+def _language_label(language):
+    # Metric labels must come from a fixed set, not from whatever the client sent
+    try:
+        return get_runner(language).name
+    except UnsupportedLanguage:
+        return "unsupported"
+
+
+def _run_verdict(result):
+    """How a single run ended, as a verdict for the metrics."""
+    if result.get("limit_exceeded"):
+        return LIMIT_VERDICTS[result["limit_exceeded"]]
+    if result.get("output_limit_exceeded"):
+        return "output_limit_exceeded"
+    if result.get("returncode"):
+        return "runtime_error"
+    return "ok"
+
+
+def _compile_error(program):
+    return program.compile_result["stderr"] if program.compile_failed else None
+
+
+def _compile_event(compile_error):
+    event = {"event": "compile", "ok": compile_error is None}
+    if compile_error is not None:
+        event["stderr"] = compile_error
+    return event
+
+
+def _case_event(index, outcome):
+    # Sent to the submitter as it happens, so only what the final result shows everyone
+    event = {"event": "test_case", "test_case": index + 1, "passed": outcome["passed"]}
+    if "error" in outcome:
+        event["error"] = outcome["error"]
+    else:
+        event["usage"] = outcome["usage"]
+    if "limit_exceeded" in outcome:
+        event["limit_exceeded"] = outcome["limit_exceeded"]
+    return event
+
+
+# ----- Compile -----
+def judge_compile(user, code, language, user_input, progress=None):
+    started = time.perf_counter()
+    with record_phases() as phases:
+        payload, http_status, verdict = _judge_compile(user, code, language, user_input, progress)
+    record_judgement("compile", _language_label(language), verdict, time.perf_counter() - started, phases,
+                     submission=payload.get("submission", {}).get("id"))
+    return payload, http_status
+
+
+def _judge_compile(user, code, language, user_input, progress=None):
+    try:
+        with compile_program(code, language) as program:
+            if progress is not None:
+                progress(_compile_event(_compile_error(program)))
+            if program.compile_failed:
+                result_data, verdict = program.compile_result, "compile_error"
+            else:
+                with phase("run"):
+                    result_data = program.run(user_input)
+                verdict = _run_verdict(result_data)
+    except Exception as e:
+        return _compile_failure(e, language)
+    return _save_submission(user, code, language, user_input, result_data, verdict)
+
+
+async def ajudge_compile(user, code, language, user_input):
+    started = time.perf_counter()
+    with record_phases() as phases:
+        payload, http_status, verdict = await _ajudge_compile(user, code, language, user_input)
+    await sync_to_async(record_judgement)("compile", _language_label(language), verdict,
+                                          time.perf_counter() - started, phases,
+                                          submission=payload.get("submission", {}).get("id"))
+    return payload, http_status
+
+
+async def _ajudge_compile(user, code, language, user_input):
+    try:
+        with await acompile_program(code, language) as program:
+            if program.compile_failed:
+                result_data, verdict = program.compile_result, "compile_error"
+            else:
+                with phase("run"):
+                    result_data = await program.arun(user_input)
+                verdict = _run_verdict(result_data)
+    except Exception as e:
+        return _compile_failure(e, language)
+    return await sync_to_async(_save_submission)(user, code, language, user_input, result_data, verdict)
+
+
+def _compile_failure(e, language):
+    if isinstance(e, UnsupportedLanguage):
+        return {"error": "Unsupported language."}, status.HTTP_400_BAD_REQUEST, "unsupported_language"
+    if isinstance(e, subprocess.TimeoutExpired):
+        return ({"error": f"{language.capitalize()} code execution timed out."},
+                status.HTTP_408_REQUEST_TIMEOUT, "timeout")
+    return {"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR, "error"
+
+
+def _save_submission(user, code, language, user_input, result_data, verdict):
+    usage = result_data.get("usage", {})
+    with phase("db"), transaction.atomic():
+        submission = Submission.objects.create(
+            user=user,
+            language=language,
+            code=code,
+            stdin=user_input,
+            stdout=result_data.get("stdout", ""),
+            stderr=result_data.get("stderr", ""),
+            returncode=result_data.get("returncode", 0),
+            cpu_time=usage.get("cpu_time"),
+            wall_time=usage.get("wall_time"),
+            peak_memory_kb=usage.get("peak_memory_kb")
+        )
+        bump_user_stats(user, programs_executed=1)
+
+    submission_data = SubmissionSerializer(submission).data
+    return {"result": result_data, "submission": submission_data}, status.HTTP_200_OK, verdict
+
+
+# ----- Solve -----
+def run_test_case(program, input_data, expected_output=None):
+    try:
+        result_data = program.run(input_data, expected_output)
+        result_data["stdout"] = result_data["stdout"].strip()
+    except Exception as e:
+        result_data = _failed_run(program, e)
+
+    return result_data
+
+
+async def arun_test_case(program, input_data, expected_output=None):
+    try:
+        result_data = await program.arun(input_data, expected_output)
+        result_data["stdout"] = result_data["stdout"].strip()
+    except Exception as e:
+        result_data = _failed_run(program, e)
+
+    return result_data
+
+
+def _failed_run(program, e):
+    if isinstance(e, subprocess.TimeoutExpired):
+        return {"error": f"{program.language.capitalize()} code execution timed out.", "timed_out": True}
+    return {"error": str(e)}
+
+
+def judge_test_case(program, test_case, checker=None):
+    # The input file becomes the program's stdin and the expected output is
+    # read alongside its stdout by the checker's matcher, so neither is loaded
+    # into memory; a wrong answer is cut off at the first byte that can't match.
+    # A checker that fails raises CheckerError: that's the challenge's fault
+    checker = checker or Checker()
+    store = get_blob_store()
+    with store.open(test_case.input_blob) as input_file, store.open(test_case.output_blob) as expected_file, \
+            checker.matching(expected_file) as matcher:
+        result = run_test_case(program, input_file, matcher)
+        if checker.deferred and result.get("matched"):
+            result["matched"] = checker.check(matcher, store.path(test_case.input_blob),
+                                              store.path(test_case.output_blob))
+    return _case_outcome(result)
+
+
+async def ajudge_test_case(program, test_case, checker=None):
+    checker = checker or Checker()
+    store = get_blob_store()
+    with store.open(test_case.input_blob) as input_file, store.open(test_case.output_blob) as expected_file, \
+            checker.matching(expected_file) as matcher:
+        result = await arun_test_case(program, input_file, matcher)
+        if checker.deferred and result.get("matched"):
+            result["matched"] = await checker.acheck(matcher, store.path(test_case.input_blob),
+                                                     store.path(test_case.output_blob))
+    return _case_outcome(result)
+
+
+def _case_outcome(result):
+    if "error" in result:
+        return {"passed": False, "error": result["error"], "timed_out": result.get("timed_out", False)}
+
+    actual_output = result.get("stdout", "").strip()
+    outcome = {
+        "passed": result["matched"],
+        "actual_output": actual_output,
+        "usage": result.get("usage")
+    }
+    if "limit_exceeded" in result:
+        outcome["limit_exceeded"] = result["limit_exceeded"]
+    return outcome
+
+
+def worst_usage(outcomes):
+    """Per-field maximum of the ``usage`` of every case that ran; ``None`` fields stay out."""
+    worst = {"cpu_time": None, "wall_time": None, "peak_memory_kb": None}
+    for outcome in outcomes:
+        for field, value in ((outcome or {}).get("usage") or {}).items():
+            if value is not None and (worst[field] is None or value > worst[field]):
+                worst[field] = value
+    return worst
+
+
+def _stops_judging(outcome):
+    return "error" in outcome or (getattr(settings, "JUDGE_FAIL_FAST", False) and not outcome["passed"])
+
+
+def run_test_cases(program, test_cases, workers=None, on_outcome=None, checker=None):
+    """Judge ``test_cases`` concurrently with ``checker``; return their outcomes in test-case order.
+
+    At most ``workers`` (default ``JUDGE_TEST_WORKERS``) cases run at once. The runs themselves happen
+    in child processes, so threads are enough to keep every core busy. A case
+    that errors (e.g. times out) stops judging, as does any failure when
+    ``JUDGE_FAIL_FAST`` is on: cases already running finish and are reported,
+    and those not started yet come back as ``None``. An exception (a
+    ``CheckerError``) stops judging too, then propagates.
+    ``on_outcome(index, outcome)`` is called on this thread as each case finishes.
+    """
+    if workers is None:
+        workers = getattr(settings, "JUDGE_TEST_WORKERS", 1)
+    workers = max(1, min(workers, len(test_cases)))
+    outcomes = [None] * len(test_cases)
+    # Set by the case that stops judging, so no case starts after it
+    stop = threading.Event()
+
+    def judge(test_case):
+        if stop.is_set():
+            return None
+        outcome = judge_test_case(program, test_case, checker)
+        if _stops_judging(outcome):
+            stop.set()
+        return outcome
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(judge, test_case): i for i, test_case in enumerate(test_cases)}
+        try:
+            for future in as_completed(futures):
+                outcome = future.result()
+                outcomes[futures[future]] = outcome
+                if outcome is not None and on_outcome is not None:
+                    on_outcome(futures[future], outcome)
+        finally:
+            stop.set()
+            for pending in futures:
+                pending.cancel()
+
+    return outcomes
+
+
+async def arun_test_cases(program, test_cases, workers=None, checker=None):
+    """``run_test_cases`` on the event loop, with a task per case instead of a thread.
+
+    The same ``workers`` bound and stopping apply. Across submissions,
+    ``capture.run_slots()`` caps how many programs execute at once. If the
+    judging is cancelled, or a case raises, the cases still running are
+    cancelled and their children killed.
+    """
+    if workers is None:
+        workers = getattr(settings, "JUDGE_TEST_WORKERS", 1)
+    limit = asyncio.Semaphore(max(1, workers))
+    outcomes = [None] * len(test_cases)
+    stopped = False
+
+    async def judge(test_case):
+        nonlocal stopped
+        async with limit:
+            if stopped:
+                return None
+            outcome = await ajudge_test_case(program, test_case, checker)
+            if _stops_judging(outcome):
+                stopped = True
+            return outcome
+
+    tasks = {asyncio.ensure_future(judge(test_case)): i for i, test_case in enumerate(test_cases)}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                outcomes[tasks[task]] = task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+    return outcomes
+
+
+def _preview(digest):
+    return get_blob_store().read_text(digest, output_keep())
+
+
+def _solution_verdict(all_passed, outcomes):
+    if all_passed:
+        return "accepted"
+    for outcome in outcomes:
+        if outcome is not None and outcome.get("limit_exceeded"):
+            return LIMIT_VERDICTS[outcome["limit_exceeded"]]
+    return "wrong_answer"
+
+
+def judge_solution(user, challenge, code, language, progress=None):
+    started = time.perf_counter()
+    with record_phases() as phases:
+        payload, http_status, verdict = _judge_solution(user, challenge, code, language, progress)
+    record_judgement("solve", _language_label(language), verdict, time.perf_counter() - started, phases,
+                     solution=payload.get("solution", {}).get("id"), challenge=challenge.pk)
+    return payload, http_status
+
+
+def _judge_solution(user, challenge, code, language, progress=None):
+    test_cases = list(challenge.cases.all())
+
+    if not test_cases:
+        return _no_test_cases()
+
+    # The same code judged against the same tests and limits before
+    limits = ResourceLimits.for_challenge(challenge)
+    key = verdict_key(challenge, test_cases, code, language, limits)
+    memo = lookup_verdict(key)
+    if memo is not None:
+        compile_error, outcomes = memo
+        if progress is not None:
+            progress(_compile_event(compile_error))
+            for i, outcome in enumerate(outcomes):
+                if outcome is not None:
+                    progress(_case_event(i, outcome))
+        return _save_solution(user, challenge, code, language, compile_error, test_cases, outcomes)
+
+    # Build once, then run every test case against the same artifact
+    try:
+        program = compile_program(code, language, limits, challenge.compile_profile)
+    except Exception as e:
+        return _build_failure(e)
+
+    outcomes = []
+    with program:
+        compile_error = _compile_error(program)
+        if progress is not None:
+            progress(_compile_event(compile_error))
+        if compile_error is None:
+            on_outcome = None
+            if progress is not None:
+                def on_outcome(i, outcome):
+                    progress(_case_event(i, outcome))
+            try:
+                with build_checker(challenge) as checker, phase("run"):
+                    outcomes = run_test_cases(program, test_cases, on_outcome=on_outcome, checker=checker)
+            except CheckerError as e:
+                return _checker_failure(e)
+
+    remember_verdict(key, compile_error, outcomes)
+    return _save_solution(user, challenge, code, language, compile_error, test_cases, outcomes)
+
+
+async def ajudge_solution(user, challenge, code, language):
+    started = time.perf_counter()
+    with record_phases() as phases:
+        payload, http_status, verdict = await _ajudge_solution(user, challenge, code, language)
+    await sync_to_async(record_judgement)("solve", _language_label(language), verdict,
+                                          time.perf_counter() - started, phases,
+                                          solution=payload.get("solution", {}).get("id"), challenge=challenge.pk)
+    return payload, http_status
+
+
+async def _ajudge_solution(user, challenge, code, language):
+    test_cases = [test_case async for test_case in challenge.cases.all()]
+
+    if not test_cases:
+        return _no_test_cases()
+
+    limits = ResourceLimits.for_challenge(challenge)
+    key = verdict_key(challenge, test_cases, code, language, limits)
+    memo = await alookup_verdict(key)
+    if memo is not None:
+        compile_error, outcomes = memo
+        return await sync_to_async(_save_solution)(user, challenge, code, language, compile_error, test_cases,
+                                                   outcomes)
+
+    try:
+        program = await acompile_program(code, language, limits, challenge.compile_profile)
+    except Exception as e:
+        return _build_failure(e)
+
+    outcomes = []
+    with program:
+        compile_error = _compile_error(program)
+        if compile_error is None:
+            try:
+                with await abuild_checker(challenge) as checker, phase("run"):
+                    outcomes = await arun_test_cases(program, test_cases, checker=checker)
+            except CheckerError as e:
+                return _checker_failure(e)
+
+    await aremember_verdict(key, compile_error, outcomes)
+    return await sync_to_async(_save_solution)(user, challenge, code, language, compile_error, test_cases, outcomes)
+
+
+def _no_test_cases():
+    return {"error": "No test cases available for this challenge."}, status.HTTP_400_BAD_REQUEST, "error"
+
+
+def _checker_failure(e):
+    # The challenge is broken, not the submission
+    return {"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR, "error"
+
+
+def _build_failure(e):
+    if isinstance(e, UnsupportedLanguage):
+        return {"error": "Unsupported language."}, status.HTTP_400_BAD_REQUEST, "unsupported_language"
+    return {"error": str(e)}, status.HTTP_400_BAD_REQUEST, "error"
+
+
+def _save_solution(user, challenge, code, language, compile_error, test_cases, outcomes):
+    """Turn the outcomes into the response and record the solution and the user's stats."""
+    all_passed = True
+    test_results = []
+
+    if compile_error is not None:
+        all_passed = False
+        test_results = [{"test_case": i + 1, "passed": False} for i in range(len(test_cases))]
+    else:
+        for i, (test_case, outcome) in enumerate(zip(test_cases, outcomes)):
+            if outcome is None:
+                # Cancelled by fail-fast before it ran
+                all_passed = False
+                test_results.append({"test_case": i + 1, "passed": False, "skipped": True})
+                continue
+
+            if "error" in outcome:
+                verdict = "timeout" if outcome["timed_out"] else "error"
+                return {"error": outcome["error"]}, status.HTTP_400_BAD_REQUEST, verdict
+
+            test_passed = outcome["passed"]
+            if not test_passed:
+                all_passed = False
+
+            if i == 0 or user.is_superuser:
+                test_result = {
+                    "test_case": i + 1,
+                    "passed": test_passed,
+                    "input": _preview(test_case.input_blob),
+                    "expected_output": _preview(test_case.output_blob).strip(),
+                    "actual_output": outcome["actual_output"]
+                }
+            else:
+                test_result = {"test_case": i + 1, "passed": test_passed}
+            test_result["usage"] = outcome["usage"]
+            if "limit_exceeded" in outcome:
+                test_result["limit_exceeded"] = outcome["limit_exceeded"]
+            test_results.append(test_result)
+
+    # Only the bookkeeping needs a transaction, not the runs
+    with phase("db"), transaction.atomic():
+        was_correct = (ChallengeSolution.objects.select_for_update()
+                       .filter(user=user, challenge=challenge, is_correct=True).exists())
+        solution, created = ChallengeSolution.objects.update_or_create(
+            user=user,
+            challenge=challenge,
+            defaults={"code": code, "language": language, "is_correct": all_passed, **worst_usage(outcomes)}
+        )
+
+        points = 1 if all_passed and created else 0
+        bump_user_stats(
+            user,
+            points=points,
+            challenges_completed=int(all_passed) - int(was_correct)
+        )
+        if points:
+            update_ranking(user.pk)
+
+    solution_data = ChallengeSolutionSerializer(solution).data
+
+    response_data = {
+        "solution": solution_data,
+        "all_tests_passed": all_passed,
+        "test_results": test_results
+    }
+    if compile_error is not None:
+        response_data["compile_error"] = compile_error
+        verdict = "compile_error"
+    else:
+        verdict = _solution_verdict(all_passed, outcomes)
+    return response_data, status.HTTP_200_OK, verdict
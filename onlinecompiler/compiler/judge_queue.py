@@ -0,0 +1,264 @@
+import contextlib
+import logging
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from rest_framework import status
+
+from .admission import Overloaded, retry_after
+from .judge import judge_compile, judge_solution
+from .models import CodingChallenge, JudgeJob
+from .rejudge import rejudge_challenges
+
+logger = logging.getLogger(__name__)
+
+# How many of the oldest queued jobs a worker chooses the next one from
+CLAIM_WINDOW = 200
+
+
+def wants_async(data):
+    """Whether a submission (its request body) should be queued instead of judged in the request."""
+    value = data.get("async", getattr(settings, "JUDGE_ASYNC_DEFAULT", False))
+    if isinstance(value, str):
+        return value.lower() in ("1", "true", "yes")
+    return bool(value)
+
+
+def check_queue_quota(user):
+    """Raise ``Overloaded`` if ``user`` already has ``JUDGE_MAX_QUEUED_PER_USER`` jobs queued or running.
+
+    Call it in the transaction that queues the job: it locks the user's row
+    until that commits, so two submissions of one user can't both take the
+    last place. (SQLite, with ``transaction_mode`` IMMEDIATE, has already
+    locked the whole database when the transaction began.)
+    """
+    quota = getattr(settings, "JUDGE_MAX_QUEUED_PER_USER", 0)
+    if not quota:
+        return
+    User.objects.select_for_update().only("pk").get(pk=user.pk)
+    pending = JudgeJob.objects.filter(user=user, status__in=[JudgeJob.STATUS_QUEUED, JudgeJob.STATUS_RUNNING])
+    if pending.count() < quota:
+        return
+    oldest = pending.filter(status=JudgeJob.STATUS_QUEUED).order_by("id").values_list("id", flat=True).first()
+    if oldest is None:
+        position = 0  # All of them are running already
+    else:
+        position = JudgeJob.objects.filter(status=JudgeJob.STATUS_QUEUED, id__lte=oldest).count()
+    raise Overloaded("You have too many submissions queued; wait for them to finish.",
+                     retry_after(position + 1, getattr(settings, "JUDGE_WORKERS", 2)), position or None)
+
+
+def enqueue_job(user, kind, code, language, stdin="", challenge=None):
+    """Queue a job; compile and solve jobs first count against the user's quota (``check_queue_quota``)."""
+    with transaction.atomic():
+        if kind != JudgeJob.KIND_REJUDGE:
+            check_queue_quota(user)
+        return JudgeJob.objects.create(
+            user=user,
+            kind=kind,
+            challenge=challenge,
+            language=language,
+            code=code,
+            stdin=stdin
+        )
+
+
+def queue_depth():
+    """Number of queued and running jobs, by status."""
+    depth = dict.fromkeys((JudgeJob.STATUS_QUEUED, JudgeJob.STATUS_RUNNING), 0)
+    rows = (JudgeJob.objects.filter(status__in=list(depth)).order_by()
+            .values("status").annotate(n=Count("pk")).values_list("status", "n"))
+    depth.update(rows)
+    return depth
+
+
+# ----- Worker side -----
+def claim_next_job(worker_name):
+    """Atomically move the next queued job to ``running`` and return it.
+
+    The next job is the oldest of a user with the fewest jobs running, so one
+    user's pile of submissions takes turns with everyone else's instead of
+    holding every worker. The conditional UPDATE is the lock: if another
+    worker claimed the same row first it matches zero rows and we simply try
+    the next one. This works the same on SQLite and PostgreSQL and needs no
+    broker.
+    """
+    while True:
+        queued = list(JudgeJob.objects
+                      .filter(status=JudgeJob.STATUS_QUEUED)
+                      .order_by("id")
+                      .values_list("id", "user_id")[:CLAIM_WINDOW])
+        if not queued:
+            return None
+        running = Counter(JudgeJob.objects.filter(status=JudgeJob.STATUS_RUNNING).values_list("user_id", flat=True))
+        job_id, _ = min(queued, key=lambda job: running[job[1]])
+        now = timezone.now()
+        claimed = JudgeJob.objects.filter(pk=job_id, status=JudgeJob.STATUS_QUEUED).update(
+            status=JudgeJob.STATUS_RUNNING,
+            worker=worker_name,
+            started_at=now,
+            heartbeat_at=now,
+            events=[]  # Left over if a dead worker's job was requeued
+        )
+        if claimed:
+            return JudgeJob.objects.select_related("user").get(pk=job_id)
+
+
+def _held(job):
+    """``job``'s row while its worker still holds it; empty once it was requeued."""
+    return JudgeJob.objects.filter(pk=job.pk, status=JudgeJob.STATUS_RUNNING, worker=job.worker)
+
+
+def _holder(job):
+    """Who has ``job`` now, according to the database, for logging."""
+    row = JudgeJob.objects.filter(pk=job.pk).values_list("status", "worker").first()
+    if row is None:
+        return "nobody (it was deleted)"
+    state, worker = row
+    if state == JudgeJob.STATUS_RUNNING:
+        return worker or "an unnamed worker"
+    return f"nobody (it is {state})"
+
+
+@contextlib.contextmanager
+def lease(job, interval=None):
+    """Keep ``job`` for the ``with`` block by refreshing its ``heartbeat_at`` every ``interval`` seconds.
+
+    A thread does the refreshing, so it goes on while the judging blocks.
+    ``requeue_stale_jobs`` only takes back jobs whose heartbeat stopped: a
+    judging keeps its job however long it runs, and the job of a worker that
+    died is back in the queue soon after.
+    """
+    if interval is None:
+        interval = getattr(settings, "JUDGE_QUEUE_HEARTBEAT_INTERVAL", 10)
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                try:
+                    if not _held(job).update(heartbeat_at=timezone.now()):
+                        logger.warning("Judge job %s was taken from %s while it judged it; now held by %s",
+                                       job.pk, job.worker or "this worker", _holder(job))
+                        return
+                except DatabaseError:
+                    logger.exception("Refreshing the heartbeat of judge job %s failed", job.pk)
+        finally:
+            # The thread's own connection
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f"judge-job-{job.pk}-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def publish_progress(job, interval=None):
+    """A ``progress`` callback that appends each event to ``job.events`` for clients streaming the job.
+
+    The row is written at most once per ``interval`` seconds
+    (``JUDGE_EVENTS_PUBLISH_INTERVAL``), with every event since the last
+    write; events that come quicker wait for the next one, and
+    ``process_job`` stores whatever is left with the result.
+    """
+    if interval is None:
+        interval = getattr(settings, "JUDGE_EVENTS_PUBLISH_INTERVAL", 0.25)
+    written_at = None
+
+    def progress(event):
+        nonlocal written_at
+        job.events.append(event)
+        now = time.monotonic()
+        if written_at is None or now - written_at >= interval:
+            written_at = now
+            _held(job).update(events=job.events)
+    return progress
+
+
+def process_job(job):
+    """Judge a claimed ``job`` and store its result, unless it was requeued meanwhile (see ``lease``)."""
+    with lease(job):
+        payload, http_status = _judge(job)
+    job.result = payload
+    job.http_status = http_status
+    job.finished_at = timezone.now()
+    stored = _held(job).update(status=job.status, events=job.events, result=payload, http_status=http_status,
+                               finished_at=job.finished_at)
+    if not stored:
+        # Another worker has it now and will store its own result
+        logger.warning("Dropped the result of judge job %s: %s no longer holds it; now held by %s",
+                       job.pk, job.worker or "this worker", _holder(job))
+    return job
+
+
+def _judge(job):
+    progress = publish_progress(job)
+    try:
+        if job.kind == JudgeJob.KIND_COMPILE:
+            payload, http_status = judge_compile(job.user, job.code, job.language, job.stdin or "", progress)
+        elif job.kind == JudgeJob.KIND_REJUDGE:
+            payload, http_status = process_rejudge(job), status.HTTP_200_OK
+        else:
+            try:
+                challenge = CodingChallenge.objects.get(pk=job.challenge_id, is_active=True)
+            except CodingChallenge.DoesNotExist:
+                payload, http_status = {"error": "Challenge not found or inactive."}, status.HTTP_404_NOT_FOUND
+            else:
+                payload, http_status = judge_solution(job.user, challenge, job.code, job.language, progress)
+        job.status = JudgeJob.STATUS_DONE
+    except Exception as e:
+        logger.exception("Judge job %s failed", job.pk)
+        payload, http_status = {"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR
+        job.status = JudgeJob.STATUS_FAILED
+    return payload, http_status
+
+
+def process_rejudge(job):
+    """Re-judge the job's challenge, publishing progress in ``job.result`` as it goes."""
+    challenge = CodingChallenge.objects.get(pk=job.challenge_id)
+
+    def progress(report):
+        _held(job).update(result=report)
+
+    return rejudge_challenges([challenge], progress=progress)
+
+
+def requeue_stale_jobs(max_age):
+    """Put back running jobs whose worker died: no heartbeat (see ``lease``) for ``max_age`` seconds."""
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    stale = Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    return JudgeJob.objects.filter(stale, status=JudgeJob.STATUS_RUNNING).update(
+        status=JudgeJob.STATUS_QUEUED,
+        worker="",
+        started_at=None,
+        heartbeat_at=None
+    )
+
+
+def run_worker(stop_event, poll_interval=None):
+    """Drain the queue until ``stop_event`` is set; sleeps ``poll_interval`` when idle."""
+    if poll_interval is None:
+        poll_interval = getattr(settings, "JUDGE_QUEUE_POLL_INTERVAL", 0.5)
+    worker_name = f"{socket.gethostname()}:{os.getpid()}"
+
+    while not stop_event.is_set():
+        close_old_connections()
+        job = claim_next_job(worker_name)
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+        started = time.monotonic()
+        process_job(job)
+        logger.info("Judged %s job %s in %.3fs", job.kind, job.pk, time.monotonic() - started)
@@ -0,0 +1,161 @@
+import bisect
+import contextlib
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+from . import metrics
+from .models import UserProfile
+
+RANKING_CACHE_KEY = "leaderboard:ranking"
+
+# Held while the cached ranking is rebuilt or changed, so no writer undoes another
+LOCK_KEY = "leaderboard:lock"
+LOCK_SECONDS = 10  # Outlives a writer that died holding it
+LOCK_WAIT = 1
+
+
+# ----- Ranking -----
+def build_ranking():
+    """Every profile, best first, as ``{"order": [(user_id, points, rank)], "index": {user_id: position}}``.
+
+    Ties share a rank and the next rank skips accordingly (1, 2, 2, 4).
+    """
+    order = list(UserProfile.objects.order_by("-points", "user_id").values_list("user_id", "points"))
+    index = {}
+    _rerank(order, index, 0, len(order) - 1)
+    return {"order": order, "index": index}
+
+
+def _rerank(order, index, start, stop):
+    """Recompute rank and index of ``order[start:stop + 1]``, widened to whole ties on both ends.
+
+    Entries past the tie at ``stop`` keep their position, so they keep their rank too.
+    """
+    while 0 < start < len(order) and order[start - 1][1] == order[start][1]:
+        start -= 1
+    rank = start + 1
+    for position in range(start, len(order)):
+        user_id, points = order[position][:2]
+        if position > start and points != order[position - 1][1]:
+            if position > stop:
+                break
+            rank = position + 1
+        order[position] = (user_id, points, rank)
+        index[user_id] = position
+
+
+def _move(ranking, user_id, points):
+    """Put ``user_id`` where ``points`` ranks them (``None``: take them out), re-ranking only who moved."""
+    order, index = ranking["order"], ranking["index"]
+    old = index.pop(user_id, None)
+    if old is not None:
+        del order[old]
+    elif points is None:
+        return
+    if points is None:
+        new = old
+    else:
+        new = bisect.bisect_left(order, (-points, user_id), key=lambda entry: (-entry[1], entry[0]))
+        order.insert(new, (user_id, points, None))
+    # Everyone between the old and the new position shifted by one; a newcomer or leaver shifts everyone after
+    start = new if old is None else min(old, new)
+    stop = len(order) - 1 if old is None or points is None else max(old, new)
+    _rerank(order, index, start, stop)
+
+
+def _timeout():
+    return getattr(settings, "LEADERBOARD_CACHE_SECONDS", 300)
+
+
+@contextlib.contextmanager
+def _writing(wait):
+    """Hold the ranking's write lock; yields whether it was taken within ``wait`` seconds."""
+    deadline = time.monotonic() + wait
+    while not cache.add(LOCK_KEY, True, timeout=LOCK_SECONDS):
+        if time.monotonic() >= deadline:
+            yield False
+            return
+        time.sleep(0.01)
+    try:
+        yield True
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def get_ranking():
+    ranking = cache.get(RANKING_CACHE_KEY)
+    if ranking is not None:
+        metrics.inc("judge_cache_requests_total", cache="ranking", result="hit")
+        return ranking
+    metrics.inc("judge_cache_requests_total", cache="ranking", result="miss")
+    # While another writer holds the lock, its change may not be in what we read: don't cache it
+    with _writing(0) as locked:
+        ranking = build_ranking()
+        if locked:
+            cache.set(RANKING_CACHE_KEY, ranking, timeout=_timeout())
+    return ranking
+
+
+def update_ranking(user_id):
+    """Move ``user_id`` to where their points put them in the cached ranking, once the transaction commits.
+
+    Call it after their points change, they sign up or they are deleted.
+    Only the entries between their old and new place are touched; a ranking
+    that isn't cached is left to be built when next needed.
+    """
+    transaction.on_commit(lambda: _update(user_id))
+
+
+def _update(user_id):
+    with _writing(LOCK_WAIT) as locked:
+        if not locked:
+            # Can't change it safely; LEADERBOARD_CACHE_SECONDS bounds what a writer holding it may still undo
+            cache.delete(RANKING_CACHE_KEY)
+            return
+        ranking = cache.get(RANKING_CACHE_KEY)
+        if ranking is None:
+            return
+        points = UserProfile.objects.filter(user_id=user_id).values_list("points", flat=True).first()
+        _move(ranking, user_id, points)
+        cache.set(RANKING_CACHE_KEY, ranking, timeout=_timeout())
+
+
+def invalidate_ranking():
+    """Drop the cached ranking once the current transaction (if any) commits; for changes to many users."""
+    def drop():
+        with _writing(LOCK_WAIT):
+            cache.delete(RANKING_CACHE_KEY)
+    transaction.on_commit(drop)
+
+
+def rank_of(user, ranking=None):
+    """``user``'s ``{"rank", "points"}`` in ``ranking`` (default: ``get_ranking()``), or ``None`` if unranked."""
+    if ranking is None:
+        ranking = get_ranking()
+    position = ranking["index"].get(user.pk)
+    if position is None:
+        return None
+    _, points, rank = ranking["order"][position]
+    return {"rank": rank, "points": points}
+
+
+# ----- Rows -----
+def load_entries(entries):
+    """Users with stats for a slice of ``get_ranking()["order"]``, in the same order.
+
+    Each user gets ``rank`` and ``ranked_points`` attributes from the ranking.
+    """
+    # Stats are denormalized onto the profile, so one joined query covers the page
+    users = User.objects.select_related("profile").in_bulk([user_id for user_id, _, _ in entries])
+    page = []
+    for user_id, points, rank in entries:
+        user = users.get(user_id)
+        if user is not None:
+            user.rank = rank
+            user.ranked_points = points
+            page.append(user)
+    return page
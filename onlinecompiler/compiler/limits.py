@@ -0,0 +1,152 @@
+import math
+import os
+import signal
+import subprocess
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+
+from .artifacts import toolchain_version
+from .datadir import data_path, private_dir
+
+GUARD_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runguard.c")
+
+# Why a run that finished on its own still counts as over its limits
+EXCEEDED_CPU_TIME = "cpu_time"
+EXCEEDED_FILE_SIZE = "file_size"
+EXCEEDED_DISK_QUOTA = "disk_quota"
+EXCEEDED_MEMORY = "memory"  # Only where running out of memory can be told from a crash (warm JVMs)
+
+
+# ----- Limits -----
+class ResourceLimits:
+    """What a single run may use. ``None`` means unlimited.
+
+    ``cpu_time`` and ``wall_time`` are in seconds, ``memory`` in MB (enforced
+    as address space, or as the heap size for the JVM, which reserves far more
+    address space than it uses) and ``file_size`` in bytes. ``processes`` caps
+    RLIMIT_NPROC, which counts every process of the judge's user, not just the
+    submission's, so it is off unless configured. ``disk_quota`` (bytes) caps
+    everything in the work directory and is checked after each run.
+    """
+
+    def __init__(self, cpu_time=None, wall_time=None, memory=None, file_size=None, processes=None,
+                 disk_quota=None):
+        self.cpu_time = cpu_time
+        self.wall_time = wall_time
+        self.memory = memory
+        self.file_size = file_size
+        self.processes = processes
+        self.disk_quota = disk_quota
+        self.cap_address_space = True
+
+    @classmethod
+    def for_challenge(cls, challenge=None):
+        """The configured defaults with ``challenge``'s overrides applied."""
+        cpu_time = getattr(settings, "JUDGE_CPU_TIME_LIMIT", 5)
+        memory = getattr(settings, "JUDGE_MEMORY_LIMIT_MB", 256)
+        if challenge is not None:
+            cpu_time = challenge.time_limit or cpu_time
+            memory = challenge.memory_limit or memory
+        wall_time = getattr(settings, "JUDGE_WALL_TIME_LIMIT", 5)
+        if cpu_time:
+            # Leave room for a run to actually spend its CPU budget
+            wall_time = max(wall_time, cpu_time * 2)
+        return cls(
+            cpu_time=cpu_time or None,
+            wall_time=wall_time,
+            memory=memory or None,
+            file_size=getattr(settings, "JUDGE_FILE_SIZE_LIMIT_BYTES", 16 * 1024 * 1024) or None,
+            processes=getattr(settings, "JUDGE_PROCESS_LIMIT", 0) or None,
+            disk_quota=getattr(settings, "JUDGE_WORKDIR_QUOTA_BYTES", 64 * 1024 * 1024) or None,
+        )
+
+    @classmethod
+    def for_compile(cls):
+        """Limits of a compiler run: ``JUDGE_COMPILE_TIMEOUT`` seconds of wall-clock time and the file size cap."""
+        return cls(
+            wall_time=getattr(settings, "JUDGE_COMPILE_TIMEOUT", 30),
+            file_size=getattr(settings, "JUDGE_FILE_SIZE_LIMIT_BYTES", 16 * 1024 * 1024) or None,
+            processes=getattr(settings, "JUDGE_PROCESS_LIMIT", 0) or None,
+        )
+
+    def rlimits(self):
+        """``(name, soft, hard)`` for each setrlimit resource, without the RLIMIT_ prefix."""
+        limits = [("CORE", 0, 0)]
+        if self.cpu_time:
+            # Whole seconds only; SIGXCPU at the soft limit, SIGKILL a second later
+            seconds = math.ceil(self.cpu_time)
+            limits.append(("CPU", seconds, seconds + 1))
+        if self.memory and self.cap_address_space:
+            limits.append(("AS", self.memory * 1024 * 1024, self.memory * 1024 * 1024))
+        if self.file_size:
+            limits.append(("FSIZE", self.file_size, self.file_size))
+        if self.processes:
+            limits.append(("NPROC", self.processes, self.processes))
+        return limits
+
+    def exceeded(self, returncode, usage):
+        """Which limit, if any, a finished run went over."""
+        if returncode == -signal.SIGXFSZ:
+            return EXCEEDED_FILE_SIZE
+        cpu_time = usage.get("cpu_time")
+        if returncode == -signal.SIGXCPU or (self.cpu_time and cpu_time is not None and cpu_time > self.cpu_time):
+            return EXCEEDED_CPU_TIME
+        return None
+
+
+def compile_timeout_result(limits):
+    """The compile result of a compiler stopped at ``limits.wall_time`` (see ``ResourceLimits.for_compile``)."""
+    return {
+        "stdout": "",
+        "stderr": f"Compilation timed out after {limits.wall_time:g} seconds.",
+        "returncode": -signal.SIGKILL,
+        "timed_out": True
+    }
+
+
+def usage_dict(cpu_time=None, wall_time=None, peak_memory_kb=None):
+    return {
+        "cpu_time": None if cpu_time is None else round(cpu_time, 3),
+        "wall_time": None if wall_time is None else round(wall_time, 3),
+        "peak_memory_kb": peak_memory_kb
+    }
+
+
+# ----- Guard -----
+_guard_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def guard_path():
+    """Build ``runguard.c`` once per compiler version and return the binary's path.
+
+    It is kept in the judge's private data directory (``JUDGE_DATA_DIR``),
+    where no other user can swap in a binary of their own.
+    """
+    with _guard_lock:
+        version = toolchain_version("gcc").replace(" ", "_").replace("/", "_")
+        directory = private_dir(data_path("runtimes", version))
+        path = os.path.join(directory, "runguard")
+        if not os.path.exists(path):
+            staging = f"{path}.{os.getpid()}"
+            subprocess.run(["gcc", "-O2", "-o", staging, GUARD_SOURCE], check=True, capture_output=True)
+            os.rename(staging, path)  # Other workers never see a half-written binary
+        return path
+
+
+def guard_command(limits, report_fd, command):
+    """``command`` wrapped in the guard, enforcing ``limits`` and reporting to ``report_fd``."""
+    specs = [f"{name}={soft}:{hard}" for name, soft, hard in limits.rlimits()]
+    return [guard_path(), str(report_fd), *specs, "--", *command]
+
+
+def parse_report(report):
+    """``(returncode, cpu_time, peak_memory_kb)`` from the guard's report line, or ``None``."""
+    try:
+        returncode, cpu_us, peak_kb = report.split()
+        return int(returncode), int(cpu_us) / 1e6, int(peak_kb)
+    except ValueError:
+        # The guard was killed along with the run
+        return None
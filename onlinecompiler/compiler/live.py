@@ -0,0 +1,176 @@
+import asyncio
+import contextlib
+import json
+import logging
+import weakref
+
+from django.conf import settings
+
+from .models import JudgeJob
+
+logger = logging.getLogger(__name__)
+
+# Seconds between keep-alive comments, so proxies don't drop an idle stream
+HEARTBEAT = 15
+
+_FIELDS = ("pk", "status", "events", "result", "http_status")
+
+# What Subscription.next() returns when nothing changed in time
+TIMED_OUT = object()
+
+
+def sse(event, data, event_id=None):
+    """One Server-Sent Events message; ``data`` is sent as JSON."""
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def snapshot(job):
+    return {field: getattr(job, field) for field in _FIELDS}
+
+
+# ----- Watcher -----
+class Subscription:
+    def __init__(self):
+        self.latest = None
+        self.changed = asyncio.Event()
+
+    async def next(self, timeout):
+        """The job's newest row (``None`` once deleted) when it changes, else ``TIMED_OUT`` after ``timeout`` seconds."""
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return TIMED_OUT
+        self.changed.clear()
+        return self.latest
+
+
+class JobWatcher:
+    """Follows the jobs clients are streaming, with one query per tick for all of them.
+
+    An open stream is then only a subscription waiting on an event: it holds no
+    thread and no database connection, however long its job sits in the queue.
+    The polling task runs while anyone is subscribed. A subscriber to a job
+    that is watched already gets its last polled row at once.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._subscriptions = {}
+        self._rows = {}
+        self._task = None
+
+    @contextlib.asynccontextmanager
+    async def watch(self, pk):
+        subscription = Subscription()
+        self._subscriptions.setdefault(pk, set()).add(subscription)
+        if pk in self._rows:
+            # Already watched: the next poll only reports a change, so hand over the row as it is now
+            subscription.latest = self._rows[pk]
+            subscription.changed.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll())
+        try:
+            yield subscription
+        finally:
+            subscribers = self._subscriptions[pk]
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscriptions[pk]
+                self._rows.pop(pk, None)
+
+    async def _poll(self):
+        try:
+            while self._subscriptions:
+                pks = list(self._subscriptions)
+                try:
+                    rows = {row["pk"]: row async for row in JudgeJob.objects.filter(pk__in=pks).values(*_FIELDS)}
+                except Exception:
+                    logger.exception("Polling %d streamed jobs failed", len(pks))
+                    await asyncio.sleep(self.interval)
+                    continue
+                for pk in pks:
+                    # A deleted job is reported once, as None
+                    row = rows.get(pk)
+                    if pk in self._rows and self._rows[pk] == row:
+                        continue
+                    self._rows[pk] = row
+                    for subscription in self._subscriptions.get(pk, ()):
+                        subscription.latest = row
+                        subscription.changed.set()
+                await asyncio.sleep(self.interval)
+        finally:
+            self._task = None
+
+
+_watchers = weakref.WeakKeyDictionary()
+
+
+def get_job_watcher():
+    """The watcher of the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _watchers:
+        _watchers[loop] = JobWatcher(getattr(settings, "JUDGE_EVENTS_POLL_INTERVAL", 0.25))
+    return _watchers[loop]
+
+
+async def wait_until_finished(job, timeout):
+    """``job`` fetched again once it is finished, or after ``timeout`` seconds; ``None`` if it was deleted."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    async with get_job_watcher().watch(job.pk) as subscription:
+        while (remaining := deadline - loop.time()) > 0:
+            row = await subscription.next(remaining)
+            if row is None:
+                return None
+            if row is TIMED_OUT or row["status"] in (JudgeJob.STATUS_DONE, JudgeJob.STATUS_FAILED):
+                break
+    return await JudgeJob.objects.filter(pk=job.pk).afirst()
+
+
+# ----- Stream -----
+async def job_event_stream(job, last_event_id=None):
+    """SSE messages for ``job`` from its current state until it finishes.
+
+    Sends ``status`` when the job's status changes, each of its progress events
+    (``compile``, ``test_case``) with its index as the message id, and finally
+    ``result`` with what the synchronous endpoint would have returned. Events up
+    to ``last_event_id`` are skipped, so a reconnecting client resumes where it
+    left off. The stream ends after ``JUDGE_EVENTS_MAX_SECONDS``; the client
+    reconnects and carries on.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + getattr(settings, "JUDGE_EVENTS_MAX_SECONDS", 300)
+    sent = 0 if last_event_id is None else last_event_id + 1
+    status = None
+    row = snapshot(job)
+
+    yield "retry: 2000\n\n"
+    async with get_job_watcher().watch(job.pk) as subscription:
+        while True:
+            if row is None:
+                yield sse("error", {"error": "Job not found."})
+                return
+            if row is not TIMED_OUT:
+                if row["status"] != status:
+                    status = row["status"]
+                    yield sse("status", {"status": status})
+                events = row["events"]
+                if len(events) < sent:
+                    # Requeued after its worker died, and being judged again from the start
+                    sent = 0
+                for i in range(sent, len(events)):
+                    yield sse(events[i]["event"], events[i], event_id=i)
+                sent = len(events)
+                if status in (JudgeJob.STATUS_DONE, JudgeJob.STATUS_FAILED):
+                    yield sse("result", {"status": status, "http_status": row["http_status"], "result": row["result"]})
+                    return
+            else:
+                yield ": keep-alive\n\n"
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            row = await subscription.next(min(HEARTBEAT, remaining))
@@ -0,0 +1,82 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from compiler.benchmark import (
+    ENDPOINTS, PHASES, TOOLCHAINS, WORKLOAD_NAMES,
+    Benchmark, available_languages, compare_results, save_results, scratch_database
+)
+
+
+class Command(BaseCommand):
+    help = ("Measure judge latency (p50/p95/p99), throughput and per-phase time of the compile and solve "
+            "endpoints under concurrent load, and save the results for comparison across commits.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--language", action="append", choices=sorted(TOOLCHAINS),
+                            help="Language to benchmark (repeatable); defaults to all installed.")
+        parser.add_argument("--workload", action="append", choices=WORKLOAD_NAMES,
+                            help="Workload to run (repeatable); defaults to all.")
+        parser.add_argument("--endpoint", action="append", choices=ENDPOINTS,
+                            help="Endpoint to drive (repeatable); defaults to both.")
+        parser.add_argument("--requests", type=int, default=20, help="Requests per scenario.")
+        parser.add_argument("--concurrency", type=int, default=4, help="Concurrent clients.")
+        parser.add_argument("--time-limit", type=float, default=1.0,
+                            help="CPU seconds per run, which bounds the timeout workload.")
+        parser.add_argument("--reuse-source", action="store_true",
+                            help="Submit identical source every time, so repeated requests hit the artifact "
+                                 "and verdict caches.")
+        parser.add_argument("--compare-pch", action="store_true",
+                            help="Run the C++ scenarios with precompiled headers off and then on.")
+        parser.add_argument("--output", default=str(settings.BASE_DIR / "benchmarks"),
+                            help="Directory the results file is written to.")
+        parser.add_argument("--compare", metavar="FILE", help="Earlier results file to compare against.")
+
+    def _print(self, name, summary):
+        latency, phases = summary["latency_ms"], summary["mean_phase_ms"]
+        line = (f"{name:<38} {summary['throughput']:7.2f} req/s  "
+                f"p50 {latency['p50']:8.1f}  p95 {latency['p95']:8.1f}  p99 {latency['p99']:8.1f} ms  | "
+                + "  ".join(f"{phase} {phases[phase]:.1f}" for phase in (*PHASES, "other")))
+        if summary["unexpected"]:
+            line += f"  [{summary['unexpected']} unexpected, statuses {summary['statuses']}]"
+        self.stdout.write(line)
+
+    def handle(self, *args, **options):
+        wanted = options["language"] or sorted(TOOLCHAINS)
+        languages = available_languages(wanted)
+        for language in sorted(set(wanted) - set(languages)):
+            self.stderr.write(f"{language}: skipped ({TOOLCHAINS[language]} not found)")
+        if not languages:
+            raise CommandError("No toolchain for any of the requested languages is installed.")
+
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+
+        benchmark = Benchmark(
+            languages,
+            options["workload"] or WORKLOAD_NAMES,
+            options["endpoint"] or ENDPOINTS,
+            requests=max(1, options["requests"]),
+            concurrency=options["concurrency"],
+            time_limit=options["time_limit"],
+            reuse_source=options["reuse_source"],
+            pch_modes=(False, True) if options["compare_pch"] else None,
+        )
+        with scratch_database():
+            results = benchmark.run(progress=self._print)
+
+        recorded = {key: options[key]
+                    for key in ("requests", "concurrency", "time_limit", "reuse_source", "compare_pch")}
+        path = save_results(results, recorded, options["output"])
+        self.stdout.write(f"Results saved to {path}")
+
+        if baseline is not None:
+            self.stdout.write(f"Compared with {baseline.get('commit') or options['compare']}:")
+            if baseline.get("options") != recorded:
+                self.stderr.write(f"Note: the baseline ran with different options: {baseline.get('options')}")
+            for name, changes in compare_results(baseline, results).items():
+                self.stdout.write(f"{name:<38} "
+                                  + "  ".join(f"{metric} {change:+.1%}" for metric, change in changes.items()))
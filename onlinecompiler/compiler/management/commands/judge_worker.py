@@ -0,0 +1,85 @@
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from compiler import metrics
+from compiler.judge_queue import requeue_stale_jobs, run_worker
+from compiler.workdirs import close_workdir_pool
+
+
+def _worker_main(stop_event, poll_interval):
+    # The supervisor owns Ctrl-C and SIGTERM and shuts workers down via stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    try:
+        run_worker(stop_event, poll_interval)
+    finally:
+        # Forked children skip atexit
+        metrics.flush()
+        close_workdir_pool()
+
+
+class Command(BaseCommand):
+    help = "Run a pool of judge worker processes that drain the queued submissions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=getattr(settings, "JUDGE_WORKERS", 2),
+                            help="Number of judge worker processes.")
+        parser.add_argument("--poll-interval", type=float, default=None,
+                            help="Seconds an idle worker waits before polling the queue again.")
+        parser.add_argument("--stale-after", type=int, default=getattr(settings, "JUDGE_QUEUE_STALE_AFTER", 60),
+                            help="Requeue running jobs whose worker sent no heartbeat for this many seconds.")
+
+    def handle(self, *args, **options):
+        workers = max(1, options["workers"])
+        stale_after = options["stale_after"]
+
+        requeued = requeue_stale_jobs(stale_after)
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s).")
+
+        # Children must not inherit the parent's database connections
+        connections.close_all()
+        ctx = multiprocessing.get_context("fork")
+        stop_event = ctx.Event()
+
+        def spawn():
+            proc = ctx.Process(target=_worker_main, args=(stop_event, options["poll_interval"]), daemon=True)
+            proc.start()
+            return proc
+
+        # Only record the signal here: setting stop_event from inside a handler can
+        # deadlock against a wait() on the same event in this thread.
+        stopping = []
+
+        def shutdown(signum, frame):
+            stopping.append(signum)
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        pool = [spawn() for _ in range(workers)]
+        self.stdout.write(f"Started {workers} judge worker(s).")
+
+        check_interval = max(1, min(stale_after // 2, 30))
+        last_check = time.monotonic()
+        while not stopping:
+            time.sleep(0.5)
+            if time.monotonic() - last_check < check_interval:
+                continue
+            last_check = time.monotonic()
+            for i, proc in enumerate(pool):
+                if not proc.is_alive():
+                    self.stderr.write(f"Judge worker {proc.pid} exited with {proc.exitcode}; restarting.")
+                    pool[i] = spawn()
+            requeue_stale_jobs(stale_after)
+            connections.close_all()
+
+        stop_event.set()
+        for proc in pool:
+            proc.join()
+        self.stdout.write("Judge workers stopped.")
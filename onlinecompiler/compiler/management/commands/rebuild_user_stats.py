@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from compiler.leaderboard import invalidate_ranking
+from compiler.stats import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized per-user counters on UserProfile from submissions and solutions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--include-points", action="store_true",
+                            help="Also reset points to the number of correctly solved challenges.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_user_stats(include_points=options["include_points"])
+            invalidate_ranking()
+        self.stdout.write(f"Rebuilt stats for {count} profile(s).")
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from compiler.models import CodingChallenge
+from compiler.rejudge import rejudge_challenges
+
+
+class Command(BaseCommand):
+    help = "Re-judge every stored solution of the given challenges against their current test cases."
+
+    def add_arguments(self, parser):
+        parser.add_argument("challenge_ids", nargs="*", type=int, help="Challenges to re-judge.")
+        parser.add_argument("--all", action="store_true", help="Re-judge every active challenge.")
+        parser.add_argument("--workers", type=int, default=None,
+                            help="Solutions judged at once (default JUDGE_TEST_WORKERS).")
+        parser.add_argument("--batch-size", type=int, default=100,
+                            help="Verdicts saved per bulk update.")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            challenges = CodingChallenge.objects.filter(is_active=True).order_by("pk")
+        elif options["challenge_ids"]:
+            challenges = CodingChallenge.objects.filter(pk__in=options["challenge_ids"]).order_by("pk")
+            missing = set(options["challenge_ids"]) - {challenge.pk for challenge in challenges}
+            if missing:
+                raise CommandError(f"Challenges not found: {sorted(missing)}")
+        else:
+            raise CommandError("Name the challenges to re-judge, or pass --all.")
+
+        def progress(report):
+            self.stdout.write(
+                f"{report['judged']}/{report['total']} judged, {report['changed']} changed, "
+                f"{report['errors']} error(s), {report['per_second']} solutions/s"
+            )
+
+        report = rejudge_challenges(challenges, workers=options["workers"],
+                                    batch_size=max(1, options["batch_size"]), progress=progress)
+        self.stdout.write(
+            f"Re-judged {report['judged']} solution(s) of {len(report['challenges'])} challenge(s) "
+            f"in {report['elapsed']:.1f}s ({report['per_second']} solutions/s): {report['changed']} verdict(s) changed, "
+            f"{report['skipped']} resubmitted meanwhile, {report['errors']} error(s)."
+        )
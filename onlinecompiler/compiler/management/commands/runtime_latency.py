@@ -0,0 +1,70 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from compiler.execution import compile_program
+from compiler import runtimes
+
+HELLO = {
+    "python": "print(input())",
+    "java": (
+        "import java.util.Scanner;\n"
+        "public class Main {\n"
+        "  public static void main(String[] args) {\n"
+        "    System.out.println(new Scanner(System.in).nextLine());\n"
+        "  }\n"
+        "}\n"
+    ),
+}
+
+DEFAULT_OPTIONS = {
+    "python": {"max_runs": 500},
+    "java": {"size": 1, "max_runs": 100},
+}
+
+
+class Command(BaseCommand):
+    help = "Compare cold and warm run latency of a trivial program for each warmable language."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=20)
+        parser.add_argument("--language", action="append", choices=sorted(HELLO),
+                            help="Language to measure (repeatable); defaults to all.")
+
+    def _measure(self, program, runs):
+        program.run("warmup")  # Starts the pool, if any
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            result = program.run("hello")
+            timings.append((time.perf_counter() - started) * 1000)
+            if result["stdout"].strip() != "hello":
+                raise RuntimeError(f"Unexpected output: {result}")
+        return timings
+
+    def handle(self, *args, **options):
+        for language in options["language"] or sorted(HELLO):
+            try:
+                program = compile_program(HELLO[language], language)
+            except OSError as e:
+                self.stderr.write(f"{language}: skipped ({e})")
+                continue
+            with program:
+                if program.compile_failed:
+                    self.stderr.write(f"{language}: compile failed\n{program.compile_result['stderr']}")
+                    continue
+                report = {}
+                for mode, warm in (("cold", {}), ("warm", {language: DEFAULT_OPTIONS[language]})):
+                    with override_settings(JUDGE_WARM_RUNTIMES=warm):
+                        report[mode] = self._measure(program, options["runs"])
+                    runtimes.close_warm_pools()
+
+            for mode, timings in report.items():
+                self.stdout.write(
+                    f"{language:<7} {mode}: mean {statistics.mean(timings):7.1f} ms  "
+                    f"p50 {statistics.median(timings):7.1f} ms  max {max(timings):7.1f} ms"
+                )
+            speedup = statistics.median(report["cold"]) / statistics.median(report["warm"])
+            self.stdout.write(f"{language:<7} warm speedup (p50): {speedup:.1f}x")
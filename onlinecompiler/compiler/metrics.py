@@ -0,0 +1,305 @@
+import atexit
+import bisect
+import fcntl
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+
+from .datadir import private_dir
+from .workdirs import pid_alive
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HELP = {
+    "judge_phase_seconds": ("histogram", "Time spent in each judge phase (write, compile, run, db)."),
+    "judge_submission_seconds": ("histogram", "Time to judge a submission, end to end."),
+    "judge_verdicts_total": ("counter", "Judged submissions by verdict."),
+    "judge_timeouts_total": ("counter", "Submissions stopped by the wall-clock or CPU time limit."),
+    "judge_compile_failures_total": ("counter", "Submissions that failed to compile."),
+    "judge_cache_requests_total": ("counter", "Cache lookups by cache and result."),
+    "judge_cache_stores_total": ("counter", "Entries added to a cache."),
+    "judge_cache_evictions_total": ("counter", "Entries evicted from a cache to keep it within its size limit."),
+    "judge_queue_jobs": ("gauge", "Queued judge jobs by status."),
+    "judge_admissions_total": ("counter", "Judgings let in, rejected or timed out waiting by the admission scheduler."),
+    "judge_admission_wait_seconds": ("histogram", "Time a judging waited for admission."),
+}
+
+
+# ----- Registry -----
+class Registry:
+    """Counters and histograms of one process, keyed by name and label set."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # One count per bucket plus +Inf, then the sum
+                histogram = self.histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram[bisect.bisect_left(BUCKETS, value)] += 1
+            histogram[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, dict(labels), list(values)] for (name, labels), values in self.histograms.items()],
+            }
+
+    def merge(self, snapshot):
+        with self._lock:
+            for name, labels, value in snapshot["counters"]:
+                self.counters[(name, tuple(sorted(labels.items())))] += value
+            for name, labels, values in snapshot["histograms"]:
+                key = (name, tuple(sorted(labels.items())))
+                histogram = self.histograms.setdefault(key, [0] * (len(BUCKETS) + 1) + [0.0])
+                for i, value in enumerate(values):
+                    histogram[i] += value
+
+
+REGISTRY = Registry()
+_process_id = uuid.uuid4().hex
+_publish_lock = threading.Lock()
+_published_at = None  # time.monotonic() of the last write, None before the first
+_pending = None  # Timer of the write put off by publish()
+
+
+def _forget_parent():
+    # A forked judge worker starts counting from zero under its own name
+    global REGISTRY, _process_id, _publish_lock, _published_at, _pending
+    REGISTRY = Registry()
+    _process_id = uuid.uuid4().hex
+    _publish_lock = threading.Lock()
+    _published_at = None
+    _pending = None
+
+
+os.register_at_fork(after_in_child=_forget_parent)
+
+
+def inc(name, amount=1, **labels):
+    REGISTRY.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+# ----- Sharing between processes -----
+def _metrics_dir():
+    return getattr(settings, "JUDGE_METRICS_DIR", None)
+
+
+def _host():
+    return socket.gethostname()
+
+
+def _own_file(directory):
+    return os.path.join(directory, f"{_host()}-{os.getpid()}-{_process_id}.json")
+
+
+def _exited_file(directory):
+    return os.path.join(directory, f"{_host()}-exited.json")
+
+
+def publish_interval():
+    return getattr(settings, "JUDGE_METRICS_PUBLISH_INTERVAL", 5)
+
+
+def publish():
+    """Have this process's metrics written to ``JUDGE_METRICS_DIR`` within ``JUDGE_METRICS_PUBLISH_INTERVAL``.
+
+    The first call writes at once; later ones within the interval of the
+    last write leave it to a timer, so a busy process writes at most once
+    per interval. ``flush()`` writes now.
+    """
+    global _pending
+    if not _metrics_dir():
+        return
+    with _publish_lock:
+        if _pending is not None:
+            return
+        wait = 0 if _published_at is None else _published_at + publish_interval() - time.monotonic()
+        if wait > 0:
+            _pending = threading.Timer(wait, flush)
+            _pending.daemon = True
+            _pending.start()
+            return
+    flush()
+
+
+@atexit.register
+def flush():
+    """Write this process's metrics to ``JUDGE_METRICS_DIR`` now, so ``/metrics`` in any process includes them.
+
+    Each process owns one file, replaced atomically. The files of this
+    host's processes that have exited are then added into one file of the
+    host's, so the totals never go backwards and the directory doesn't grow
+    with every restart. The directory must be private (see
+    ``datadir.private_dir``), since ``/metrics`` adds up every file in it.
+    """
+    global _pending, _published_at
+    directory = _metrics_dir()
+    if not directory:
+        return
+    with _publish_lock:
+        if _pending is not None:
+            _pending.cancel()
+            _pending = None
+        _published_at = time.monotonic()
+    try:
+        private_dir(directory)
+        _write(_own_file(directory), REGISTRY.snapshot())
+        _merge_exited(directory)
+    except OSError:
+        logger.warning("Could not publish judge metrics to %s", directory, exc_info=True)
+
+
+def _write(path, snapshot):
+    fd, staging = tempfile.mkstemp(prefix=".staging-", dir=os.path.dirname(path))
+    with os.fdopen(fd, "w") as f:
+        json.dump(snapshot, f)
+    os.rename(staging, path)
+
+
+def _merge_exited(directory):
+    """Add the files of this host's exited processes into its ``-exited`` file and remove them."""
+    exited = []
+    for name in os.listdir(directory):
+        host, _, rest = name.rpartition("-")
+        host, _, pid = host.rpartition("-")
+        if host == _host() and pid.isdigit() and rest.endswith(".json") and not pid_alive(int(pid)):
+            exited.append(os.path.join(directory, name))
+    if not exited:
+        return
+    # One process at a time, so no file is added twice
+    with open(os.path.join(directory, ".merge.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        total = Registry()
+        _merge_file(total, _exited_file(directory))
+        merged = [path for path in exited if _merge_file(total, path)]
+        _write(_exited_file(directory), total.snapshot())
+        for path in merged:
+            os.unlink(path)
+
+
+def _merge_file(registry, path):
+    """Add the snapshot at ``path`` to ``registry``; ``False`` if it is gone (another process merged it)."""
+    try:
+        with open(path) as f:
+            registry.merge(json.load(f))
+    except FileNotFoundError:
+        return False
+    except ValueError:
+        logger.warning("Dropping unreadable judge metrics file %s", path)
+    return True
+
+
+def collect():
+    """This process's metrics plus every other process's published ones, as a new ``Registry``.
+
+    Published files are only read from a private directory.
+    """
+    total = Registry()
+    total.merge(REGISTRY.snapshot())
+    directory = _metrics_dir()
+    if not directory:
+        return total
+    own = _own_file(directory)
+    try:
+        private_dir(directory)
+        names = os.listdir(directory)
+    except PermissionError:
+        logger.error("Not adding up the judge metrics in %s, which other users can write to", directory)
+        return total
+    except OSError:
+        return total
+    for name in names:
+        path = os.path.join(directory, name)
+        if name.startswith(".") or path == own:
+            continue
+        try:
+            with open(path) as f:
+                total.merge(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+# ----- Exposition -----
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def render(registry, gauges=()):
+    """Prometheus text format for ``registry`` plus ``gauges`` (``(name, labels, value)`` tuples)."""
+    series = defaultdict(list)
+    for (name, labels), value in sorted(registry.counters.items()):
+        series[name].append(f"{name}{_labels(labels)} {value:g}")
+    for (name, labels), values in sorted(registry.histograms.items()):
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, "+Inf"), values[:-1]):
+            cumulative += count
+            series[name].append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative:g}")
+        series[name].append(f"{name}_sum{_labels(labels)} {values[-1]:g}")
+        series[name].append(f"{name}_count{_labels(labels)} {cumulative:g}")
+    for name, labels, value in gauges:
+        series[name].append(f"{name}{_labels(sorted(labels.items()))} {value:g}")
+
+    lines = []
+    for name in sorted(series):
+        kind, description = HELP.get(name, ("untyped", ""))
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(series[name])
+    return "\n".join(lines) + "\n"
+
+
+# ----- Judge events -----
+def record_judgement(kind, language, verdict, duration, phases, **ids):
+    """Count a judged submission, log it as one JSON line and publish the process's metrics.
+
+    ``ids`` (e.g. ``submission=12``) go into the log line only, to correlate
+    it with the stored rows.
+    """
+    inc("judge_verdicts_total", kind=kind, language=language, verdict=verdict)
+    if verdict in ("timeout", "time_limit_exceeded"):
+        inc("judge_timeouts_total", kind=kind, language=language)
+    if verdict == "compile_error":
+        inc("judge_compile_failures_total", kind=kind, language=language)
+    observe("judge_submission_seconds", duration, kind=kind, language=language)
+
+    logger.info("judged %s", json.dumps({
+        "kind": kind,
+        **ids,
+        "language": language,
+        "verdict": verdict,
+        "seconds": round(duration, 4),
+        "phases": {name: round(seconds, 4) for name, seconds in phases.items()},
+    }))
+    publish()
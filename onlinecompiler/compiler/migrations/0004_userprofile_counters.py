@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:41
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    Submission = apps.get_model('compiler', 'Submission')
+    ChallengeSolution = apps.get_model('compiler', 'ChallengeSolution')
+    UserProfile = apps.get_model('compiler', 'UserProfile')
+
+    executed = dict(
+        Submission.objects.order_by().values('user').annotate(n=Count('pk')).values_list('user', 'n')
+    )
+    completed = dict(
+        ChallengeSolution.objects.filter(is_correct=True).order_by()
+        .values('user').annotate(n=Count('pk')).values_list('user', 'n')
+    )
+    profiles = list(UserProfile.objects.all())
+    for profile in profiles:
+        profile.programs_executed = executed.get(profile.user_id, 0)
+        profile.challenges_completed = completed.get(profile.user_id, 0)
+    UserProfile.objects.bulk_update(profiles, ['programs_executed', 'challenges_completed'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compiler', '0003_judgejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='challenges_completed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='programs_executed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
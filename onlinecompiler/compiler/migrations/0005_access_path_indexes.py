@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compiler', '0004_userprofile_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='challengesolution',
+            index=models.Index(fields=['user', '-created_at'], name='solution_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='challengesolution',
+            index=models.Index(fields=['challenge', 'is_correct'], name='solution_challenge_ok_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='codingchallenge',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['difficulty'], name='challenge_active_diff_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='judgejob',
+            index=models.Index(fields=['status', 'id'], name='judgejob_status_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['user', '-created_at'], name='submission_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['-points', 'user'], name='profile_points_idx'),
+        ),
+    ]
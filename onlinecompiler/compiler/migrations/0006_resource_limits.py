@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compiler', '0005_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challengesolution',
+            name='cpu_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='challengesolution',
+            name='peak_memory_kb',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='challengesolution',
+            name='wall_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='codingchallenge',
+            name='memory_limit',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='codingchallenge',
+            name='time_limit',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='cpu_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='peak_memory_kb',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='wall_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
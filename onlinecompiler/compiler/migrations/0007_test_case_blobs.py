@@ -0,0 +1,89 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:50
+
+import hashlib
+import os
+import tempfile
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# The blob layout as of this migration (see compiler.blobs), copied so later changes there can't alter it
+def blob_path(digest):
+    return os.path.join(settings.JUDGE_BLOB_DIR, digest[:2], digest)
+
+
+def put_blob(text):
+    data = text.encode()
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, staging = tempfile.mkstemp(prefix='.staging-', dir=settings.JUDGE_BLOB_DIR)
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        os.rename(staging, path)
+    return digest, len(data)
+
+
+def read_blob(digest):
+    with open(blob_path(digest), 'rb') as f:
+        return f.read().decode(errors='replace')
+
+
+def move_test_cases_to_blobs(apps, schema_editor):
+    CodingChallenge = apps.get_model('compiler', 'CodingChallenge')
+    ChallengeTestCase = apps.get_model('compiler', 'ChallengeTestCase')
+    for challenge in CodingChallenge.objects.only('pk', 'test_cases').iterator():
+        cases = []
+        for position, test_case in enumerate(challenge.test_cases or []):
+            input_blob, input_size = put_blob(str(test_case.get('input', '')))
+            output_blob, output_size = put_blob(str(test_case.get('output', '')))
+            cases.append(ChallengeTestCase(
+                challenge=challenge, position=position,
+                input_blob=input_blob, input_size=input_size,
+                output_blob=output_blob, output_size=output_size,
+            ))
+        ChallengeTestCase.objects.bulk_create(cases)
+
+
+def restore_test_cases(apps, schema_editor):
+    CodingChallenge = apps.get_model('compiler', 'CodingChallenge')
+    for challenge in CodingChallenge.objects.prefetch_related('cases'):
+        challenge.test_cases = [
+            {'input': read_blob(case.input_blob), 'output': read_blob(case.output_blob)}
+            for case in challenge.cases.order_by('position')
+        ]
+        challenge.save(update_fields=['test_cases'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compiler', '0006_resource_limits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChallengeTestCase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('input_blob', models.CharField(max_length=64)),
+                ('input_size', models.PositiveBigIntegerField(default=0)),
+                ('output_blob', models.CharField(max_length=64)),
+                ('output_size', models.PositiveBigIntegerField(default=0)),
+                ('challenge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cases', to='compiler.codingchallenge')),
+            ],
+            options={
+                'ordering': ['position'],
+                'constraints': [models.UniqueConstraint(fields=('challenge', 'position'), name='unique_test_case_position')],
+            },
+        ),
+        migrations.RunPython(move_test_cases_to_blobs, restore_test_cases),
+        migrations.RemoveField(
+            model_name='codingchallenge',
+            name='test_cases',
+        ),
+    ]
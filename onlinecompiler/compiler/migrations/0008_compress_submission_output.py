@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:54
+
+import compiler.fields
+from django.db import migrations
+
+# Copied through Python rather than altered in place: a text -> bytea cast
+# would choke on backslashes on PostgreSQL and wouldn't compress anything.
+FIELDS = ('stdout', 'stderr')
+
+
+def _copy(apps, source_suffix, target_suffix):
+    Submission = apps.get_model('compiler', 'Submission')
+    sources = [field + source_suffix for field in FIELDS]
+    targets = [field + target_suffix for field in FIELDS]
+    batch = []
+    for submission in Submission.objects.only('pk', *sources).iterator(chunk_size=500):
+        for source, target in zip(sources, targets):
+            setattr(submission, target, getattr(submission, source))
+        batch.append(submission)
+        if len(batch) == 500:
+            Submission.objects.bulk_update(batch, targets)
+            batch = []
+    if batch:
+        Submission.objects.bulk_update(batch, targets)
+
+
+def pack_output(apps, schema_editor):
+    _copy(apps, '', '_packed')
+
+
+def unpack_output(apps, schema_editor):
+    _copy(apps, '_packed', '')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compiler', '0007_test_case_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='stdout_packed',
+            field=compiler.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='stderr_packed',
+            field=compiler.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.RunPython(pack_output, unpack_output),
+        migrations.RemoveField(
+            model_name='submission',
+            name='stdout',
+        ),
+        migrations.RemoveField(
+            model_name='submission',
+            name='stderr',
+        ),
+        migrations.RenameField(
+            model_name='submission',
+            old_name='stdout_packed',
+            new_name='stdout',
+        ),
+        migrations.RenameField(
+            model_name='submission',
+            old_name='stderr_packed',
+            new_name='stderr',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compiler', '0008_compress_submission_output'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='judgejob',
+            name='kind',
+            field=models.CharField(choices=[('compile', 'Compile'), ('solve', 'Solve'), ('rejudge', 'Rejudge')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compiler', '0009_rejudge_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='judgejob',
+            name='events',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compiler', '0010_judgejob_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codingchallenge',
+            name='checker',
+            field=models.CharField(choices=[('exact', 'Exact (ignoring leading and trailing whitespace)'), ('whitespace', 'Tokens, any whitespace'), ('float', 'Tokens, numbers within a tolerance'), ('custom', 'Checker program')], default='exact', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='codingchallenge',
+            name='checker_code',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='codingchallenge',
+            name='checker_language',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='codingchallenge',
+            name='checker_tolerance',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compiler', '0011_challenge_checkers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codingchallenge',
+            name='compile_profile',
+            field=models.CharField(blank=True, max_length=30),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compiler', '0012_challenge_compile_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='judgejob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
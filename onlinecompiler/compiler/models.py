@@ -1,16 +1,28 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from .fields import CompressedTextField
+
 class Submission(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='submissions')
     language = models.CharField(max_length=20)
     code = models.TextField()
     stdin = models.TextField(blank=True, null=True)
-    stdout = models.TextField(blank=True, null=True)
-    stderr = models.TextField(blank=True, null=True)
+    stdout = CompressedTextField(blank=True, null=True)
+    stderr = CompressedTextField(blank=True, null=True)
     returncode = models.IntegerField(default=0)
+    # What the run used, as measured by the judge (null when it didn't run)
+    cpu_time = models.FloatField(null=True, blank=True)  # seconds
+    wall_time = models.FloatField(null=True, blank=True)  # seconds
+    peak_memory_kb = models.IntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # A user's history, newest first
+            models.Index(fields=['user', '-created_at'], name='submission_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"Submission by {self.user.username} at {self.created_at}"
 
@@ -19,7 +31,6 @@ class CodingChallenge(models.Model):
     description = models.TextField()
     example_input = models.TextField(blank=True)
     example_output = models.TextField(blank=True)
-    test_cases = models.JSONField(default=list)  # List of input/output test cases
     difficulty = models.CharField(max_length=20, choices=[
         ('easy', 'Easy'),
         ('medium', 'Medium'),
@@ -28,16 +39,62 @@ class CodingChallenge(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='challenges_created')
     is_active = models.BooleanField(default=True)
+    # Per-test-case overrides of JUDGE_CPU_TIME_LIMIT / JUDGE_MEMORY_LIMIT_MB
+    time_limit = models.FloatField(null=True, blank=True)  # CPU seconds
+    memory_limit = models.PositiveIntegerField(null=True, blank=True)  # MB
+    # How output is compared with the expected output; see compiler.checkers
+    checker = models.CharField(max_length=20, choices=[
+        ('exact', 'Exact (ignoring leading and trailing whitespace)'),
+        ('whitespace', 'Tokens, any whitespace'),
+        ('float', 'Tokens, numbers within a tolerance'),
+        ('custom', 'Checker program')
+    ], default='exact')
+    checker_tolerance = models.FloatField(null=True, blank=True)  # float checker; 1e-6 when unset
+    checker_code = models.TextField(blank=True)  # custom checker
+    checker_language = models.CharField(max_length=20, blank=True)
+    # Named compile profile (JUDGE_LANGUAGES "profiles"); the language's default when blank
+    compile_profile = models.CharField(max_length=30, blank=True)
+
+    class Meta:
+        indexes = [
+            # Active challenge listings by difficulty. Partial rather than
+            # (is_active, difficulty): SQLite renders is_active=True as a bare
+            # column test, which can't seek a boolean index column
+            models.Index(fields=['difficulty'], condition=models.Q(is_active=True), name='challenge_active_diff_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+class ChallengeTestCase(models.Model):
+    # Input and expected output live in the blob store (compiler.blobs), so
+    # loading a challenge never drags its test data along
+    challenge = models.ForeignKey(CodingChallenge, on_delete=models.CASCADE, related_name='cases')
+    position = models.PositiveIntegerField()  # 0-based run/report order
+    input_blob = models.CharField(max_length=64)  # SHA-256 of the input
+    input_size = models.PositiveBigIntegerField(default=0)
+    output_blob = models.CharField(max_length=64)  # SHA-256 of the expected output
+    output_size = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['challenge', 'position'], name='unique_test_case_position')
+        ]
+
+    def __str__(self):
+        return f"Test case {self.position + 1} of {self.challenge.title}"
+
 class ChallengeSolution(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='solutions')
     challenge = models.ForeignKey(CodingChallenge, on_delete=models.CASCADE, related_name='solutions')
     code = models.TextField()
     language = models.CharField(max_length=20)
     is_correct = models.BooleanField(default=False)
+    # Worst test case of the latest attempt (null when nothing ran)
+    cpu_time = models.FloatField(null=True, blank=True)  # seconds
+    wall_time = models.FloatField(null=True, blank=True)  # seconds
+    peak_memory_kb = models.IntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -49,6 +106,12 @@ class ChallengeSolution(models.Model):
                 name='unique_correct_solution'
             )
         ]
+        indexes = [
+            # A user's solutions, newest first
+            models.Index(fields=['user', '-created_at'], name='solution_user_created_idx'),
+            # Who solved a challenge (re-judging, stats)
+            models.Index(fields=['challenge', 'is_correct'], name='solution_challenge_ok_idx'),
+        ]
 
     def __str__(self):
         return f"Solution by {self.user.username} for {self.challenge.title}"
@@ -56,7 +119,64 @@ class ChallengeSolution(models.Model):
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     points = models.IntegerField(default=0)
+    # Denormalized counters, kept in step by compiler.stats on every submit
+    programs_executed = models.IntegerField(default=0)
+    challenges_completed = models.IntegerField(default=0)
     last_active = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Leaderboard ranking order
+            models.Index(fields=['-points', 'user'], name='profile_points_idx'),
+        ]
+
+    def __str__(self):
+        return f"Profile of {self.user.username}"
+
+class JudgeJob(models.Model):
+    KIND_COMPILE = 'compile'
+    KIND_SOLVE = 'solve'
+    KIND_REJUDGE = 'rejudge'
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='judge_jobs')
+    kind = models.CharField(max_length=20, choices=[
+        (KIND_COMPILE, 'Compile'),
+        (KIND_SOLVE, 'Solve'),
+        (KIND_REJUDGE, 'Rejudge')
+    ])
+    challenge = models.ForeignKey(CodingChallenge, on_delete=models.CASCADE, related_name='judge_jobs', null=True, blank=True)
+    language = models.CharField(max_length=20)
+    code = models.TextField()
+    stdin = models.TextField(blank=True, null=True)
+    status = models.CharField(max_length=20, choices=[
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed')
+    ], default=STATUS_QUEUED, db_index=True)
+    result = models.JSONField(null=True, blank=True)  # Response body the synchronous view would have returned
+    events = models.JSONField(default=list, blank=True)  # Progress published while it runs (compile, each test case)
+    http_status = models.IntegerField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # Refreshed by the worker while it holds the job
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest queued job
+            models.Index(fields=['status', 'id'], name='judgejob_status_id_idx'),
+        ]
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
     def __str__(self):
-        return f"Profile of {self.user.username}"
\ No newline at end of file
+        return f"{self.kind} job {self.pk} ({self.status})"
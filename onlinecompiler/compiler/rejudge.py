@@ -0,0 +1,177 @@
+import logging
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .checkers import CheckerError, build_checker
+from .execution import compile_program
+from .judge import run_test_cases, worst_usage
+from .limits import ResourceLimits
+from .models import ChallengeSolution, UserProfile
+
+logger = logging.getLogger(__name__)
+
+VERDICT_FIELDS = ["is_correct", "cpu_time", "wall_time", "peak_memory_kb"]
+
+
+def judge_stored_solution(solution, test_cases, limits, checker=None, profile=None):
+    """``(is_correct, usage)`` for ``solution``, or ``None`` if it couldn't be judged.
+
+    Touches no database rows, so it can run on any thread. The solution's test
+    cases run one after another: a re-judge gets its parallelism from running
+    many solutions at once instead.
+    """
+    try:
+        program = compile_program(solution.code, solution.language, limits, profile)
+    except Exception:
+        logger.exception("Could not build solution %s for re-judging", solution.pk)
+        return None
+
+    with program:
+        if program.compile_failed:
+            return False, worst_usage([])
+        try:
+            outcomes = run_test_cases(program, test_cases, workers=1, checker=checker)
+        except CheckerError:
+            logger.exception("The checker failed while re-judging solution %s", solution.pk)
+            return None
+
+    if any(outcome is not None and "error" in outcome for outcome in outcomes):
+        return None
+    return all(outcome is not None and outcome["passed"] for outcome in outcomes), worst_usage(outcomes)
+
+
+def _stream_solutions(challenge, batch_size):
+    # Fetched in batches of primary keys rather than through one long-lived
+    # cursor, so verdicts can be written between reads on every backend
+    ids = list(ChallengeSolution.objects.filter(challenge=challenge).order_by("pk").values_list("pk", flat=True))
+    for start in range(0, len(ids), batch_size):
+        yield from (ChallengeSolution.objects
+                    .filter(pk__in=ids[start:start + batch_size])
+                    .only("pk", "user_id", "code", "language", "is_correct")
+                    .order_by("pk"))
+
+
+def _save_verdicts(verdicts, report):
+    """Write a batch of ``(solution, (is_correct, usage))`` and the owners' counters.
+
+    Rows are re-read under lock first: a solution resubmitted while it was
+    being re-judged already has a newer verdict and is left alone.
+    """
+    with transaction.atomic():
+        current = {
+            pk: (code, language, is_correct)
+            for pk, code, language, is_correct in ChallengeSolution.objects.select_for_update()
+            .filter(pk__in=[solution.pk for solution, _ in verdicts])
+            .values_list("pk", "code", "language", "is_correct")
+        }
+        rows = []
+        completed = Counter()
+        for solution, (is_correct, usage) in verdicts:
+            row = current.get(solution.pk)
+            if row is None or row[:2] != (solution.code, solution.language):
+                report["skipped"] += 1
+                continue
+            if is_correct != row[2]:
+                report["changed"] += 1
+                completed[solution.user_id] += int(is_correct) - int(row[2])
+            solution.is_correct = is_correct
+            for field, value in usage.items():
+                setattr(solution, field, value)
+            rows.append(solution)
+
+        ChallengeSolution.objects.bulk_update(rows, VERDICT_FIELDS)
+        # Points stay as awarded: they're for the first correct submission,
+        # which a re-judge doesn't change
+        for user_id, delta in completed.items():
+            if delta:
+                UserProfile.objects.filter(user_id=user_id).update(
+                    challenges_completed=F("challenges_completed") + delta
+                )
+
+
+def rejudge_challenges(challenges, workers=None, batch_size=100, progress=None):
+    """Re-run every stored solution of ``challenges`` against their current test cases.
+
+    Solutions are streamed from the database and judged ``workers`` at a time
+    (default ``JUDGE_TEST_WORKERS``); new verdicts and usage are saved with
+    ``bulk_update`` every ``batch_size`` solutions. Solutions that error (e.g.
+    time out) or fail to build keep their old verdict and are counted in
+    ``errors``. ``progress`` is called with the report after every batch.
+    """
+    if workers is None:
+        workers = getattr(settings, "JUDGE_TEST_WORKERS", 1)
+    workers = max(1, workers)
+
+    challenges = list(challenges)
+    started = time.monotonic()
+    report = {
+        "challenges": [challenge.pk for challenge in challenges],
+        "total": ChallengeSolution.objects.filter(challenge__in=challenges).count(),
+        "judged": 0,
+        "changed": 0,
+        "skipped": 0,
+        "errors": 0,
+        "elapsed": 0.0,
+        "per_second": 0.0
+    }
+
+    def flush(verdicts):
+        if verdicts:
+            _save_verdicts(verdicts, report)
+        report["elapsed"] = round(time.monotonic() - started, 3)
+        report["per_second"] = round(report["judged"] / report["elapsed"], 2) if report["elapsed"] else 0.0
+        if progress is not None:
+            progress(report)
+
+    verdicts = []
+    in_flight = {}
+
+    def collect(done):
+        for future in done:
+            solution = in_flight.pop(future)
+            verdict = future.result()
+            report["judged"] += 1
+            if verdict is None:
+                report["errors"] += 1
+            else:
+                verdicts.append((solution, verdict))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for challenge in challenges:
+            test_cases = list(challenge.cases.all())
+            limits = ResourceLimits.for_challenge(challenge)
+            try:
+                checker = build_checker(challenge)
+            except CheckerError:
+                logger.exception("Could not build the checker of challenge %s", challenge.pk)
+                checker, test_cases = None, []
+            for solution in _stream_solutions(challenge, batch_size):
+                if not test_cases:
+                    # Nothing to judge against; leave the verdicts as they are
+                    report["judged"] += 1
+                    report["errors"] += 1
+                    continue
+                # A couple of solutions queued per worker keeps every thread busy
+                # without loading the whole challenge's code into memory
+                if len(in_flight) >= 2 * workers:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                    if len(verdicts) >= batch_size:
+                        flush(verdicts)
+                        verdicts.clear()
+                future = pool.submit(judge_stored_solution, solution, test_cases, limits, checker,
+                                     challenge.compile_profile)
+                in_flight[future] = solution
+
+            collect(wait(in_flight).done)
+            if checker is not None:
+                checker.close()
+            flush(verdicts)
+            verdicts.clear()
+
+    return report
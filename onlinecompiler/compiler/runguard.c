@@ -0,0 +1,99 @@
+/*
+ * Runs one submission under resource limits and reports what it used.
+ * Built on first use by compiler.limits.guard_path().
+ *
+ *     runguard <report fd> [NAME=soft:hard ...] -- command [args ...]
+ *
+ * NAME is a setrlimit resource without its RLIMIT_ prefix (CPU, AS, FSIZE,
+ * NPROC, CORE). The command runs in a child forked from this small process,
+ * so its ru_maxrss is its own: a child forked straight from the web server
+ * would report the server's resident size instead, since the kernel carries
+ * the pre-exec peak across exec. Once the child is reaped one line goes to
+ * the report fd:
+ *
+ *     <returncode> <cpu microseconds> <peak rss kB>
+ *
+ * with returncode negative for a signal, as in Python's subprocess.
+ */
+#include <errno.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/resource.h>
+#include <sys/time.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+static const struct {
+    const char *name;
+    int resource;
+} resources[] = {
+    {"CPU", RLIMIT_CPU},
+    {"AS", RLIMIT_AS},
+    {"FSIZE", RLIMIT_FSIZE},
+    {"NPROC", RLIMIT_NPROC},
+    {"CORE", RLIMIT_CORE},
+};
+
+static int apply_limit(const char *spec) {
+    char name[16];
+    unsigned long long soft, hard;
+    if (sscanf(spec, "%15[A-Z]=%llu:%llu", name, &soft, &hard) != 3) {
+        return -1;
+    }
+    for (size_t i = 0; i < sizeof(resources) / sizeof(resources[0]); i++) {
+        if (strcmp(resources[i].name, name) == 0) {
+            struct rlimit limit = {(rlim_t) soft, (rlim_t) hard};
+            return setrlimit(resources[i].resource, &limit);
+        }
+    }
+    return -1;
+}
+
+int main(int argc, char **argv) {
+    if (argc < 4) {
+        fprintf(stderr, "usage: runguard <report fd> [NAME=soft:hard ...] -- command [args ...]\n");
+        return 2;
+    }
+    int report_fd = atoi(argv[1]);
+    int command = 2;
+    while (command < argc && strcmp(argv[command], "--") != 0) {
+        command++;
+    }
+    if (command + 1 >= argc) {
+        fprintf(stderr, "runguard: no command\n");
+        return 2;
+    }
+
+    pid_t pid = fork();
+    if (pid < 0) {
+        perror("runguard: fork");
+        return 2;
+    }
+    if (pid == 0) {
+        close(report_fd);
+        for (int i = 2; i < command; i++) {
+            if (apply_limit(argv[i]) != 0) {
+                fprintf(stderr, "runguard: bad limit %s\n", argv[i]);
+                _exit(126);
+            }
+        }
+        execvp(argv[command + 1], argv + command + 1);
+        fprintf(stderr, "runguard: %s: %s\n", argv[command + 1], strerror(errno));
+        _exit(127);
+    }
+
+    int status;
+    struct rusage usage;
+    while (wait4(pid, &status, 0, &usage) < 0) {
+        if (errno != EINTR) {
+            perror("runguard: wait4");
+            return 2;
+        }
+    }
+    int returncode = WIFSIGNALED(status) ? -WTERMSIG(status) : WEXITSTATUS(status);
+    long long cpu = (long long) (usage.ru_utime.tv_sec + usage.ru_stime.tv_sec) * 1000000
+                    + usage.ru_utime.tv_usec + usage.ru_stime.tv_usec;
+    dprintf(report_fd, "%d %lld %ld\n", returncode, cpu, usage.ru_maxrss);
+    return 0;
+}
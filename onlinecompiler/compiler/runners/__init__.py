@@ -0,0 +1,91 @@
+import copy
+import functools
+import json
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .base import LanguageRunner, UnsupportedLanguage
+
+# Compile profiles a challenge can pick for C++ (see LanguageRunner)
+CPP_PROFILES = {
+    "default": ["-O2", "-std=gnu++17"],
+    "c++14": ["-O2", "-std=gnu++14"],
+    "c++20": ["-O2", "-std=gnu++20"],
+    "debug": ["-O0", "-g", "-std=gnu++17"],
+}
+
+# The languages judged unless JUDGE_LANGUAGES is set; see LanguageRunner for the keys
+DEFAULT_LANGUAGES = {
+    "python": {
+        "source": "main.py",
+        "run": ["python", "{source}"],
+    },
+    "java": {
+        "source": "Main.java",
+        "compile": ["javac", "Main.java"],
+        "run": ["java", "-Xmx{memory}m", "-cp", "{workdir}", "Main"],  # Heap-capped instead of address space
+        "cap_address_space": False,
+        "runner": "compiler.runners.java.JavaRunner",  # Compiles on the javac server when enabled
+    },
+    "cpp": {
+        "source": "main.cpp",
+        "compile": ["g++", "{profile}", "main.cpp", "-o", "main.out"],
+        "run": ["{workdir}/main.out"],
+        "aliases": ["c++"],
+        "profiles": CPP_PROFILES,
+        "runner": "compiler.runners.cpp.CppRunner",  # Precompiles bits/stdc++.h per compiler and profile
+    },
+}
+
+
+def language_settings():
+    """``{name: options}`` of every language judged.
+
+    That is ``JUDGE_LANGUAGES`` when set, else a copy of ``DEFAULT_LANGUAGES``
+    with the entries of the JSON object in ``JUDGE_LANGUAGES_FILE`` (if any)
+    replacing or adding to them.
+    """
+    configured = getattr(settings, "JUDGE_LANGUAGES", None)
+    if configured is not None:
+        return configured
+    languages = copy.deepcopy(DEFAULT_LANGUAGES)
+    path = getattr(settings, "JUDGE_LANGUAGES_FILE", None)
+    if path:
+        with open(path) as f:
+            languages.update(json.load(f))
+    return languages
+
+
+@functools.lru_cache(maxsize=None)
+def get_registry():
+    """``{name or alias: LanguageRunner}`` for every language in ``language_settings()``.
+
+    A language's ``"runner"`` key names a ``LanguageRunner`` subclass to use
+    instead of the base class; every other key is passed to it.
+    """
+    registry = {}
+    for name, options in language_settings().items():
+        options = dict(options)
+        runner_class = import_string(options.pop("runner")) if "runner" in options else LanguageRunner
+        runner = runner_class(name, **options)
+        for key in (name, *runner.aliases):
+            registry[key.lower()] = runner
+    return registry
+
+
+def get_runner(language):
+    """The runner for ``language`` (a name or alias, any case; Python when empty)."""
+    runner = get_registry().get((language or "python").lower())
+    if runner is None:
+        raise UnsupportedLanguage(language)
+    return runner
+
+
+def languages():
+    return sorted({runner.name for runner in get_registry().values()})
+
+
+def profile_names():
+    """Every compile profile name some language defines."""
+    return sorted({name for runner in get_registry().values() for name in runner.profiles})
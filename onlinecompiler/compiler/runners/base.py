@@ -0,0 +1,281 @@
+import asyncio
+import contextlib
+import copy
+import os
+import subprocess
+
+from ..artifacts import artifact_key, get_artifact_cache
+from ..capture import arun_process, run_process, run_slots
+from ..limits import EXCEEDED_DISK_QUOTA, ResourceLimits, compile_timeout_result
+from ..runtimes import get_warm_pool
+from ..timing import phase
+from ..workdirs import directory_size, get_workdir_pool, link_tree
+
+
+class UnsupportedLanguage(Exception):
+    pass
+
+
+# ----- Compiled Program -----
+class CompiledProgram:
+    """A submission that has been built once and can be run against many inputs.
+
+    ``compile_result`` holds the compiler's stdout/stderr/returncode for
+    compiled languages and is ``None`` for interpreted ones. Every run is
+    held to ``limits``.
+    """
+
+    def __init__(self, runner, workdir, command, compile_result=None, limits=None):
+        self.runner = runner
+        self.language = runner.name
+        self.workdir = workdir
+        self.command = command
+        self.compile_result = compile_result
+        self.limits = limits or ResourceLimits.for_challenge()
+
+    @property
+    def compile_failed(self):
+        return self.compile_result is not None and self.compile_result["returncode"] != 0
+
+    def run(self, input_data, expected_output=None):
+        """Run once on ``input_data``; see ``capture.run_process`` for the result."""
+        return self.runner.run(self, input_data, expected_output)
+
+    async def arun(self, input_data, expected_output=None):
+        return await self.runner.arun(self, input_data, expected_output)
+
+    @contextlib.contextmanager
+    def scratch(self):
+        """This program in a work directory of its own for one run, holding links to the build's files.
+
+        A submission's test cases run at once; this way none sees the files
+        another writes, and each run's disk quota counts only its own.
+        """
+        workdir = get_workdir_pool().acquire()
+        try:
+            link_tree(self.workdir, workdir)
+            command = self.runner.expand(self.runner.run_command, workdir, self.limits)
+            yield CompiledProgram(self.runner, workdir, command, self.compile_result, self.limits)
+        finally:
+            self.runner.cleanup(workdir)
+
+    def cleanup(self):
+        self.runner.cleanup(self.workdir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+
+
+# ----- Runner -----
+class LanguageRunner:
+    """How to build and run one language, as configured in ``JUDGE_LANGUAGES``.
+
+    ``source`` is the file name the code is written to. ``compile`` and ``run``
+    are argument lists in which ``{workdir}``, ``{source}`` (its full path) and
+    ``{memory}`` (the memory limit in MB) are filled in; an argument that uses
+    ``{memory}`` is left out when memory is unlimited. An argument that is
+    exactly ``{profile}`` in ``compile`` becomes the flags of the compile
+    profile a challenge picked from ``profiles`` (``{name: [flags]}``), or of
+    the ``"default"`` one. The compiler runs inside the work directory and its
+    output is cached by the compile command with the profile filled in, so it
+    should name files relative to it. Runtimes that reserve far
+    more address space than they use (the JVM, Go) set ``cap_address_space``
+    to ``False`` and take their memory limit as a flag instead.
+
+    Subclass it and name the subclass as ``"runner"`` in the language's
+    settings for anything a command template can't express.
+    """
+
+    def __init__(self, name, source, run, compile=None, cap_address_space=True, aliases=(), profiles=None):
+        self.name = name
+        self.source = source
+        self.run_command = list(run)
+        self.compile_command = list(compile) if compile else None
+        self.cap_address_space = cap_address_space
+        self.aliases = tuple(aliases)
+        self.profiles = {name: list(flags) for name, flags in (profiles or {}).items()}
+
+    def expand(self, args, workdir, limits):
+        values = {
+            "workdir": workdir,
+            "source": os.path.join(workdir, self.source),
+            "memory": limits.memory,
+        }
+        return [arg.format(**values) for arg in args if limits.memory or "{memory}" not in arg]
+
+    def profile_flags(self, profile=None):
+        """Flags of the compile profile named ``profile``; the default profile's for any other name."""
+        if profile in self.profiles:
+            return self.profiles[profile]
+        return self.profiles.get("default", [])
+
+    def compile_args(self, profile=None):
+        """The ``compile`` template with ``{profile}`` replaced by the profile's flags."""
+        args = []
+        for arg in self.compile_command:
+            args.extend(self.profile_flags(profile) if arg == "{profile}" else [arg])
+        return args
+
+    def compile_argv(self, workdir, limits, profile=None):
+        """The compiler command line for one build."""
+        return self.expand(self.compile_args(profile), workdir, limits)
+
+    def prepare(self, code):
+        """An empty work directory from the pool, holding ``code`` as ``source``."""
+        workdir = get_workdir_pool().acquire()
+        try:
+            with phase("write"), open(os.path.join(workdir, self.source), "w") as f:
+                f.write(code)
+        except BaseException:
+            self.cleanup(workdir)
+            raise
+        return workdir
+
+    def compile(self, workdir, code, limits, profile=None):
+        """Build ``code`` in ``workdir``, reusing a cached build of identical input; ``None`` if interpreted."""
+        if self.compile_command is None:
+            return None
+        command = self.compile_argv(workdir, limits, profile)
+        cache = get_artifact_cache()
+        if cache is None:
+            return self.run_compiler(command, workdir)
+
+        key = artifact_key(self.name, self.compile_args(profile), code)
+        with phase("compile"):
+            compile_result = cache.fetch(key, workdir)
+        if compile_result is None:
+            compile_result = self.run_compiler(command, workdir)
+            if not compile_result.get("timed_out"):
+                with phase("compile"):
+                    cache.store(key, workdir, compile_result, exclude=[self.source])
+        return compile_result
+
+    async def acompile(self, workdir, code, limits, profile=None):
+        """``compile()`` with the compiler awaited; the cache's file copies go to a thread."""
+        if self.compile_command is None:
+            return None
+        command = self.compile_argv(workdir, limits, profile)
+        cache = get_artifact_cache()
+        if cache is None:
+            return await self.arun_compiler(command, workdir)
+
+        key = artifact_key(self.name, self.compile_args(profile), code)
+        with phase("compile"):
+            compile_result = await asyncio.to_thread(cache.fetch, key, workdir)
+        if compile_result is None:
+            compile_result = await self.arun_compiler(command, workdir)
+            if not compile_result.get("timed_out"):
+                with phase("compile"):
+                    await asyncio.to_thread(cache.store, key, workdir, compile_result, exclude=[self.source])
+        return compile_result
+
+    def run_compiler(self, command, workdir):
+        """Run the compiler ``command`` in ``workdir``; its stdout/stderr/returncode.
+
+        The compiler is held to ``ResourceLimits.for_compile()``. One that runs
+        out of time fails the build with ``timed_out`` set, and isn't cached.
+        """
+        return _compile(command, workdir)
+
+    async def arun_compiler(self, command, workdir):
+        return await _acompile(command, workdir)
+
+    def run(self, program, input_data, expected_output=None):
+        with program.scratch() as run:
+            pool = get_warm_pool(self.name)
+            if pool is not None and not run.compile_failed:
+                result = pool.run(run, input_data, run.limits, expected_output)
+            else:
+                result = run_process(run.command, input_data, run.limits.wall_time, cwd=run.workdir,
+                                     expected_output=expected_output, limits=run.limits)
+            return self.check_quota(run, result)
+
+    async def arun(self, program, input_data, expected_output=None):
+        """``run()`` for the event loop, holding one of ``capture.run_slots()`` while it executes."""
+        with program.scratch() as run:
+            async with run_slots():
+                pool = get_warm_pool(self.name)
+                if pool is not None and not run.compile_failed:
+                    # Warm runs are a request to a resident runtime, not a child of ours
+                    result = await asyncio.to_thread(pool.run, run, input_data, run.limits, expected_output)
+                else:
+                    result = await arun_process(run.command, input_data, run.limits.wall_time,
+                                                cwd=run.workdir, expected_output=expected_output,
+                                                limits=run.limits)
+            return self.check_quota(run, result)
+
+    def check_quota(self, program, result):
+        # Each file is already capped by RLIMIT_FSIZE; this catches many of them
+        quota = program.limits.disk_quota
+        if quota and "limit_exceeded" not in result and directory_size(program.workdir) > quota:
+            result["limit_exceeded"] = EXCEEDED_DISK_QUOTA
+            if "matched" in result:
+                result["matched"] = False
+        return result
+
+    def cleanup(self, workdir):
+        get_workdir_pool().release(workdir)
+
+    def limits_for(self, limits=None):
+        limits = limits or ResourceLimits.for_challenge()
+        if not self.cap_address_space and limits.cap_address_space:
+            limits = copy.copy(limits)
+            limits.cap_address_space = False
+        return limits
+
+    def build(self, code, limits=None, profile=None):
+        """Write and compile ``code`` under compile ``profile``; the caller owns the returned ``CompiledProgram``."""
+        limits = self.limits_for(limits)
+        workdir = self.prepare(code)
+        try:
+            compile_result = self.compile(workdir, code, limits, profile)
+            command = self.expand(self.run_command, workdir, limits)
+            return CompiledProgram(self, workdir, command, compile_result, limits)
+        except BaseException:
+            self.cleanup(workdir)
+            raise
+
+    async def abuild(self, code, limits=None, profile=None):
+        """``build()`` for the event loop; the compiler runs as an awaited child."""
+        limits = self.limits_for(limits)
+        workdir = self.prepare(code)
+        try:
+            compile_result = await self.acompile(workdir, code, limits, profile)
+            command = self.expand(self.run_command, workdir, limits)
+            return CompiledProgram(self, workdir, command, compile_result, limits)
+        except BaseException:
+            self.cleanup(workdir)
+            raise
+
+
+def _compile(command, workdir):
+    limits = ResourceLimits.for_compile()
+    with phase("compile"):
+        try:
+            result = run_process(command, "", limits.wall_time, cwd=workdir, limits=limits)
+        except subprocess.TimeoutExpired:
+            return compile_timeout_result(limits)
+    return _compile_result(result)
+
+
+async def _acompile(command, workdir):
+    limits = ResourceLimits.for_compile()
+    with phase("compile"):
+        async with run_slots():
+            try:
+                result = await arun_process(command, "", limits.wall_time, cwd=workdir, limits=limits)
+            except subprocess.TimeoutExpired:
+                return compile_timeout_result(limits)
+    return _compile_result(result)
+
+
+def _compile_result(result):
+    return {
+        "stdout": result["stdout"],
+        "stderr": result["stderr"],
+        "returncode": result["returncode"]
+    }
+
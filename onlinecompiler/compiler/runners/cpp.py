@@ -0,0 +1,168 @@
+import functools
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from django.conf import settings
+
+from .. import metrics
+from ..artifacts import toolchain_version
+from ..datadir import data_path, private_dir
+from .base import LanguageRunner
+
+logger = logging.getLogger(__name__)
+
+
+# ----- Precompiled Headers -----
+class PrecompiledHeaders:
+    """Precompiled standard headers, one set per compiler version and flags.
+
+    A set is a directory ``<root>/<key>`` holding ``<header>.gch`` for each
+    header and, next to it, a ``<header>`` that just ``#include_next``-s the
+    real one. Put first on the include path, it makes g++ load a submission's
+    leading ``#include <bits/stdc++.h>`` from the PCH instead of parsing it;
+    a submission whose flags don't match the PCH falls through to the real
+    header. Sets are built in the background the first time they are asked
+    for, staged under a temporary name and published with one ``rename``, so
+    no submission ever waits for one.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._building = set()
+        self._failed = set()
+
+    def _key(self, compiler, flags, headers):
+        digest = hashlib.sha256()
+        for part in (toolchain_version(compiler), *flags, "", *headers):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def lookup(self, compiler, flags, headers):
+        """The directory of the set for ``flags``, or ``None`` while it is being built (or can't be)."""
+        key = self._key(compiler, flags, headers)
+        path = os.path.join(self.root, key)
+        if os.path.isdir(path):
+            metrics.inc("judge_cache_requests_total", cache="pch", result="hit")
+            return path
+        metrics.inc("judge_cache_requests_total", cache="pch", result="miss")
+        with self._lock:
+            if key in self._building or key in self._failed:
+                return None
+            self._building.add(key)
+        threading.Thread(target=self._build_in_background, args=(key, compiler, flags, headers), daemon=True).start()
+        return None
+
+    def _build_in_background(self, key, compiler, flags, headers):
+        try:
+            self.build(compiler, flags, headers)
+        except Exception:
+            logger.exception("Could not precompile %s with %s", ", ".join(headers), " ".join(flags))
+            with self._lock:
+                self._failed.add(key)
+        finally:
+            with self._lock:
+                self._building.discard(key)
+
+    def build(self, compiler, flags, headers):
+        """Build the set for ``flags`` now unless it exists; return its directory."""
+        path = os.path.join(self.root, self._key(compiler, flags, headers))
+        if os.path.isdir(path):
+            return path
+        private_dir(self.root)
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.root)
+        try:
+            for header in headers:
+                target = os.path.join(staging, header)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                source = os.path.join(staging, ".source.h")
+                with open(source, "w") as f:
+                    f.write(f"#include <{header}>\n")
+                subprocess.run([compiler, *flags, "-x", "c++-header", source, "-o", target + ".gch"],
+                               check=True, capture_output=True)
+                with open(target, "w") as f:
+                    f.write(f"#include_next <{header}>\n")
+                os.unlink(source)
+            os.rename(staging, path)
+        except OSError:
+            # Another process published the same set first
+            shutil.rmtree(staging, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return path
+
+
+@functools.lru_cache(maxsize=None)
+def get_precompiled_headers():
+    """The process-wide set of precompiled headers, or ``None`` when disabled.
+
+    It is also disabled, with an error logged, when its directory isn't
+    private (see ``datadir.private_dir``): every C++ submission includes
+    the headers found there.
+    """
+    if not getattr(settings, "JUDGE_CPP_PCH_ENABLED", True):
+        return None
+    root = str(getattr(settings, "JUDGE_CPP_PCH_DIR", None) or data_path("pch"))
+    try:
+        private_dir(root)
+    except OSError:
+        logger.exception("C++ headers are not precompiled")
+        return None
+    return PrecompiledHeaders(root)
+
+
+# A forked worker has none of its parent's build threads
+os.register_at_fork(after_in_child=get_precompiled_headers.cache_clear)
+
+
+# ----- Runner -----
+def _pch_flags(args):
+    """The options of a compile command, without the compiler, its inputs and ``-o <output>``."""
+    flags = []
+    args = iter(args[1:])
+    for arg in args:
+        if arg == "-o":
+            next(args, None)
+        elif arg.startswith("-"):
+            flags.append(arg)
+    return flags
+
+
+class CppRunner(LanguageRunner):
+    """A g++-compatible toolchain that compiles with precompiled ``pch`` headers once they are built.
+
+    ``pch`` lists the headers to precompile (``bits/stdc++.h`` by default); a
+    set is built per compiler version and the options the compile command
+    ends up with, so every compile profile gets its own.
+    """
+
+    def __init__(self, name, source, run, pch=("bits/stdc++.h",), **options):
+        super().__init__(name, source, run, **options)
+        self.pch = tuple(pch)
+
+    def precompile(self, profile=None):
+        """Build the headers for ``profile`` now, rather than in the background on first use."""
+        headers = get_precompiled_headers()
+        if headers is None or not self.pch:
+            return None
+        args = self.compile_args(profile)
+        return headers.build(args[0], _pch_flags(args), self.pch)
+
+    def compile_argv(self, workdir, limits, profile=None):
+        command = super().compile_argv(workdir, limits, profile)
+        headers = get_precompiled_headers()
+        if headers is None or not self.pch:
+            return command
+        directory = headers.lookup(command[0], _pch_flags(self.compile_args(profile)), self.pch)
+        if directory is None:
+            return command
+        return [command[0], "-I", directory, *command[1:]]
@@ -0,0 +1,42 @@
+import logging
+import os
+
+from ..runtimes import get_javac_server
+from ..runtimes.javac import CompileServerError
+from ..timing import phase
+from .base import LanguageRunner
+
+logger = logging.getLogger(__name__)
+
+
+class JavaRunner(LanguageRunner):
+    """Sends ``javac`` builds to the shared compile server (``JUDGE_JAVAC_SERVER``).
+
+    The server saves a JVM start and a cold JIT per compile. Whenever it
+    can't answer, the build runs ``javac`` as a child like any other compiler.
+    """
+
+    def _server(self, command):
+        if os.path.basename(command[0]) != "javac":
+            return None
+        return get_javac_server()
+
+    def run_compiler(self, command, workdir):
+        server = self._server(command)
+        if server is not None:
+            try:
+                with phase("compile"):
+                    return server.compile(command, workdir)
+            except CompileServerError as e:
+                logger.warning("Compiling with plain javac: %s", e)
+        return super().run_compiler(command, workdir)
+
+    async def arun_compiler(self, command, workdir):
+        server = self._server(command)
+        if server is not None:
+            try:
+                with phase("compile"):
+                    return await server.acompile(command, workdir)
+            except CompileServerError as e:
+                logger.warning("Compiling with plain javac: %s", e)
+        return await super().arun_compiler(command, workdir)
@@ -0,0 +1,88 @@
+import java.io.*;
+import java.net.StandardProtocolFamily;
+import java.net.UnixDomainSocketAddress;
+import java.nio.channels.Channels;
+import java.nio.channels.ServerSocketChannel;
+import java.nio.channels.SocketChannel;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Path;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.TimeUnit;
+import javax.tools.JavaCompiler;
+import javax.tools.ToolProvider;
+
+/**
+ * Long-lived javac for compiler.runtimes.javac.JavacServer, listening on a
+ * UNIX socket, so submissions don't pay for a JVM start and a cold JIT on
+ * every compile.
+ *
+ * One compile per connection.
+ * Request:  int argumentCount, then each argument as int length + UTF-8 bytes
+ * Response: int exitCode, int stdoutLength, stdout, int stderrLength, stderr
+ *
+ * The arguments are javac's, with file paths already absolute: the server's
+ * working directory is not the submission's. Compiles run concurrently on a
+ * fixed number of threads. After maxCompiles connections the server stops
+ * accepting, finishes the compiles it has and exits, so the pool can recycle
+ * it. "ready" on stdout means the socket is listening.
+ */
+public class JavacServer {
+    public static void main(String[] args) throws IOException, InterruptedException {
+        Path socketPath = Path.of(args[0]);
+        int maxCompiles = Integer.parseInt(args[1]);
+        int threads = Integer.parseInt(args[2]);
+        JavaCompiler javac = ToolProvider.getSystemJavaCompiler();
+        if (javac == null) {
+            System.err.println("No system Java compiler; is this a JRE rather than a JDK?");
+            System.exit(1);
+        }
+
+        ExecutorService compiles = Executors.newFixedThreadPool(threads);
+        try (ServerSocketChannel server = ServerSocketChannel.open(StandardProtocolFamily.UNIX)) {
+            server.bind(UnixDomainSocketAddress.of(socketPath));
+            System.out.println("ready");
+            System.out.flush();
+            for (int i = 0; i < maxCompiles; i++) {
+                SocketChannel client = server.accept();
+                compiles.execute(() -> serve(javac, client));
+            }
+        } finally {
+            compiles.shutdown();
+            compiles.awaitTermination(10, TimeUnit.MINUTES);
+        }
+    }
+
+    private static void serve(JavaCompiler javac, SocketChannel client) {
+        try (client) {
+            DataInputStream in = new DataInputStream(new BufferedInputStream(Channels.newInputStream(client)));
+            String[] arguments = new String[in.readInt()];
+            for (int i = 0; i < arguments.length; i++) {
+                arguments[i] = new String(readBlock(in), StandardCharsets.UTF_8);
+            }
+
+            ByteArrayOutputStream stdout = new ByteArrayOutputStream();
+            ByteArrayOutputStream stderr = new ByteArrayOutputStream();
+            int exitCode = javac.run(null, stdout, stderr, arguments);
+
+            DataOutputStream out = new DataOutputStream(new BufferedOutputStream(Channels.newOutputStream(client)));
+            out.writeInt(exitCode);
+            writeBlock(out, stdout.toByteArray());
+            writeBlock(out, stderr.toByteArray());
+            out.flush();
+        } catch (IOException e) {
+            // The client went away; there is no one to answer
+        }
+    }
+
+    private static byte[] readBlock(DataInputStream in) throws IOException {
+        byte[] data = new byte[in.readInt()];
+        in.readFully(data);
+        return data;
+    }
+
+    private static void writeBlock(DataOutputStream out, byte[] data) throws IOException {
+        out.writeInt(data.length);
+        out.write(data);
+    }
+}
@@ -0,0 +1,224 @@
+import java.io.*;
+import java.lang.management.ManagementFactory;
+import java.lang.management.MemoryPoolMXBean;
+import java.lang.management.MemoryType;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.util.HashSet;
+import java.util.List;
+import java.util.Set;
+
+/**
+ * Persistent JVM for warm Java submission runs, driven by
+ * compiler.runtimes.pools.JvmPool over this process's stdin/stdout.
+ *
+ * Request frame:  int classpathLength, classpath (UTF-8), int stdinLength, stdin bytes
+ * Response frame: byte kind, boolean clean, int exitCode, long cpuNanos, long peakHeapBytes,
+ *                 int stdoutLength, stdout, int stderrLength, stderr
+ *
+ * kind is 0 when Main.main returned or threw, 1 when the submission called
+ * System.exit (the exit code is then the JVM's own and the runner is gone), 2
+ * when the run was stopped for writing more than outputLimit bytes to a stream
+ * and 3 when it ran out of heap (-Xmx, the run's memory limit). clean is true
+ * only when main returned and no thread the run started is still alive; the
+ * pool replaces the runner otherwise, so nothing a run leaves behind (threads
+ * still writing to System.out, a half-thrown Error) reaches the next one.
+ * cpuNanos is the process's CPU time during the run and peakHeapBytes the
+ * heap's high-water mark, taken after a GC so it starts from this runner's own
+ * objects. Every run loads Main through a fresh class loader so static state
+ * never leaks between submissions. The runner exits after maxRuns runs so the
+ * pool can recycle it.
+ */
+public class WarmRunner {
+    private static final int RETURNED = 0;
+    private static final int EXITED = 1;
+    private static final int OUTPUT_LIMIT = 2;
+    private static final int OUT_OF_MEMORY = 3;
+    // What runOnce returns when main threw or couldn't be loaded; not a frame kind
+    private static final int FAILED = -1;
+
+    private static final DataOutputStream control =
+        new DataOutputStream(new BufferedOutputStream(new FileOutputStream(FileDescriptor.out)));
+    private static final Object lock = new Object();
+    private static final com.sun.management.OperatingSystemMXBean os =
+        (com.sun.management.OperatingSystemMXBean) ManagementFactory.getOperatingSystemMXBean();
+    private static final List<MemoryPoolMXBean> pools = ManagementFactory.getMemoryPoolMXBeans();
+    private static ByteArrayOutputStream runOut;
+    private static ByteArrayOutputStream runErr;
+    private static long runCpuStart;
+    private static int outputLimit;
+    private static volatile boolean limitHit;
+
+    /** Thrown into the submission from a write that would exceed the output limit. */
+    private static class OutputLimitExceeded extends Error {
+        OutputLimitExceeded() {
+            super("Output limit exceeded", null, false, false);
+        }
+    }
+
+    /** Keeps at most outputLimit bytes and stops the run on the first byte past it. */
+    private static class LimitedOutput extends ByteArrayOutputStream {
+        @Override
+        public synchronized void write(int b) {
+            write(new byte[] {(byte) b}, 0, 1);
+        }
+
+        @Override
+        public synchronized void write(byte[] b, int off, int len) {
+            int room = outputLimit - count;
+            if (len > room) {
+                super.write(b, off, Math.max(room, 0));
+                limitHit = true;
+                throw new OutputLimitExceeded();
+            }
+            super.write(b, off, len);
+        }
+    }
+
+    public static void main(String[] args) throws IOException {
+        int maxRuns = Integer.parseInt(args[0]);
+        outputLimit = Integer.parseInt(args[1]);
+        DataInputStream requests =
+            new DataInputStream(new BufferedInputStream(new FileInputStream(FileDescriptor.in)));
+
+        // Nothing but response frames may reach the real stdout
+        PrintStream discard = new PrintStream(OutputStream.nullOutputStream());
+        System.setOut(discard);
+        System.setErr(discard);
+        Runtime.getRuntime().addShutdownHook(new Thread(WarmRunner::reportExit));
+
+        for (int i = 0; i < maxRuns; i++) {
+            String classpath;
+            byte[] stdin;
+            try {
+                classpath = new String(readBlock(requests), StandardCharsets.UTF_8);
+                stdin = readBlock(requests);
+            } catch (EOFException e) {
+                return;
+            }
+
+            ByteArrayOutputStream out = new LimitedOutput();
+            ByteArrayOutputStream err = new LimitedOutput();
+            limitHit = false;
+            System.gc();
+            for (MemoryPoolMXBean pool : pools) {
+                pool.resetPeakUsage();
+            }
+            Set<Thread> before = new HashSet<>(Thread.getAllStackTraces().keySet());
+            synchronized (lock) {
+                runOut = out;
+                runErr = err;
+                runCpuStart = os.getProcessCpuTime();
+            }
+            int outcome = runOnce(classpath, stdin, out, err);
+            boolean clean = outcome == RETURNED && !leftThreads(before);
+            int kind = limitHit ? OUTPUT_LIMIT : outcome == OUT_OF_MEMORY ? OUT_OF_MEMORY : RETURNED;
+            synchronized (lock) {
+                respond(kind, clean, outcome == RETURNED ? 0 : 1);
+                runOut = null;
+                runErr = null;
+            }
+            if (!clean) {
+                // The pool won't send another run; leftover threads must not outlive the frame
+                Runtime.getRuntime().halt(0);
+            }
+            System.setOut(discard);
+            System.setErr(discard);
+            System.setIn(InputStream.nullInputStream());
+        }
+    }
+
+    /** RETURNED when main returned, OUT_OF_MEMORY when it ran out of heap, else FAILED. */
+    private static int runOnce(String classpath, byte[] stdin, ByteArrayOutputStream out, ByteArrayOutputStream err) {
+        System.setIn(new ByteArrayInputStream(stdin));
+        System.setOut(new PrintStream(out, true));
+        System.setErr(new PrintStream(err, true));
+        URL[] urls;
+        try {
+            urls = new URL[] {new File(classpath).toURI().toURL()};
+        } catch (IOException e) {
+            System.err.println("Error: Could not find or load main class Main");
+            return FAILED;
+        }
+        try (URLClassLoader loader = new URLClassLoader(urls, ClassLoader.getPlatformClassLoader())) {
+            Method main = loader.loadClass("Main").getMethod("main", String[].class);
+            main.invoke(null, (Object) new String[0]);
+            return RETURNED;
+        } catch (InvocationTargetException e) {
+            if (limitHit) {
+                return FAILED;
+            }
+            System.err.print("Exception in thread \"main\" ");
+            e.getCause().printStackTrace();
+            return e.getCause() instanceof OutOfMemoryError ? OUT_OF_MEMORY : FAILED;
+        } catch (ReflectiveOperationException | LinkageError e) {
+            System.err.println("Error: Could not find or load main class Main");
+            System.err.println("Caused by: " + e);
+            return FAILED;
+        } catch (IOException e) {
+            return RETURNED;
+        } finally {
+            System.out.flush();
+            System.err.flush();
+        }
+    }
+
+    private static boolean leftThreads(Set<Thread> before) {
+        for (Thread thread : Thread.getAllStackTraces().keySet()) {
+            if (thread.isAlive() && !before.contains(thread)) {
+                return true;
+            }
+        }
+        return false;
+    }
+
+    private static long peakHeap() {
+        long peak = 0;
+        for (MemoryPoolMXBean pool : pools) {
+            if (pool.getType() == MemoryType.HEAP && pool.getPeakUsage() != null) {
+                peak += pool.getPeakUsage().getUsed();
+            }
+        }
+        return peak;
+    }
+
+    // Runs on System.exit: hand back whatever the submission printed before exiting
+    private static void reportExit() {
+        synchronized (lock) {
+            if (runOut == null) {
+                return;
+            }
+            // No System.out.flush() here: the exiting thread may hold its lock.
+            // PrintStream hands every print to the underlying buffer anyway.
+            try {
+                respond(EXITED, false, 0);
+            } catch (IOException ignored) {
+            }
+        }
+    }
+
+    private static void respond(int kind, boolean clean, int exitCode) throws IOException {
+        control.writeByte(kind);
+        control.writeBoolean(clean);
+        control.writeInt(exitCode);
+        control.writeLong(os.getProcessCpuTime() - runCpuStart);
+        control.writeLong(peakHeap());
+        writeBlock(runOut.toByteArray());
+        writeBlock(runErr.toByteArray());
+        control.flush();
+    }
+
+    private static byte[] readBlock(DataInputStream in) throws IOException {
+        byte[] data = new byte[in.readInt()];
+        in.readFully(data);
+        return data;
+    }
+
+    private static void writeBlock(byte[] data) throws IOException {
+        control.writeInt(data.length);
+        control.write(data);
+    }
+}
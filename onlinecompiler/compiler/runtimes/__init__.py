@@ -0,0 +1,63 @@
+import atexit
+import os
+import threading
+
+from django.conf import settings
+
+from .javac import JavacServer
+from .pools import ForkServerPool, JvmPool
+
+# Pre-warmed runners are opt-in per language through JUDGE_WARM_RUNTIMES,
+# e.g. {"python": {"max_runs": 500}, "java": {"size": 2, "max_runs": 100}}.
+POOL_CLASSES = {
+    "python": ForkServerPool,
+    "java": JvmPool,
+}
+
+_pools = {}
+_javac_server = None
+_lock = threading.Lock()
+
+
+def get_warm_pool(language):
+    """The process-wide warm pool for ``language``, or ``None`` to run it cold."""
+    options = getattr(settings, "JUDGE_WARM_RUNTIMES", {}).get(language)
+    if options is None or language not in POOL_CLASSES:
+        return None
+    with _lock:
+        if language not in _pools:
+            _pools[language] = POOL_CLASSES[language](**options)
+        return _pools[language]
+
+
+def get_javac_server():
+    """The process-wide javac compile server, or ``None`` when ``JUDGE_JAVAC_SERVER`` is off."""
+    global _javac_server
+    if not getattr(settings, "JUDGE_JAVAC_SERVER", False):
+        return None
+    with _lock:
+        if _javac_server is None:
+            _javac_server = JavacServer(max_compiles=getattr(settings, "JUDGE_JAVAC_SERVER_MAX_COMPILES", 500))
+        return _javac_server
+
+
+def _forget_parent_javac_server():
+    # A forked worker starts its own rather than sharing (and killing) its parent's
+    global _javac_server, _lock
+    _javac_server = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_parent_javac_server)
+
+
+@atexit.register
+def close_warm_pools():
+    global _javac_server
+    with _lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+        if _javac_server is not None:
+            _javac_server.close()
+            _javac_server = None
@@ -0,0 +1,161 @@
+"""Python fork-server for warm submission runs.
+
+Started by ``compiler.runtimes.pools.ForkServerPool`` as::
+
+    python forkserver.py <socket path> <max runs>
+
+It preloads commonly used modules once, then forks a fresh child per run so
+every submission starts from the same warm interpreter state without paying
+interpreter startup. This file runs outside Django and must only use the
+standard library.
+
+Protocol, one connection per run: the client sends a JSON header
+``{"script": ..., "cwd": ..., "rlimits": [[name, soft, hard], ...]}`` together
+with three file descriptors (stdin, stdout, stderr) via ``SCM_RIGHTS``. The
+server answers with one JSON line ``{"pid": ...}`` once the child is forked
+and another ``{"returncode": ..., "cpu_time": ..., "peak_memory_kb": ...}``
+when it exits. ``peak_memory_kb`` is what the child added to the server's
+resident set it started with, i.e. the submission's own. After ``max runs`` forks the server stops accepting and exits
+once its children are done, so the pool can recycle it.
+"""
+import json
+import os
+import resource
+import runpy
+import socket
+import sys
+import threading
+import traceback
+
+PRELOAD = (
+    "array", "bisect", "collections", "copy", "decimal", "fractions", "functools",
+    "heapq", "itertools", "math", "operator", "random", "re", "string", "typing",
+)
+
+
+def _exit_code(exc):
+    code = exc.code
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _child(request, fds):
+    code = 1
+    try:
+        os.setsid()
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+        # Drop everything else inherited from the server, including other
+        # runs' connections and pipes
+        for name in os.listdir("/proc/self/fd"):
+            fd = int(name)
+            if fd > 2:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+
+        for name, soft, hard in request.get("rlimits", ()):
+            resource.setrlimit(getattr(resource, "RLIMIT_" + name), (soft, hard))
+
+        script = request["script"]
+        os.chdir(request["cwd"])
+        sys.argv = [script]
+        sys.path[0] = os.path.dirname(script)
+        try:
+            runpy.run_path(script, run_name="__main__")
+            code = 0
+        except SystemExit as e:
+            code = _exit_code(e)
+        except BaseException as e:
+            # Hide the fork-server and runpy frames, as a plain `python main.py` would
+            tb = e.__traceback__
+            while tb is not None and tb.tb_frame.f_code.co_filename != script:
+                tb = tb.tb_next
+            traceback.print_exception(type(e), e, tb)
+            code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def _resident_kb():
+    """This process's resident set size now, in KB."""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _reap(conn, pid, inherited_kb):
+    # ru_maxrss counts the pages shared with the server since the fork too
+    _, wait_status, usage = os.wait4(pid, 0)
+    reply = {
+        "returncode": os.waitstatus_to_exitcode(wait_status),
+        "cpu_time": usage.ru_utime + usage.ru_stime,
+        "peak_memory_kb": max(usage.ru_maxrss - inherited_kb, 0)
+    }
+    try:
+        conn.sendall(json.dumps(reply).encode() + b"\n")
+    except OSError:
+        pass
+    finally:
+        conn.close()
+
+
+def main():
+    path, max_runs = sys.argv[1], int(sys.argv[2])
+    for module in PRELOAD:
+        __import__(module)
+    # Children inherit every reaper's stack mapping, which counts against their
+    # address-space limit
+    threading.stack_size(256 * 1024)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(64)
+    sys.stdout.write("ready\n")
+    sys.stdout.flush()
+
+    reapers = []
+    for _ in range(max_runs):
+        conn, _ = listener.accept()
+        try:
+            header, fds, _, _ = socket.recv_fds(conn, 65536, 3)
+            request = json.loads(header)
+        except (OSError, ValueError):
+            conn.close()
+            continue
+        if len(fds) != 3:
+            for fd in fds:
+                os.close(fd)
+            conn.close()
+            continue
+
+        inherited_kb = _resident_kb()
+        pid = os.fork()
+        if pid == 0:
+            _child(request, fds)
+        for fd in fds:
+            os.close(fd)
+        conn.sendall(json.dumps({"pid": pid}).encode() + b"\n")
+        reaper = threading.Thread(target=_reap, args=(conn, pid, inherited_kb), daemon=True)
+        reaper.start()
+        reapers.append(reaper)
+
+    listener.close()
+    os.unlink(path)
+    for reaper in reapers:
+        reaper.join()
+
+
+if __name__ == "__main__":
+    main()
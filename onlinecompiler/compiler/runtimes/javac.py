@@ -0,0 +1,205 @@
+import asyncio
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+
+from ..limits import ResourceLimits, compile_timeout_result
+from .pools import runtime_classpath
+
+# javac options whose value is a path, or a list of them, relative to the work directory
+PATH_OPTIONS = {
+    "-d", "-s", "-h", "-cp", "-classpath", "--class-path", "-sourcepath", "--source-path",
+    "-p", "--module-path",
+}
+
+# Seconds a server that wouldn't start is left alone before trying again
+RETRY_AFTER = 60
+
+
+class CompileServerError(Exception):
+    """The compile server couldn't give a result; compile with plain ``javac`` instead."""
+
+
+def absolute_args(args, workdir):
+    """javac arguments with the relative paths in them made absolute against ``workdir``."""
+    result = []
+    takes_path = False
+    for arg in args:
+        if takes_path:
+            arg = os.pathsep.join(os.path.join(workdir, part) for part in arg.split(os.pathsep))
+            takes_path = False
+        elif arg in PATH_OPTIONS:
+            takes_path = True
+        elif arg.endswith(".java"):
+            arg = os.path.join(workdir, arg)
+        result.append(arg)
+    return result
+
+
+def _request(command, workdir):
+    args = [arg.encode() for arg in absolute_args(command[1:], workdir)]
+    return struct.pack(">i", len(args)) + b"".join(struct.pack(">i", len(arg)) + arg for arg in args)
+
+
+def _result(exit_code, stdout, stderr):
+    return {
+        "stdout": stdout.decode(errors="replace"),
+        "stderr": stderr.decode(errors="replace"),
+        "returncode": exit_code
+    }
+
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise EOFError("javac server closed the connection.")
+    return data
+
+
+class JavacServer:
+    """One long-lived JVM compiling Java submissions in-process (``JavacServer.java``).
+
+    Every compile is a connection to its UNIX socket, so any number of threads
+    (or event loops) can compile at once; the server runs ``threads`` of them
+    in parallel. It is replaced after ``max_compiles`` compiles. A compile
+    that takes longer than ``JUDGE_COMPILE_TIMEOUT`` (see
+    ``ResourceLimits.for_compile``) gets the server killed and fails as timed
+    out, like a plain ``javac`` would. A server that dies mid-compile is
+    replaced and the compile retried once on a fresh one; after that, or when
+    no server will start, ``compile`` raises ``CompileServerError`` and the
+    caller falls back to running ``javac``.
+    """
+
+    def __init__(self, max_compiles=500, threads=None):
+        self.max_compiles = max_compiles
+        self.threads = threads or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._server = None
+        self._socket_path = None
+        self._served = 0
+        self._retired = []
+        self._failed_at = None
+
+    def _start(self):
+        # Recycled servers exit on their own once their last compile is done;
+        # one still around long after that is waiting for a client that never came
+        now = time.monotonic()
+        timeout = ResourceLimits.for_compile().wall_time
+        for server, retired_at in self._retired:
+            if server.poll() is None and now - retired_at > timeout:
+                server.kill()
+                server.wait()
+        self._retired = [(server, retired_at) for server, retired_at in self._retired if server.poll() is None]
+        if self._server is not None:
+            self._retired.append((self._server, now))
+            shutil.rmtree(os.path.dirname(self._socket_path), ignore_errors=True)
+            self._server = None
+
+        sock_dir = tempfile.mkdtemp(prefix="judge-javac-")
+        socket_path = os.path.join(sock_dir, "javac.sock")
+        server = subprocess.Popen(
+            ["java", "-XX:+UseSerialGC", "-cp", runtime_classpath("JavacServer"), "JavacServer",
+             socket_path, str(self.max_compiles), str(self.threads)],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        if server.stdout.readline().strip() != b"ready":
+            server.kill()
+            server.wait()
+            shutil.rmtree(sock_dir, ignore_errors=True)
+            raise CompileServerError("javac server failed to start.")
+        self._server = server
+        self._socket_path = socket_path
+        self._served = 0
+
+    def _checkout(self):
+        """``(server, socket path)`` to send the next compile to, starting a server if needed."""
+        with self._lock:
+            if self._failed_at is not None and time.monotonic() - self._failed_at < RETRY_AFTER:
+                raise CompileServerError("javac server is unavailable.")
+            if self._server is None or self._server.poll() is not None or self._served >= self.max_compiles:
+                try:
+                    self._start()
+                except (OSError, subprocess.SubprocessError, CompileServerError) as e:
+                    self._failed_at = time.monotonic()
+                    raise CompileServerError(f"javac server failed to start: {e}") from e
+                self._failed_at = None
+            self._served += 1
+            return self._server, self._socket_path
+
+    def _discard(self, server):
+        # Only the server that failed; another thread may have replaced it already
+        with self._lock:
+            if self._server is server:
+                server.kill()
+                server.wait()
+                shutil.rmtree(os.path.dirname(self._socket_path), ignore_errors=True)
+                self._server = None
+
+    def compile(self, command, workdir):
+        """What ``subprocess.run(command, cwd=workdir)`` of javac would give, as a compile result."""
+        request = _request(command, workdir)
+        limits = ResourceLimits.for_compile()
+        for _ in range(2):
+            server, socket_path = self._checkout()
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.settimeout(limits.wall_time)
+                    sock.connect(socket_path)
+                    sock.sendall(request)
+                    with sock.makefile("rb") as replies:
+                        (exit_code,) = struct.unpack(">i", _read_exact(replies, 4))
+                        stdout = _read_exact(replies, struct.unpack(">i", _read_exact(replies, 4))[0])
+                        stderr = _read_exact(replies, struct.unpack(">i", _read_exact(replies, 4))[0])
+                return _result(exit_code, stdout, stderr)
+            except TimeoutError:
+                # Still compiling this source; it would do the same on a fresh server or in javac
+                self._discard(server)
+                return compile_timeout_result(limits)
+            except (OSError, EOFError):
+                # Died or was killed under us: replace it and try once more
+                self._discard(server)
+        raise CompileServerError("javac server failed twice in a row.")
+
+    async def acompile(self, command, workdir):
+        """``compile()`` for the event loop; a server start goes to a thread."""
+        request = _request(command, workdir)
+        limits = ResourceLimits.for_compile()
+
+        async def exchange(socket_path):
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+            try:
+                writer.write(request)
+                await writer.drain()
+                (exit_code,) = struct.unpack(">i", await reader.readexactly(4))
+                stdout = await reader.readexactly(struct.unpack(">i", await reader.readexactly(4))[0])
+                stderr = await reader.readexactly(struct.unpack(">i", await reader.readexactly(4))[0])
+            finally:
+                writer.close()
+            return _result(exit_code, stdout, stderr)
+
+        for _ in range(2):
+            server, socket_path = await asyncio.to_thread(self._checkout)
+            try:
+                return await asyncio.wait_for(exchange(socket_path), limits.wall_time)
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(self._discard, server)
+                return compile_timeout_result(limits)
+            except (OSError, EOFError):
+                await asyncio.to_thread(self._discard, server)
+        raise CompileServerError("javac server failed twice in a row.")
+
+    def close(self):
+        with self._lock:
+            for server in [self._server, *(server for server, _ in self._retired)]:
+                if server is not None and server.poll() is None:
+                    server.kill()
+                    server.wait()
+            if self._socket_path:
+                shutil.rmtree(os.path.dirname(self._socket_path), ignore_errors=True)
+            self._server = None
+            self._retired = []
@@ -0,0 +1,320 @@
+import json
+import os
+import queue
+import selectors
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+
+from ..artifacts import toolchain_version
+from ..capture import (
+    PumpResult, StreamCapture, STOPPED_OUTPUT_LIMIT, STOPPED_TIMEOUT, as_matcher, output_limit, pump
+)
+from ..datadir import data_path, private_dir
+from ..limits import EXCEEDED_CPU_TIME, EXCEEDED_MEMORY, usage_dict
+
+RUNTIME_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def runtime_classpath(name):
+    """Directory holding ``<name>.class``, compiled from this package's ``<name>.java`` once per JDK.
+
+    Like runguard, the classes live in the judge's private data directory.
+    """
+    version = toolchain_version("javac").replace(" ", "_").replace("/", "_")
+    classpath = private_dir(data_path("runtimes", version))
+    if not os.path.exists(os.path.join(classpath, f"{name}.class")):
+        subprocess.run(
+            ["javac", "-d", classpath, os.path.join(RUNTIME_DIR, f"{name}.java")],
+            check=True, capture_output=True
+        )
+    return classpath
+
+
+# ----- Python -----
+class ForkServerPool:
+    """Runs Python submissions in children forked from a pre-warmed interpreter.
+
+    One fork-server handles any number of concurrent runs; it is replaced after
+    ``max_runs`` forks (or if it dies), which bounds how long any one
+    interpreter image lives.
+    """
+
+    def __init__(self, max_runs=500):
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+        self._server = None
+        self._socket_path = None
+        self._served = 0
+
+    def _start(self):
+        if self._socket_path:
+            # The old server's listening socket; its runs in flight are connected already
+            shutil.rmtree(os.path.dirname(self._socket_path), ignore_errors=True)
+        sock_dir = tempfile.mkdtemp(prefix="judge-forkserver-")
+        self._socket_path = os.path.join(sock_dir, "fork.sock")
+        self._server = subprocess.Popen(
+            ["python", os.path.join(RUNTIME_DIR, "forkserver.py"), self._socket_path, str(self.max_runs)],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE
+        )
+        if self._server.stdout.readline().strip() != b"ready":
+            raise RuntimeError("Python fork-server failed to start.")
+        self._served = 0
+
+    def _connect(self):
+        with self._lock:
+            if self._server is None or self._server.poll() is not None or self._served >= self.max_runs:
+                # A recycled server finishes its in-flight runs and exits on its own
+                self._start()
+            self._served += 1
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self._socket_path)
+            return sock
+
+    def run(self, program, input_data, limits, expected_output=None):
+        timeout = limits.wall_time
+        script = os.path.join(program.workdir, program.runner.source)
+        matcher = as_matcher(expected_output)
+        if hasattr(input_data, "fileno"):
+            stdin_file = None
+            stdin_fd = input_data.fileno()
+        else:
+            stdin_file = tempfile.TemporaryFile()
+            stdin_file.write((input_data or "").encode())
+            stdin_file.seek(0)
+            stdin_fd = stdin_file.fileno()
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        started = time.monotonic()
+        deadline = started + timeout
+        sock = None
+        try:
+            sock = self._connect()
+            header = json.dumps({"script": script, "cwd": program.workdir, "rlimits": limits.rlimits()}).encode()
+            socket.send_fds(sock, [header], [stdin_fd, out_w, err_w])
+            # The child holds the write ends now; ours must go for EOF to arrive
+            os.close(out_w)
+            os.close(err_w)
+            out_w = err_w = None
+
+            replies = sock.makefile("rb")
+            pid = json.loads(replies.readline())["pid"]
+
+            def kill():
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+            outcome = pump(out_r, err_r, deadline, kill, matcher=matcher)
+            if outcome.stopped == STOPPED_TIMEOUT:
+                raise subprocess.TimeoutExpired(["python", script], timeout)
+            exit_status = json.loads(replies.readline())
+            returncode = exit_status["returncode"]
+            usage = usage_dict(exit_status["cpu_time"], time.monotonic() - started, exit_status["peak_memory_kb"])
+            return outcome.to_result(returncode, matcher, usage, limits.exceeded(returncode, usage))
+        finally:
+            for fd in (out_r, err_r, out_w, err_w):
+                if fd is not None:
+                    os.close(fd)
+            if stdin_file is not None:
+                stdin_file.close()
+            if sock is not None:
+                sock.close()
+
+    def close(self):
+        with self._lock:
+            if self._server is not None and self._server.poll() is None:
+                self._server.kill()
+                self._server.wait()
+            if self._socket_path:
+                shutil.rmtree(os.path.dirname(self._socket_path), ignore_errors=True)
+
+
+# ----- Java -----
+# WarmRunner's response kinds
+RETURNED, EXITED, OUTPUT_LIMIT, OUT_OF_MEMORY = range(4)
+
+# Seconds between checks of a warm JVM's CPU time while it runs a submission
+CPU_POLL_INTERVAL = 0.05
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+class _FrameTimeout(Exception):
+    pass
+
+
+class _CpuTimeExceeded(Exception):
+    pass
+
+
+class JvmRunner:
+    """One persistent JVM running ``WarmRunner``; serves a single run at a time.
+
+    The heap is capped at ``memory`` MB, so a runner only takes runs with that
+    memory limit. A run's CPU time is the JVM's during the run: it is watched
+    from here, and a run over its limit is stopped by killing the JVM. A run
+    that doesn't leave the JVM clean (it threw, exited, hit a limit or left
+    threads running) is its last; see ``WarmRunner.java``.
+    """
+
+    def __init__(self, classpath, max_runs, memory=None):
+        self.max_runs = max_runs
+        self.memory = memory
+        self.runs = 0
+        self.clean = True
+        command = ["java", "-XX:+UseSerialGC", "-cp", classpath, "WarmRunner", str(max_runs), str(output_limit())]
+        if memory:
+            command[1:1] = [f"-Xmx{memory}m"]
+        self.proc = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+
+    @property
+    def usable(self):
+        return self.clean and self.proc.poll() is None and self.runs < self.max_runs
+
+    def _cpu_time(self):
+        """Seconds of CPU the JVM has used, from ``/proc``."""
+        with open(f"/proc/{self.proc.pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+    def _read_exact(self, size, deadline, cpu_deadline=None):
+        fd = self.proc.stdout.fileno()
+        data = b""
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            while len(data) < size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise _FrameTimeout()
+                if not selector.select(min(remaining, CPU_POLL_INTERVAL)):
+                    try:
+                        if cpu_deadline is not None and self._cpu_time() > cpu_deadline:
+                            raise _CpuTimeExceeded()
+                    except OSError:
+                        pass  # Gone; the next read sees EOF
+                    continue
+                chunk = os.read(fd, size - len(data))
+                if not chunk:
+                    raise EOFError("Warm JVM exited unexpectedly.")
+                data += chunk
+        return data
+
+    def _read_frame(self, deadline, cpu_deadline):
+        # The CPU budget only applies while the submission runs, before the first byte
+        header = self._read_exact(26, deadline, cpu_deadline)
+        kind, clean, exit_code, cpu_nanos, peak_heap, out_len = struct.unpack(">b?iqqi", header)
+        stdout = self._read_exact(out_len, deadline)
+        (err_len,) = struct.unpack(">i", self._read_exact(4, deadline))
+        stderr = self._read_exact(err_len, deadline)
+        return kind, clean, exit_code, cpu_nanos / 1e9, peak_heap // 1024, stdout, stderr
+
+    def run(self, classpath, input_data, limits, expected_output=None):
+        self.runs += 1
+        matcher = as_matcher(expected_output)
+        cpu_start = self._cpu_time()
+        path = classpath.encode()
+        self.proc.stdin.write(struct.pack(">i", len(path)) + path)
+        if hasattr(input_data, "fileno"):
+            # Streamed into the frame; the JVM buffers it for the run
+            self.proc.stdin.write(struct.pack(">i", os.fstat(input_data.fileno()).st_size))
+            shutil.copyfileobj(input_data, self.proc.stdin)
+        else:
+            stdin = (input_data or "").encode()
+            self.proc.stdin.write(struct.pack(">i", len(stdin)) + stdin)
+        self.proc.stdin.flush()
+
+        started = time.monotonic()
+        deadline = started + limits.wall_time
+        try:
+            kind, clean, exit_code, cpu_time, peak_memory_kb, stdout, stderr = self._read_frame(
+                deadline, None if limits.cpu_time is None else cpu_start + limits.cpu_time)
+        except _FrameTimeout:
+            self.kill()
+            raise subprocess.TimeoutExpired(["java", "-cp", classpath, "Main"], limits.wall_time)
+        except _CpuTimeExceeded:
+            cpu_time = self._cpu_time() - cpu_start
+            self.kill()
+            # Its output went down with the JVM, unread
+            usage = usage_dict(cpu_time, time.monotonic() - started)
+            return PumpResult(StreamCapture(), StreamCapture()).to_result(
+                -signal.SIGKILL, matcher, usage, EXCEEDED_CPU_TIME)
+        self.clean = clean
+        if kind == EXITED:
+            # The submission called System.exit and took the JVM with it
+            try:
+                exit_code = self.proc.wait(max(deadline - time.monotonic(), 1))
+            except subprocess.TimeoutExpired:
+                # Stuck in a shutdown hook of its own
+                self.kill()
+                raise subprocess.TimeoutExpired(["java", "-cp", classpath, "Main"], limits.wall_time)
+
+        # The JVM buffers a run's output (capped at the output limit), so it is
+        # captured and matched after the fact rather than streamed
+        out, err = StreamCapture(), StreamCapture()
+        out.feed(stdout)
+        err.feed(stderr)
+        if matcher is not None:
+            matcher.feed(stdout)
+        stopped = STOPPED_OUTPUT_LIMIT if kind == OUTPUT_LIMIT else None
+        usage = usage_dict(cpu_time, time.monotonic() - started, peak_memory_kb)
+        exceeded = EXCEEDED_MEMORY if kind == OUT_OF_MEMORY else limits.exceeded(exit_code, usage)
+        return PumpResult(out, err, stopped).to_result(exit_code, matcher, usage, exceeded)
+
+    def kill(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+
+
+class JvmPool:
+    """A fixed number of persistent JVMs, each checked out by one run at a time.
+
+    Runners are replaced after ``max_runs`` runs, after any run that doesn't
+    leave them clean (see ``JvmRunner``), and for a run with another memory
+    limit than theirs.
+    """
+
+    def __init__(self, size=2, max_runs=100):
+        self.size = size
+        self.max_runs = max_runs
+        self._classpath = None
+        self._lock = threading.Lock()
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(None)  # Started lazily on first checkout
+
+    def _runner_classpath(self):
+        with self._lock:
+            if self._classpath is None:
+                self._classpath = runtime_classpath("WarmRunner")
+            return self._classpath
+
+    def run(self, program, input_data, limits, expected_output=None):
+        runner = self._idle.get()
+        try:
+            if runner is None or not runner.usable or runner.memory != limits.memory:
+                if runner is not None:
+                    runner.kill()
+                runner = JvmRunner(self._runner_classpath(), self.max_runs, limits.memory)
+            return runner.run(program.workdir, input_data, limits, expected_output)
+        finally:
+            if runner is not None and not runner.usable:
+                runner.kill()
+                runner = None
+            self._idle.put(runner)
+
+    def close(self):
+        for _ in range(self.size):
+            runner = self._idle.get()
+            if runner is not None:
+                runner.kill()
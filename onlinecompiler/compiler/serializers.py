@@ -1,6 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Submission, CodingChallenge, ChallengeSolution, UserProfile
+from django.db import transaction
+from .models import Submission, CodingChallenge, ChallengeSolution, UserProfile, JudgeJob
+from .challenge_data import export_test_cases, replace_test_cases
+from .leaderboard import update_ranking
+from .runners import UnsupportedLanguage, get_runner, profile_names
 
 class SignupSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -13,6 +17,7 @@ class SignupSerializer(serializers.ModelSerializer):
         user = User.objects.create_user(**validated_data)
         # Create user profile
         UserProfile.objects.create(user=user)
+        update_ranking(user.pk)
         return user
 
 class SubmissionSerializer(serializers.ModelSerializer):
@@ -20,10 +25,16 @@ class SubmissionSerializer(serializers.ModelSerializer):
         model = Submission
         fields = '__all__'
 
+class SubmissionListSerializer(serializers.ModelSerializer):
+    """History row without code, stdin or output; those come from the detail endpoint."""
+    class Meta:
+        model = Submission
+        fields = ['id', 'language', 'returncode', 'cpu_time', 'wall_time', 'peak_memory_kb', 'created_at']
+
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
-        fields = ['points', 'last_active']
+        fields = ['points', 'programs_executed', 'challenges_completed', 'last_active']
 
 class UserSerializer(serializers.ModelSerializer):
     points = serializers.SerializerMethodField()
@@ -34,39 +45,101 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'username', 'email', 'points', 'programs_executed', 'challenges_completed']
 
-    def get_programs_executed(self, obj):
-        return obj.submissions.count()
+    # All three are denormalized onto the profile (see compiler.stats)
 
-    def get_points(self, obj):
+    def _profile_value(self, obj, field):
         try:
-            return obj.profile.points
+            return getattr(obj.profile, field)
         except UserProfile.DoesNotExist:
             return 0
 
+    def get_programs_executed(self, obj):
+        return self._profile_value(obj, 'programs_executed')
+
+    def get_points(self, obj):
+        if hasattr(obj, 'ranked_points'):
+            return obj.ranked_points
+        return self._profile_value(obj, 'points')
+
     def get_challenges_completed(self, obj):
-        return obj.solutions.filter(is_correct=True).count()
+        return self._profile_value(obj, 'challenges_completed')
+
+class LeaderboardEntrySerializer(UserSerializer):
+    rank = serializers.IntegerField(read_only=True)
+
+    class Meta(UserSerializer.Meta):
+        fields = ['rank'] + UserSerializer.Meta.fields
+
+class TestCaseDataSerializer(serializers.Serializer):
+    input = serializers.CharField(allow_blank=True, trim_whitespace=False)
+    output = serializers.CharField(allow_blank=True, trim_whitespace=False)
 
 class CodingChallengeSerializer(serializers.ModelSerializer):
     created_by = serializers.ReadOnlyField(source='created_by.username')
-    test_cases = serializers.JSONField(write_only=True)  # Hide test cases from regular users
+    # Stored in the blob store, not on the model; hidden from regular users
+    test_cases = TestCaseDataSerializer(many=True, write_only=True, required=False)
 
     class Meta:
         model = CodingChallenge
         fields = ['id', 'title', 'description', 'example_input', 'example_output', 
-                'test_cases', 'difficulty', 'created_at', 'created_by', 'is_active']
+                'test_cases', 'difficulty', 'time_limit', 'memory_limit', 'checker', 'checker_tolerance',
+                'checker_code', 'checker_language', 'compile_profile', 'created_at', 'created_by', 'is_active']
+
+    def validate_checker_tolerance(self, value):
+        if value is not None and value < 0:
+            raise serializers.ValidationError("Must not be negative.")
+        return value
+
+    def validate_compile_profile(self, value):
+        if value and value not in profile_names():
+            raise serializers.ValidationError(f"Unknown compile profile; choose from {', '.join(profile_names())}.")
+        return value
+
+    def validate(self, attrs):
+        checker = attrs.get('checker', getattr(self.instance, 'checker', 'exact'))
+        if checker == 'custom':
+            code = attrs.get('checker_code', getattr(self.instance, 'checker_code', ''))
+            language = attrs.get('checker_language', getattr(self.instance, 'checker_language', ''))
+            if not code.strip():
+                raise serializers.ValidationError({'checker_code': "A custom checker needs its code."})
+            try:
+                get_runner(language)
+            except UnsupportedLanguage:
+                raise serializers.ValidationError({'checker_language': "Unsupported language."})
+        return attrs
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         
-        # Only show test cases to admins or the challenge creator
+        # Only show test cases to admins or the challenge creator, and only on
+        # the detail endpoint: they are read back from disk for every challenge
         request = self.context.get('request')
-        if request and (request.user.is_superuser or request.user == instance.created_by):
-            representation['test_cases'] = instance.test_cases
+        is_owner = request and (request.user.is_superuser or request.user == instance.created_by)
+        if self.context.get('include_test_cases') and is_owner:
+            representation['test_cases'] = export_test_cases(instance)
         else:
             representation.pop('test_cases', None)
+        # The checker may give the answers away too
+        if not is_owner:
+            representation.pop('checker_code', None)
             
         return representation
 
+    def create(self, validated_data):
+        test_cases = validated_data.pop('test_cases', [])
+        with transaction.atomic():
+            challenge = super().create(validated_data)
+            replace_test_cases(challenge, [(case['input'], case['output']) for case in test_cases])
+        return challenge
+
+    def update(self, instance, validated_data):
+        test_cases = validated_data.pop('test_cases', None)
+        with transaction.atomic():
+            challenge = super().update(instance, validated_data)
+            if test_cases is not None:
+                replace_test_cases(challenge, [(case['input'], case['output']) for case in test_cases])
+        return challenge
+
 class ChallengeSolutionSerializer(serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source='user.username')
     challenge_title = serializers.ReadOnlyField(source='challenge.title')
@@ -74,5 +147,17 @@ class ChallengeSolutionSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChallengeSolution
         fields = ['id', 'username', 'challenge', 'challenge_title', 'code', 
-                'language', 'is_correct', 'created_at']
-        read_only_fields = ['is_correct']
\ No newline at end of file
+                'language', 'is_correct', 'cpu_time', 'wall_time', 'peak_memory_kb', 'created_at']
+        read_only_fields = ['is_correct', 'cpu_time', 'wall_time', 'peak_memory_kb']
+
+class ChallengeSolutionListSerializer(ChallengeSolutionSerializer):
+    """``ChallengeSolutionSerializer`` without ``code``, for listings."""
+    class Meta(ChallengeSolutionSerializer.Meta):
+        fields = [field for field in ChallengeSolutionSerializer.Meta.fields if field != 'code']
+
+class JudgeJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = JudgeJob
+        fields = ['id', 'kind', 'challenge', 'language', 'status', 'http_status',
+                'result', 'events', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
\ No newline at end of file
@@ -0,0 +1,48 @@
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Submission, ChallengeSolution, UserProfile
+
+COUNTERS = ("points", "programs_executed", "challenges_completed")
+
+
+def bump_user_stats(user, **deltas):
+    """Add ``deltas`` to the user's profile counters in a single UPDATE.
+
+    The arithmetic happens in the database (``F() + n``), so concurrent
+    submissions can't lose each other's increments. Call it inside the same
+    transaction as the rows it accounts for.
+    """
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not changes:
+        return
+    changes["last_active"] = timezone.now()
+    if not UserProfile.objects.filter(user=user).update(**changes):
+        UserProfile.objects.get_or_create(user=user)
+        UserProfile.objects.filter(user=user).update(**changes)
+
+
+def rebuild_user_stats(include_points=False, batch_size=500):
+    """Recompute every profile's counters from the Submission/ChallengeSolution rows.
+
+    Points are only rebuilt on request: they are awarded for a challenge's
+    first solution being correct, which the rows no longer record, so the
+    rebuilt value is the number of correctly solved challenges.
+    """
+    executed = dict(
+        Submission.objects.order_by().values("user").annotate(n=Count("pk")).values_list("user", "n")
+    )
+    completed = dict(
+        ChallengeSolution.objects.filter(is_correct=True).order_by()
+        .values("user").annotate(n=Count("pk")).values_list("user", "n")
+    )
+
+    fields = ["programs_executed", "challenges_completed"] + (["points"] if include_points else [])
+    profiles = list(UserProfile.objects.only("id", "user_id", *fields))
+    for profile in profiles:
+        profile.programs_executed = executed.get(profile.user_id, 0)
+        profile.challenges_completed = completed.get(profile.user_id, 0)
+        if include_points:
+            profile.points = profile.challenges_completed
+    UserProfile.objects.bulk_update(profiles, fields, batch_size=batch_size)
+    return len(profiles)
@@ -1,3 +1,1406 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import socket
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from random import Random
+from types import SimpleNamespace
+from unittest import addModuleCleanup, mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import metrics
+from .artifacts import ArtifactCache, get_artifact_cache
+from .datadir import private_dir
+from .filecache import PrivateFileBasedCache
+from .admission import Overloaded, Scheduler
+from .benchmark import Benchmark
+from .blobs import get_blob_store
+from .capture import OutputMatcher, StreamCapture, StrippedFile, arun_process, run_process
+from .checkers import TokenMatcher
+from .challenge_data import InvalidTestBundle, export_test_cases, read_test_bundle, replace_test_cases
+from .judge import arun_test_cases, judge_solution, run_test_cases
+from .judge_queue import claim_next_job, enqueue_job, lease, process_job, publish_progress, requeue_stale_jobs
+from .leaderboard import RANKING_CACHE_KEY, build_ranking, get_ranking, rank_of, update_ranking
+from .live import JobWatcher
+from .limits import EXCEEDED_CPU_TIME, EXCEEDED_DISK_QUOTA, EXCEEDED_MEMORY, ResourceLimits, guard_path
+from .models import ChallengeSolution, CodingChallenge, JudgeJob, Submission, UserProfile
+from .runners import DEFAULT_LANGUAGES, get_registry, get_runner, language_settings
+from .runners.cpp import get_precompiled_headers
+from .runtimes.javac import JavacServer
+from .runtimes.pools import ForkServerPool, JvmPool
+from .stats import bump_user_stats
+from .views import compile_code_async, job_detail_async, solve_challenge_async
+from .workdirs import WorkdirPool
+
+
+def setUpModule():
+    """Keeps what the judge writes to ``JUDGE_DATA_DIR`` (runguard, builds, caches, metrics) in a temporary one."""
+    data_dir = tempfile.mkdtemp()
+    addModuleCleanup(shutil.rmtree, data_dir, ignore_errors=True)
+    settings_override = override_settings(
+        JUDGE_DATA_DIR=data_dir,
+        JUDGE_ARTIFACT_CACHE_DIR=os.path.join(data_dir, 'artifacts'),
+        JUDGE_CPP_PCH_DIR=os.path.join(data_dir, 'pch'),
+        JUDGE_METRICS_DIR=os.path.join(data_dir, 'metrics'),
+        CACHES={'default': {'BACKEND': 'compiler.filecache.PrivateFileBasedCache',
+                            'LOCATION': os.path.join(data_dir, 'cache')}},
+    )
+    settings_override.enable()
+    addModuleCleanup(settings_override.disable)
+    for cached in (get_artifact_cache, get_precompiled_headers, guard_path):
+        cached.cache_clear()
+        addModuleCleanup(cached.cache_clear)
+
+
+class BlobStoreMixin:
+    """Gives each test an empty blob store of its own (``JUDGE_BLOB_DIR``)."""
+
+    def setUp(self):
+        super().setUp()
+        self.blob_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.blob_dir)
+        settings_override = self.settings(JUDGE_BLOB_DIR=self.blob_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        get_blob_store.cache_clear()
+        self.addCleanup(get_blob_store.cache_clear)
+
+
+def _index(model, name):
+    return next(index for index in model._meta.indexes if index.name == name)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked against SQLite')
+class AccessPathIndexTests(TransactionTestCase):
+    """Each hot query's plan uses its index, and doesn't without it."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('planner', password='x')
+        self.challenge = CodingChallenge.objects.create(
+            title='Plan', description='', difficulty='easy', created_by=self.user
+        )
+
+    def access_paths(self):
+        return [
+            (Submission, 'submission_user_created_idx',
+             Submission.objects.filter(user=self.user).order_by('-created_at')),
+            (ChallengeSolution, 'solution_user_created_idx',
+             ChallengeSolution.objects.filter(user=self.user).order_by('-created_at')),
+            (ChallengeSolution, 'solution_challenge_ok_idx',
+             ChallengeSolution.objects.filter(challenge=self.challenge, is_correct=True)),
+            (CodingChallenge, 'challenge_active_diff_idx',
+             CodingChallenge.objects.filter(is_active=True, difficulty='easy')),
+            (UserProfile, 'profile_points_idx',
+             UserProfile.objects.order_by('-points', 'user_id').values_list('user_id', 'points')),
+            (JudgeJob, 'judgejob_status_id_idx',
+             JudgeJob.objects.filter(status=JudgeJob.STATUS_QUEUED).order_by('id')),
+        ]
+
+    def test_plans_use_access_path_indexes(self):
+        for model, name, queryset in self.access_paths():
+            with self.subTest(index=name):
+                index = _index(model, name)
+                self.assertIn(name, queryset.explain())
+
+                with connection.schema_editor() as editor:
+                    editor.remove_index(model, index)
+                try:
+                    self.assertNotIn(name, queryset.explain())
+                finally:
+                    with connection.schema_editor() as editor:
+                        editor.add_index(model, index)
+
+
+class DatabaseProfileTests(TestCase):
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite connection setup')
+    def test_sqlite_connection_is_configured(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+@override_settings(JUDGE_CPU_TIME_LIMIT=2, JUDGE_WALL_TIME_LIMIT=5, JUDGE_MEMORY_LIMIT_MB=256)
+class ResourceLimitsTests(TestCase):
+    def test_challenge_overrides_defaults(self):
+        challenge = CodingChallenge(time_limit=4, memory_limit=64)
+        limits = ResourceLimits.for_challenge(challenge)
+        self.assertEqual((limits.cpu_time, limits.wall_time, limits.memory), (4, 8, 64))
+        self.assertIn(('AS', 64 * 1024 * 1024, 64 * 1024 * 1024), limits.rlimits())
+
+        defaults = ResourceLimits.for_challenge(CodingChallenge())
+        self.assertEqual((defaults.cpu_time, defaults.wall_time, defaults.memory), (2, 5, 256))
+
+    def test_guard_is_built_in_the_private_data_directory(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        guard_path.cache_clear()
+        self.addCleanup(guard_path.cache_clear)
+        with self.settings(JUDGE_DATA_DIR=data_dir):
+            path = guard_path()
+        self.assertEqual(os.path.commonpath([path, data_dir]), data_dir)
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode), 0o700)
+
+    def test_cpu_time_over_fractional_limit_is_exceeded(self):
+        limits = ResourceLimits(cpu_time=1.5)
+        self.assertIn(('CPU', 2, 3), limits.rlimits())
+        self.assertEqual(limits.exceeded(0, {'cpu_time': 1.7}), EXCEEDED_CPU_TIME)
+        self.assertIsNone(limits.exceeded(0, {'cpu_time': 1.2}))
+        self.assertIsNone(limits.exceeded(-9, {'cpu_time': None}))
+
+
+class LanguageRunnerTests(TestCase):
+    def setUp(self):
+        languages = {
+            **DEFAULT_LANGUAGES,
+            'shell': {'source': 'main.sh', 'run': ['sh', '{source}'], 'aliases': ['sh']},
+            'slow': {'source': 'main.sh', 'compile': ['sh', '{source}'], 'run': ['true']},
+        }
+        settings_override = self.settings(JUDGE_LANGUAGES=languages)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        get_registry.cache_clear()
+        self.addCleanup(get_registry.cache_clear)
+
+    def test_language_from_settings_runs_through_the_api(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('polyglot', password='x'))
+        response = client.post('/api/compile/', {'code': 'read n; echo $((n * 2))', 'language': 'SH', 'stdin': '21\n'},
+                               format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['result']['stdout'], '42\n')
+        self.assertEqual(response.data['submission']['language'], 'sh')
+
+        response = client.post('/api/compile/', {'code': '', 'language': 'cobol'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(JUDGE_COMPILE_TIMEOUT=0.5, JUDGE_ARTIFACT_CACHE_ENABLED=False)
+    def test_compiler_over_the_timeout_fails_the_build(self):
+        runner = get_runner('slow')
+        with runner.build('sleep 10') as program:
+            self.assertTrue(program.compile_failed)
+            self.assertTrue(program.compile_result['timed_out'])
+            self.assertIn('timed out after 0.5 seconds', program.compile_result['stderr'])
+
+        async def abuild():
+            with await runner.abuild('sleep 10') as program:
+                return program.compile_result
+        self.assertTrue(asyncio.run(abuild())['timed_out'])
+
+        with runner.build('echo built; exit 3') as program:
+            self.assertEqual(program.compile_result, {'stdout': 'built\n', 'stderr': '', 'returncode': 3})
+
+    def test_memory_flag_is_dropped_without_a_memory_limit(self):
+        java = get_runner('java')
+        self.assertEqual(java.expand(java.run_command, '/w', ResourceLimits(memory=64)),
+                         ['java', '-Xmx64m', '-cp', '/w', 'Main'])
+        self.assertEqual(java.expand(java.run_command, '/w', ResourceLimits()), ['java', '-cp', '/w', 'Main'])
+        self.assertEqual(get_runner('C++').name, 'cpp')
+
+    def test_languages_file_replaces_and_extends_the_defaults(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'cpp': {'source': 'main.cpp', 'run': ['{workdir}/main.out'], 'profiles': {'default': []}},
+                       'shell': {'source': 'main.sh', 'run': ['sh', '{source}']}}, f)
+        with self.settings(JUDGE_LANGUAGES=None, JUDGE_LANGUAGES_FILE=path):
+            languages = language_settings()
+        self.assertEqual(sorted(languages), ['cpp', 'java', 'python', 'shell'])
+        self.assertEqual(languages['java'], DEFAULT_LANGUAGES['java'])
+        self.assertEqual(languages['cpp']['profiles'], {'default': []})
+        self.assertIn('c++20', DEFAULT_LANGUAGES['cpp']['profiles'])
+
+    @override_settings(JUDGE_COMPILE_TIMEOUT=0.3)
+    def test_compile_server_over_the_timeout_fails_the_build_without_retrying(self):
+        socket_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, socket_dir)
+        socket_path = os.path.join(socket_dir, 'javac.sock')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(listener.close)
+        listener.bind(socket_path)
+        listener.listen()  # Takes the compile and never answers
+
+        server = JavacServer()
+        with mock.patch.object(server, '_checkout', return_value=(mock.Mock(), socket_path)) as checkout:
+            result = server.compile(['javac', 'Main.java'], socket_dir)
+            self.assertTrue(result['timed_out'])
+            self.assertIn('timed out after 0.3 seconds', result['stderr'])
+            self.assertTrue(asyncio.run(server.acompile(['javac', 'Main.java'], socket_dir))['timed_out'])
+        self.assertEqual(checkout.call_count, 2)
+
+    @skipUnless(shutil.which('javac'), 'javac is not installed')
+    def test_java_compiles_on_the_server_and_recovers_when_it_dies(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        server = JavacServer(max_compiles=2)
+        self.addCleanup(server.close)
+
+        def compile(code):
+            with open(os.path.join(workdir, 'Main.java'), 'w') as f:
+                f.write(code)
+            return server.compile(['javac', 'Main.java'], workdir)
+
+        main = 'public class Main { public static void main(String[] a) { System.out.println(%s); } }'
+        self.assertEqual(compile(main % '1')['returncode'], 0)
+        self.assertTrue(os.path.exists(os.path.join(workdir, 'Main.class')))
+        first = server._server
+        first.kill()
+        result = compile(main % 'x')
+        self.assertNotEqual(result['returncode'], 0)
+        self.assertIn('cannot find symbol', result['stderr'])
+        second = server._server
+        self.assertIsNot(second, first)
+
+        self.assertNotEqual(asyncio.run(server.acompile(['javac', 'Main.java'], workdir))['returncode'], 0)
+        # That was the second server's last compile; the next one gets a fresh server
+        self.assertEqual(compile(main % '2')['returncode'], 0)
+        self.assertIsNot(server._server, second)
+
+    @skipUnless(shutil.which('g++'), 'g++ is not installed')
+    def test_cpp_builds_with_the_profile_and_its_precompiled_header(self):
+        pch_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pch_dir)
+        cpp = {**DEFAULT_LANGUAGES['cpp'], 'pch': ['vector'], 'profiles': {'default': ['-std=gnu++17'],
+                                                                            'c++20': ['-std=gnu++20']}}
+        with self.settings(JUDGE_LANGUAGES={'cpp': cpp}, JUDGE_CPP_PCH_DIR=pch_dir, JUDGE_ARTIFACT_CACHE_ENABLED=False):
+            get_registry.cache_clear()
+            get_precompiled_headers.cache_clear()
+            self.addCleanup(get_precompiled_headers.cache_clear)
+            runner = get_runner('cpp')
+            self.assertEqual(runner.compile_args('c++20'), ['g++', '-std=gnu++20', 'main.cpp', '-o', 'main.out'])
+            self.assertEqual(runner.compile_args('no-such-profile'), runner.compile_args())
+
+            headers = runner.precompile('c++20')
+            self.assertTrue(os.path.exists(os.path.join(headers, 'vector.gch')))
+            code = ('#include <vector>\n#include <cstdio>\n'
+                    'int main() { std::vector<int> v{1, 2}; printf("%zu\\n", v.size()); }\n')
+            with runner.build(code, profile='c++20') as program:
+                command = runner.compile_argv(program.workdir, program.limits, 'c++20')
+                self.assertEqual(command[1:3], ['-I', headers])
+                # g++ -H marks a header it loaded precompiled with "!"
+                trace = subprocess.run(command + ['-H'], cwd=program.workdir, capture_output=True, text=True).stderr
+                self.assertIn(f'! {headers}/vector.gch', trace)
+                self.assertEqual(program.run('')['stdout'], '2\n')
+
+
+class WarmRuntimeTests(TestCase):
+    def setUp(self):
+        self.program = SimpleNamespace(workdir=tempfile.mkdtemp(), runner=SimpleNamespace(source='main.py'))
+        self.addCleanup(shutil.rmtree, self.program.workdir)
+
+    def write(self, name, code):
+        with open(os.path.join(self.program.workdir, name), 'w') as f:
+            f.write(code)
+
+    def test_fork_server_measures_each_child_and_cleans_up_when_recycled(self):
+        pool = ForkServerPool(max_runs=2)
+        self.addCleanup(pool.close)
+        limits = ResourceLimits.for_challenge()
+        self.write('main.py', 'print(1)')
+        small = pool.run(self.program, '', limits)['usage']['peak_memory_kb']
+        self.write('main.py', 'data = bytearray(64 * 1024 * 1024)')
+        large = pool.run(self.program, '', limits)['usage']['peak_memory_kb']
+        # The server's own memory, which every child starts out sharing, isn't theirs
+        self.assertLess(small, 8 * 1024)
+        self.assertGreater(large - small, 56 * 1024)
+
+        first = os.path.dirname(pool._socket_path)
+        self.write('main.py', 'print(2)')
+        self.assertEqual(pool.run(self.program, '', limits)['stdout'], '2\n')
+        self.assertNotEqual(os.path.dirname(pool._socket_path), first)
+        self.assertFalse(os.path.exists(first))
+
+    def test_fork_server_runs_the_runners_source_file(self):
+        pool = ForkServerPool()
+        self.addCleanup(pool.close)
+        self.program.runner.source = 'solution.py'
+        self.write('solution.py', 'print(input()[::-1])')
+        self.assertEqual(pool.run(self.program, 'abc\n', ResourceLimits(wall_time=10))['stdout'], 'cba\n')
+
+    @skipUnless(shutil.which('javac'), 'javac is not installed')
+    def test_jvm_is_replaced_after_a_run_that_leaves_it_dirty(self):
+        pool = JvmPool(size=1, max_runs=10)
+        self.addCleanup(pool.close)
+        limits = ResourceLimits.for_challenge()
+
+        def run(body, limits=limits):
+            self.write('Main.java', 'public class Main { public static void main(String[] a) throws Exception { %s } }' % body)
+            subprocess.run(['javac', 'Main.java'], cwd=self.program.workdir, check=True)
+            return pool.run(self.program, '', limits)
+
+        result = run('System.out.println(1);')
+        self.assertEqual(result['stdout'], '1\n')
+        self.assertIsNotNone(result['usage']['cpu_time'])
+        self.assertIsNotNone(result['usage']['peak_memory_kb'])
+        runner = pool._idle.queue[0]
+        run('System.out.println(2);')
+        self.assertIs(pool._idle.queue[0], runner)
+
+        # A thread still printing after main returned must not reach the next run
+        result = run('new Thread(() -> { while (true) { System.out.print("x"); } }).start(); Thread.sleep(50);')
+        self.assertIsNone(pool._idle.queue[0])
+        self.assertEqual(run('System.out.println(3);')['stdout'], '3\n')
+
+        result = run('long[][] hog = new long[1024][]; for (int i = 0; i < hog.length; i++) hog[i] = new long[1 << 20];',
+                     ResourceLimits(cpu_time=5, wall_time=10, memory=64))
+        self.assertEqual(result['limit_exceeded'], EXCEEDED_MEMORY)
+        self.assertIsNone(pool._idle.queue[0])
+
+        result = run('long n = 0; while (true) { n++; }', ResourceLimits(cpu_time=0.5, wall_time=10, memory=256))
+        self.assertEqual(result['limit_exceeded'], EXCEEDED_CPU_TIME)
+        self.assertGreaterEqual(result['usage']['cpu_time'], 0.5)
+        self.assertEqual(run('System.exit(4);')['returncode'], 4)
+        self.assertEqual(run('System.out.println(5);')['stdout'], '5\n')
+
+
+class WorkdirPoolTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def test_slots_are_emptied_and_reused(self):
+        pool = WorkdirPool(self.root, 1)
+        slot = pool.acquire()
+        os.makedirs(os.path.join(slot, 'sub'))
+        with open(os.path.join(slot, 'sub', 'left.txt'), 'w') as f:
+            f.write('x')
+        extra = pool.acquire()
+        self.assertNotEqual(extra, slot)
+
+        pool.release(slot)
+        pool.release(extra)
+        self.assertFalse(os.path.exists(extra))
+        self.assertEqual(pool.acquire(), slot)
+        self.assertEqual(os.listdir(slot), [])
+        pool.close()
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_each_run_gets_a_scratch_directory_of_its_own(self):
+        code = ('import os\nprint("seen" if os.path.exists("left.txt") else "fresh")\n'
+                'open("left.txt", "w").write("x" * 60000)')
+        with self.settings(JUDGE_WORKDIR_ROOT=self.root), \
+                mock.patch('compiler.workdirs._pool', None):
+            with get_runner('python').build(code, ResourceLimits(wall_time=10, disk_quota=100000)) as program:
+                for _ in range(2):
+                    result = program.run('')
+                    self.assertEqual(result['stdout'], 'fresh\n')
+                    self.assertNotIn('limit_exceeded', result)
+                self.assertEqual(os.listdir(program.workdir), ['main.py'])
+
+    def test_root_others_can_write_to_is_refused(self):
+        os.chmod(self.root, 0o777)
+        with self.assertRaises(PermissionError):
+            WorkdirPool(self.root, 1)
+        os.chmod(self.root, 0o755)
+        pool = WorkdirPool(self.root, 1)
+        self.addCleanup(pool.close)
+        self.assertEqual(stat.S_IMODE(os.stat(self.root).st_mode), 0o700)
+        self.assertEqual(stat.S_IMODE(os.stat(pool.home).st_mode), 0o700)
+
+    def test_files_over_the_quota_fail_the_run(self):
+        code = 'for i in range(4):\n    open(f"f{i}", "w").write("x" * 40000)\nprint("done")'
+        with self.settings(JUDGE_WORKDIR_ROOT=self.root), \
+                mock.patch('compiler.workdirs._pool', None):
+            with get_runner('python').build(code, ResourceLimits(wall_time=10, disk_quota=100000)) as program:
+                result = program.run('', expected_output='done')
+                self.assertEqual(result['limit_exceeded'], EXCEEDED_DISK_QUOTA)
+                self.assertFalse(result['matched'])
+
+
+class ArtifactCacheTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        registry = mock.patch.object(metrics, 'REGISTRY', metrics.Registry())
+        registry.start()
+        self.addCleanup(registry.stop)
+
+    def build(self, name, size):
+        workdir = tempfile.mkdtemp(dir=self.root)
+        with open(os.path.join(workdir, 'main.out'), 'wb') as f:
+            f.write(b'x' * size)
+        return workdir
+
+    def count(self, name, **labels):
+        return metrics.REGISTRY.counters.get((name, tuple(sorted({'cache': 'artifact', **labels}.items()))), 0)
+
+    def test_least_recently_used_entries_go_first(self):
+        cache = ArtifactCache(os.path.join(self.root, 'cache'), max_bytes=3500)
+        for key in ('a', 'b', 'c'):
+            cache.store(key, self.build(key, 1000), {'returncode': 0})
+            os.utime(os.path.join(cache.root, key), (0, {'a': 10, 'b': 20, 'c': 30}[key]))
+        self.assertEqual(sorted(os.listdir(cache.root)), ['a', 'b', 'c'])
+
+        target = tempfile.mkdtemp(dir=self.root)
+        self.assertEqual(cache.fetch('a', target), {'returncode': 0})  # a is now the most recent
+        self.assertEqual(os.path.getsize(os.path.join(target, 'main.out')), 1000)
+        # d puts it over; b and c go, leaving it under LOW_WATER
+        cache.store('d', self.build('d', 1000), {'returncode': 0})
+        self.assertEqual(sorted(os.listdir(cache.root)), ['a', 'd'])
+        self.assertIsNone(cache.fetch('b', target))
+
+        self.assertEqual(self.count('judge_cache_requests_total', result='hit'), 1)
+        self.assertEqual(self.count('judge_cache_requests_total', result='miss'), 1)
+        self.assertEqual(self.count('judge_cache_stores_total'), 4)
+        self.assertEqual(self.count('judge_cache_evictions_total'), 2)
+
+    def test_entries_are_published_whole_and_sized_without_rescanning(self):
+        cache = ArtifactCache(os.path.join(self.root, 'cache'), max_bytes=10 ** 6)
+        workdir = self.build('a', 10)
+        with mock.patch.object(cache, '_scan', wraps=cache._scan) as scan:
+            for _ in range(3):
+                cache.store('a', workdir, {'returncode': 0})  # Later ones lose the race to publish
+            cache.store('b', workdir, {'returncode': 1})
+        self.assertEqual(scan.call_count, 1)
+        self.assertEqual(sorted(os.listdir(cache.root)), ['a', 'b'])  # No staging directories left
+        self.assertEqual(stat.S_IMODE(os.stat(cache.root).st_mode), 0o700)
+
+        with mock.patch('compiler.artifacts.json.dump', side_effect=OSError):
+            cache.store('c', workdir, {'returncode': 0})
+        self.assertEqual(sorted(os.listdir(cache.root)), ['a', 'b'])
+
+    def test_directory_others_can_write_to_is_refused(self):
+        shared = os.path.join(self.root, 'shared')
+        os.mkdir(shared)
+        os.chmod(shared, 0o777)
+        with self.assertRaises(PermissionError):
+            private_dir(shared)
+        os.chmod(shared, 0o755)
+        private_dir(shared)
+        self.assertEqual(stat.S_IMODE(os.stat(shared).st_mode), 0o700)
+
+    def test_precompiled_headers_others_can_write_to_are_not_used(self):
+        shared = os.path.join(self.root, 'pch')
+        os.mkdir(shared)
+        os.chmod(shared, 0o777)
+        get_precompiled_headers.cache_clear()
+        self.addCleanup(get_precompiled_headers.cache_clear)
+        with self.settings(JUDGE_CPP_PCH_DIR=shared), self.assertLogs('compiler.runners.cpp', 'ERROR'):
+            self.assertIsNone(get_precompiled_headers())
+
+        get_precompiled_headers.cache_clear()
+        data_dir = os.path.join(self.root, 'data')
+        with self.settings(JUDGE_CPP_PCH_DIR=None, JUDGE_DATA_DIR=data_dir):
+            headers = get_precompiled_headers()
+        self.assertEqual(headers.root, os.path.join(data_dir, 'pch'))
+        self.assertEqual(stat.S_IMODE(os.stat(headers.root).st_mode), 0o700)
+
+    def test_file_cache_others_can_write_to_is_refused(self):
+        shared = os.path.join(self.root, 'shared-cache')
+        os.mkdir(shared)
+        os.chmod(shared, 0o777)
+        with self.assertRaises(PermissionError):
+            PrivateFileBasedCache(shared, {})
+
+        file_cache = PrivateFileBasedCache(os.path.join(self.root, 'cache'), {})
+        self.assertIsNone(file_cache.get('verdict'))
+        self.assertFalse(os.path.exists(file_cache._dir))  # Created by the first write
+        file_cache.set('verdict', 'accepted')
+        self.assertEqual(file_cache.get('verdict'), 'accepted')
+        self.assertEqual(stat.S_IMODE(os.stat(file_cache._dir).st_mode), 0o700)
+
+
+class CaptureTests(TestCase):
+    def test_capture_keeps_the_head_and_tail_and_counts_the_rest(self):
+        capture = StreamCapture(limit=25, keep=10)
+        self.assertTrue(capture.feed(b'abcdefgh'))
+        self.assertFalse(capture.truncated)
+        self.assertTrue(capture.feed(b'ijklmnopqrstuvwxy'))
+        self.assertEqual(capture.text(), 'abcde\n... [15 bytes truncated] ...\nuvwxy')
+        # One byte over the limit is the cue to kill the writer
+        self.assertFalse(capture.feed(b'z'))
+        self.assertEqual(capture.total, 26)
+
+    def test_matcher_compares_like_stripped_strings(self):
+        def matches(expected, *chunks):
+            matcher = OutputMatcher(expected)
+            return all([matcher.feed(chunk) for chunk in chunks]) and matcher.finish()
+
+        self.assertTrue(matches('1 2\n3', b'\n  1 ', b'2\n', b'3', b' \n', b'\n\n'))
+        self.assertTrue(matches('', b' \n'))
+        # Whitespace held back as possibly trailing still has to match once more output follows
+        self.assertFalse(matches('1 2', b'1 ', b' 2'))
+        self.assertFalse(matches('1 2\n3', b'1 2\n'))
+        self.assertFalse(matches('1', b'1\n', b'1'))
+
+    def test_matcher_stops_at_the_first_byte_that_cannot_match(self):
+        matcher = OutputMatcher('hello world')
+        self.assertTrue(matcher.feed(b'hello '))
+        self.assertFalse(matcher.feed(b'there'))
+        self.assertFalse(matcher.feed(b'world'))
+        self.assertFalse(matcher.finish())
+
+    def test_matcher_reads_a_file_around_its_whitespace(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(b'\n \t' + b'x' * 100000 + b'\n\n')
+            f.seek(0)
+            expected = StrippedFile(f)
+            self.assertEqual((len(expected), expected[:2], expected[-2:]), (100000, b'xx', b'xx'))
+            matcher = OutputMatcher(f)
+            self.assertTrue(matcher.feed(b'x' * 70000) and matcher.feed(b'x' * 30000 + b'\n'))
+            self.assertTrue(matcher.finish())
+
+    def test_runs_stream_their_input_and_output(self):
+        data = 'line\n' * 200000  # Far more than a pipe buffer each way
+        result = run_process(['cat'], data, 10, expected_output=data)
+        self.assertTrue(result['matched'])
+        self.assertEqual(result['returncode'], 0)
+
+        started = time.monotonic()
+        result = run_process(['yes'], '', 10, expected_output='y\nn')
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertFalse(result['matched'])
+
+        with self.settings(JUDGE_OUTPUT_LIMIT_BYTES=10000, JUDGE_OUTPUT_KEEP_BYTES=100):
+            result = run_process(['yes'], '', 10)
+        self.assertTrue(result['output_limit_exceeded'])
+        self.assertIn('bytes truncated', result['stdout'])
+
+        with self.assertRaises(subprocess.TimeoutExpired):
+            run_process(['sleep', '5'], '', 0.2)
+
+
+class StreamedTestDataTests(BlobStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('setter', password='x')
+        self.challenge = CodingChallenge.objects.create(title='Bundle', description='', created_by=user)
+
+    def test_matcher_reads_expected_output_from_file(self):
+        for expected, actual in [('  12\n\n', '12\n'), ('1 2\n3', ' 1 2\n3 \n'), ('12', '123'), ('\n', ''), ('a', '')]:
+            with self.subTest(expected=expected, actual=actual):
+                digest, _ = get_blob_store().put(expected)
+                with get_blob_store().open(digest) as f:
+                    matcher = OutputMatcher(f)
+                    for i in range(len(actual)):
+                        matcher.feed(actual[i].encode())
+                    self.assertEqual(matcher.finish(), actual.strip() == expected.strip())
+
+    def test_bundle_pairs_cases_in_natural_order(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            for n in (10, 2, 1):
+                zf.writestr(f'tests/{n}.in', f'{n}\n')
+                zf.writestr(f'tests/{n}.ans', f'{n * n}\n')
+            zf.writestr('README.txt', 'ignored')
+
+        cases = replace_test_cases(self.challenge, read_test_bundle(archive))
+        self.assertEqual(len(cases), 3)
+        self.assertEqual(export_test_cases(self.challenge), [
+            {'input': '1\n', 'output': '1\n'},
+            {'input': '2\n', 'output': '4\n'},
+            {'input': '10\n', 'output': '100\n'},
+        ])
+
+    def test_bundle_with_unpaired_input_is_rejected(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('1.in', '1')
+            zf.writestr('1.out', '1')
+            zf.writestr('2.in', '2')
+        with self.assertRaises(InvalidTestBundle):
+            read_test_bundle(archive)
+
+
+class TestCaseRunnerTests(TestCase):
+    """``run_test_cases`` with cases that take ``delay`` seconds and then pass or fail."""
+
+    @staticmethod
+    def judge(program, case, checker):
+        delay, passed = case
+        time.sleep(delay)
+        return {"passed": passed}
+
+    @staticmethod
+    async def ajudge(program, case, checker):
+        delay, passed = case
+        await asyncio.sleep(delay)
+        return {"passed": passed}
+
+    def test_outcomes_come_back_in_case_order(self):
+        finished = []
+        with mock.patch('compiler.judge.judge_test_case', self.judge):
+            outcomes = run_test_cases(None, [(0.3, True), (0.05, False), (0.15, True)], workers=3,
+                                      on_outcome=lambda i, outcome: finished.append(i))
+        self.assertEqual(finished, [1, 2, 0])
+        self.assertEqual([outcome['passed'] for outcome in outcomes], [True, False, True])
+
+    @override_settings(JUDGE_FAIL_FAST=True)
+    def test_fail_fast_skips_only_cases_not_started(self):
+        cases = [(0.3, True), (0.05, False), (0, True), (0, True)]
+        with mock.patch('compiler.judge.judge_test_case', self.judge):
+            outcomes = run_test_cases(None, cases, workers=2)
+        # The slow first case was running when the second failed: it still counts
+        self.assertEqual(outcomes, [{'passed': True}, {'passed': False}, None, None])
+
+        with mock.patch('compiler.judge.ajudge_test_case', self.ajudge):
+            outcomes = asyncio.run(arun_test_cases(None, cases, workers=2))
+        self.assertEqual(outcomes, [{'passed': True}, {'passed': False}, None, None])
+
+    def test_without_fail_fast_every_case_runs(self):
+        with mock.patch('compiler.judge.judge_test_case', self.judge):
+            outcomes = run_test_cases(None, [(0, False), (0, True)], workers=1)
+        self.assertEqual(outcomes, [{'passed': False}, {'passed': True}])
+
+
+class CheckerTests(BlobStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('checker', password='x')
+
+    def match(self, expected, actual, tolerance=None, chunk=1):
+        matcher = TokenMatcher(expected, tolerance)
+        for i in range(0, len(actual), chunk):
+            if not matcher.feed(actual[i:i + chunk].encode()):
+                return False
+        return matcher.finish()
+
+    def test_tokens_ignore_spacing_and_compare_numbers_within_tolerance(self):
+        self.assertTrue(self.match('1 2\n3\n', '  1\t2 3  \n\n'))
+        self.assertFalse(self.match('1 2 3', '1 23'))
+        self.assertFalse(self.match('1 2', '1 2 3'))
+        self.assertFalse(self.match('1.0', '1.0000001'))
+        self.assertTrue(self.match('3.1415927', '3.14159265358979', tolerance=1e-6))
+        self.assertTrue(self.match('1000000', '1000000.5', tolerance=1e-6))
+        self.assertFalse(self.match('0.5', '0.51', tolerance=1e-6))
+        self.assertFalse(self.match('yes', 'no', tolerance=1e-6))
+
+        digest, _ = get_blob_store().put('abc ' * 20000)
+        with get_blob_store().open(digest) as f:
+            self.assertTrue(self.match(f, 'abc\n' * 20000, chunk=4096))
+
+        matcher = TokenMatcher('ab cd')
+        self.assertFalse(matcher.feed(b'ab cde'))
+        self.assertFalse(matcher.feed(b' never read'))
+
+    def test_trailing_partial_token_is_measured_against_its_own_expected_token(self):
+        # A short complete token, then a longer one with no whitespace after it yet
+        self.assertTrue(self.match('1 22222222', '1 22222222', chunk=64))
+        self.assertFalse(self.match('1 22', '1 22222222', chunk=64))
+        matcher = TokenMatcher('1 22222222 3')
+        self.assertTrue(matcher.feed(b'1 2222'))
+        self.assertTrue(matcher.feed(b'2222 3'))
+        self.assertTrue(matcher.finish())
+
+        result = run_process(['python', '-c', 'print("1 22222222", end="")'], '', 10,
+                             expected_output=TokenMatcher('1 22222222\n'))
+        self.assertEqual((result['matched'], result['returncode']), (True, 0))
+
+    def test_custom_checker_judges_the_whole_output(self):
+        # Any ordering of the expected numbers is accepted
+        checker = (
+            'import sys\n'
+            'output, answer = open(sys.argv[2]).read().split(), open(sys.argv[3]).read().split()\n'
+            'sys.exit(0 if sorted(output) == sorted(answer) else 1)\n'
+        )
+        challenge = CodingChallenge.objects.create(title='Any order', description='', created_by=self.user,
+                                                   checker='custom', checker_code=checker,
+                                                   checker_language='python')
+        replace_test_cases(challenge, [('3\n', '1 2 3\n'), ('2\n', '1 2\n')])
+
+        reverse = 'n = int(input())\nprint(*range(n, 0, -1))'
+        payload, status_code = judge_solution(self.user, challenge, reverse, 'python')
+        self.assertEqual(status_code, 200)
+        self.assertTrue(payload['all_tests_passed'])
+
+        payload, _ = judge_solution(self.user, challenge, 'print(1)', 'python')
+        self.assertEqual([result['passed'] for result in payload['test_results']], [False, False])
+
+        challenge.checker_code = 'raise SystemExit(3)'
+        payload, status_code = judge_solution(self.user, challenge, reverse, 'python')
+        self.assertEqual(status_code, 500)
+        self.assertIn('Checker failed', payload['error'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   JUDGE_VERDICT_CACHE_ENABLED=True)
+class VerdictCacheTests(BlobStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('memo', password='x')
+        self.challenge = CodingChallenge.objects.create(title='Triple', description='', created_by=self.user)
+        replace_test_cases(self.challenge, [('2\n', '6\n'), ('5\n', '15\n')])
+
+    def test_resubmission_reuses_the_verdict_until_tests_change(self):
+        code = 'print(int(input()) * 3)\n'
+        first, _ = judge_solution(self.user, self.challenge, code, 'python')
+        self.assertTrue(first['all_tests_passed'])
+
+        # Same code up to line endings, from another user: nothing is built or run
+        other = User.objects.create_user('copier', password='x')
+        with mock.patch('compiler.judge.compile_program') as compile_program:
+            second, status_code = judge_solution(other, self.challenge, code.replace('\n', '\r\n') + '\n', 'python')
+            judge_solution(self.user, self.challenge, code, 'python')
+        compile_program.assert_not_called()
+        self.assertEqual(status_code, 200)
+        self.assertEqual(second['test_results'], first['test_results'])
+        self.assertEqual(UserProfile.objects.get(user=other).points, 1)
+        self.assertEqual(UserProfile.objects.get(user=self.user).points, 1)
+
+        replace_test_cases(self.challenge, [('2\n', '7\n')])
+        payload, _ = judge_solution(self.user, self.challenge, code, 'python')
+        self.assertFalse(payload['all_tests_passed'])
+        self.assertEqual(UserProfile.objects.get(user=self.user).challenges_completed, 0)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'challenge-cache-tests'}})
+class ChallengeCacheTests(BlobStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', password='x')
+        self.user = User.objects.create_user('poller', password='x')
+        self.challenge = CodingChallenge.objects.create(title='Double', description='', created_by=self.admin,
+                                                        checker='custom', checker_code='secret',
+                                                        checker_language='python')
+        replace_test_cases(self.challenge, [('2\n', '4\n')])
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_polls_get_304_until_a_challenge_changes(self):
+        client = self.client_for(self.user)
+        response = client.get('/api/challenges/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('checker_code', response.data[0])
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = client.get('/api/challenges/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Each audience is cached apart
+        admin = self.client_for(self.admin)
+        details = admin.get(f'/api/challenges/{self.challenge.pk}/').data
+        self.assertEqual(details['checker_code'], 'secret')
+        self.assertEqual(details['test_cases'], [{'input': '2\n', 'output': '4\n'}])
+        self.assertNotIn('test_cases', client.get(f'/api/challenges/{self.challenge.pk}/').data)
+
+        admin.patch(f'/api/challenges/{self.challenge.pk}/', {'title': 'Twice'}, format='json')
+        response = client.get('/api/challenges/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['title'], 'Twice')
+
+        replace_test_cases(self.challenge, [('3\n', '6\n')])
+        details = admin.get(f'/api/challenges/{self.challenge.pk}/').data
+        self.assertEqual(details['test_cases'], [{'input': '3\n', 'output': '6\n'}])
+
+    def test_details_with_test_data_are_not_cached(self):
+        admin = self.client_for(self.admin)
+        with mock.patch('compiler.challenge_cache.cache.set', wraps=cache.set) as cache_set:
+            response = admin.get(f'/api/challenges/{self.challenge.pk}/')
+            self.assertEqual(response.data['test_cases'], [{'input': '2\n', 'output': '4\n'}])
+            self.assertNotIn('ETag', response)
+            self.assertEqual(cache_set.call_count, 0)
+
+            response = self.client_for(self.user).get(f'/api/challenges/{self.challenge.pk}/')
+            self.assertIn('ETag', response)
+            self.assertEqual(cache_set.call_count, 2)  # The audience's creators, then the details
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'stats-tests'}})
+class UserStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('counter')
+
+    def test_bump_adds_in_the_database_and_creates_the_profile(self):
+        bump_user_stats(self.user, programs_executed=0)
+        self.assertFalse(UserProfile.objects.filter(user=self.user).exists())
+
+        bump_user_stats(self.user, programs_executed=1)
+        profile = UserProfile.objects.get(user=self.user)
+        # Another process's increment landing in between is kept
+        UserProfile.objects.filter(pk=profile.pk).update(programs_executed=F('programs_executed') + 5)
+        bump_user_stats(self.user, points=2, programs_executed=1, challenges_completed=1)
+        profile.refresh_from_db()
+        self.assertEqual((profile.points, profile.programs_executed, profile.challenges_completed), (2, 7, 1))
+
+    def test_rebuild_recounts_from_submissions_and_solutions(self):
+        other = User.objects.create_user('idle')
+        UserProfile.objects.create(user=self.user, points=9, programs_executed=40, challenges_completed=3)
+        UserProfile.objects.create(user=other, points=4, programs_executed=1)
+        first, second = (CodingChallenge.objects.create(title=title, description='', created_by=self.user)
+                         for title in ('First', 'Second'))
+        for _ in range(3):
+            Submission.objects.create(user=self.user, language='python', code='print(1)')
+        ChallengeSolution.objects.create(user=self.user, challenge=first, code='', language='python',
+                                         is_correct=True)
+        ChallengeSolution.objects.create(user=self.user, challenge=second, code='', language='python')
+        cache.set(RANKING_CACHE_KEY, build_ranking())
+
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_user_stats', stdout=out)
+        self.assertIn('Rebuilt stats for 2 profile(s).', out.getvalue())
+        stats = {user_id: values for user_id, *values in UserProfile.objects.values_list(
+            'user_id', 'points', 'programs_executed', 'challenges_completed')}
+        self.assertEqual(stats, {self.user.pk: [9, 3, 1], other.pk: [4, 0, 0]})
+        self.assertIsNone(cache.get(RANKING_CACHE_KEY))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_user_stats', '--include-points', stdout=io.StringIO())
+        self.assertEqual(list(UserProfile.objects.order_by('user_id').values_list('points', flat=True)), [1, 0])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'leaderboard-tests'}})
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = []
+        for number, points in enumerate([3, 5, 5, 1, 0]):
+            user = User.objects.create_user(f'player{number}')
+            UserProfile.objects.create(user=user, points=points)
+            self.users.append(user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def test_pages_the_ranking_with_my_rank(self):
+        response = self.client.get('/api/leaderboard/?limit=2&offset=1')
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([(row['username'], row['rank'], row['points']) for row in response.data['results']],
+                         [('player2', 1, 5), ('player0', 3, 3)])
+        self.assertEqual(response.data['me'], {'rank': 3, 'points': 3})
+
+        unranked = User.objects.create_user('spectator')
+        self.client.force_authenticate(unranked)
+        self.assertIsNone(self.client.get('/api/leaderboard/').data['me'])
+
+    def test_cached_ranking_costs_one_query_per_page(self):
+        self.client.get('/api/leaderboard/')
+        with self.assertNumQueries(1), mock.patch('compiler.leaderboard.build_ranking') as build:
+            response = self.client.get('/api/leaderboard/?limit=2')
+        build.assert_not_called()
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_updates_move_users_in_place(self):
+        get_ranking()
+        random = Random(7)
+        with mock.patch('compiler.leaderboard.build_ranking') as build:
+            for step in range(200):
+                if step % 25 == 0:
+                    user = User.objects.create_user(f'newcomer{step}')
+                    UserProfile.objects.create(user=user, points=random.randrange(6))
+                    self.users.append(user)
+                    user_id = user.pk
+                elif step % 40 == 0:
+                    user = self.users.pop(random.randrange(len(self.users)))
+                    user_id = user.pk
+                    user.delete()
+                else:
+                    user = random.choice(self.users)
+                    UserProfile.objects.filter(user=user).update(points=random.randrange(6))
+                    user_id = user.pk
+                with self.captureOnCommitCallbacks(execute=True):
+                    update_ranking(user_id)
+            build.assert_not_called()
+        self.assertEqual(cache.get(RANKING_CACHE_KEY), build_ranking())
+        self.assertEqual(rank_of(self.users[0]), rank_of(self.users[0], build_ranking()))
+
+
+@override_settings(JUDGE_EVENTS_POLL_INTERVAL=0.01)
+class JobEventsTests(BlobStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('streamer', password='x')
+        challenge = CodingChallenge.objects.create(title='Double', description='', created_by=self.user)
+        replace_test_cases(challenge, [('2\n', '4\n'), ('5\n', '10\n')])
+        self.job = enqueue_job(self.user, JudgeJob.KIND_SOLVE, 'print(int(input()) * 2)', 'python', challenge=challenge)
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    @staticmethod
+    def parse(chunk):
+        fields = dict(line.split(': ', 1) for line in chunk.decode().strip().splitlines() if not line.startswith(':'))
+        return fields.get('event'), json.loads(fields['data']) if 'data' in fields else None
+
+    async def test_progress_streams_while_the_job_is_judged(self):
+        response = await self.async_client.get(f'/api/jobs/{self.job.pk}/events/', headers=self.auth)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(self.parse(await anext(stream)), (None, None))  # retry interval
+        self.assertEqual(self.parse(await anext(stream)), ('status', {'status': 'queued'}))
+
+        job = await sync_to_async(claim_next_job)('test')
+        await sync_to_async(process_job)(job)
+        messages = [self.parse(chunk) async for chunk in stream]
+        # Whether "running" is seen depends on when the watcher polls
+        self.assertEqual([data['status'] for name, data in messages if name == 'status'][-1:], ['done'])
+        self.assertEqual([name for name, _ in messages if name != 'status'], ['compile', 'test_case', 'test_case', 'result'])
+        self.assertEqual(sorted(data['test_case'] for name, data in messages if name == 'test_case'), [1, 2])
+        self.assertTrue(messages[-1][1]['result']['all_tests_passed'])
+
+        # A reconnecting client only gets what it missed
+        response = await self.async_client.get(f'/api/jobs/{self.job.pk}/events/',
+                                               headers={**self.auth, 'Last-Event-ID': '1'})
+        messages = [self.parse(chunk) async for chunk in response.streaming_content]
+        self.assertEqual([name for name, _ in messages], [None, 'status', 'test_case', 'result'])
+
+    async def test_long_poll_answers_once_the_job_is_judged(self):
+        request = AsyncRequestFactory().get('/?wait=10', headers=self.auth)
+        waiting = asyncio.ensure_future(job_detail_async(request, self.job.pk))
+        await asyncio.sleep(0.3)
+        self.assertFalse(waiting.done())
+
+        job = await sync_to_async(claim_next_job)('test')
+        await sync_to_async(process_job)(job)
+        response = await asyncio.wait_for(waiting, 5)
+        payload = json.loads(response.content)
+        self.assertEqual(payload['status'], 'done')
+        self.assertTrue(payload['result']['all_tests_passed'])
+
+    async def test_a_second_subscriber_gets_the_current_row(self):
+        watcher = JobWatcher(0.05)
+        async with watcher.watch(self.job.pk) as first:
+            self.assertEqual((await first.next(5))['status'], 'queued')
+            async with watcher.watch(self.job.pk) as second:
+                # The row hasn't changed since the first poll, yet it arrives
+                self.assertEqual((await second.next(1))['status'], 'queued')
+
+    def test_sync_view_answers_at_once(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        started = time.monotonic()
+        response = client.get(f'/api/jobs/{self.job.pk}/?wait=10')
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(response.data['status'], 'queued')
+
+    async def test_stream_needs_the_jobs_owner(self):
+        response = await self.async_client.get(f'/api/jobs/{self.job.pk}/events/')
+        self.assertEqual(response.status_code, 401)
+        other = await sync_to_async(User.objects.create_user)('other', password='x')
+        response = await self.async_client.get(f'/api/jobs/{self.job.pk}/events/?access_token={AccessToken.for_user(other)}')
+        self.assertEqual(response.status_code, 404)
+
+
+class JudgeQueueTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+
+    def enqueue(self, user, code='print(1)'):
+        return enqueue_job(user, JudgeJob.KIND_COMPILE, code, 'python')
+
+    def test_users_take_turns_at_claiming(self):
+        first, second = self.enqueue(self.alice), self.enqueue(self.alice)
+        theirs = self.enqueue(self.bob)
+        self.assertEqual(claim_next_job('w1').pk, first.pk)
+        # Alice has a job running and Bob none, so Bob's goes ahead of her second one
+        self.assertEqual(claim_next_job('w2').pk, theirs.pk)
+        job = claim_next_job('w3')
+        self.assertEqual((job.pk, job.status, job.worker), (second.pk, JudgeJob.STATUS_RUNNING, 'w3'))
+        self.assertIsNone(claim_next_job('w4'))
+
+    def test_only_jobs_without_a_heartbeat_are_requeued(self):
+        self.enqueue(self.alice), self.enqueue(self.bob)
+        dead, alive = claim_next_job('dead'), claim_next_job('alive')
+        long_ago = timezone.now() - timedelta(minutes=10)
+        # Both started long ago, but only the dead worker stopped beating
+        JudgeJob.objects.filter(pk=dead.pk).update(started_at=long_ago, heartbeat_at=long_ago)
+        JudgeJob.objects.filter(pk=alive.pk).update(started_at=long_ago)
+
+        self.assertEqual(requeue_stale_jobs(60), 1)
+        requeued = JudgeJob.objects.get(pk=dead.pk)
+        self.assertEqual((requeued.status, requeued.worker, requeued.heartbeat_at), (JudgeJob.STATUS_QUEUED, '', None))
+        self.assertEqual(JudgeJob.objects.get(pk=alive.pk).status, JudgeJob.STATUS_RUNNING)
+
+        # The dead worker comes back and finishes after another one took the job
+        retaken = claim_next_job('new')
+        with self.assertLogs('compiler.judge_queue', 'WARNING') as logs:
+            process_job(dead)
+        self.assertIn(f'judge job {dead.pk}: dead no longer holds it; now held by new', logs.output[0])
+        retaken.refresh_from_db()
+        self.assertEqual((retaken.status, retaken.worker, retaken.result), (JudgeJob.STATUS_RUNNING, 'new', None))
+        process_job(retaken)
+        retaken.refresh_from_db()
+        self.assertEqual(retaken.status, JudgeJob.STATUS_DONE)
+        self.assertEqual(retaken.result['result']['stdout'], '1\n')
+
+    def test_progress_is_written_at_most_once_per_interval(self):
+        self.enqueue(self.alice)
+        job = claim_next_job('w1')
+        progress = publish_progress(job, interval=60)
+        with CaptureQueriesContext(connection) as queries:
+            for i in range(5):
+                progress({'event': 'test_case', 'test_case': i + 1})
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(len(JudgeJob.objects.get(pk=job.pk).events), 1)
+        # The rest are stored with the result, after the judging's own compile event
+        with mock.patch('compiler.judge_queue.publish_progress', return_value=progress):
+            process_job(job)
+        events = JudgeJob.objects.get(pk=job.pk).events
+        self.assertEqual([event['event'] for event in events], ['test_case'] * 5 + ['compile'])
+
+    def test_a_failing_judge_fails_the_job(self):
+        self.enqueue(self.alice)
+        with mock.patch('compiler.judge_queue.judge_compile', side_effect=RuntimeError('sandbox gone')):
+            job = process_job(claim_next_job('w1'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.http_status, job.result), (JudgeJob.STATUS_FAILED, 500, {'error': 'sandbox gone'}))
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(claim_next_job('w2'))
+
+
+class JudgeLeaseTests(TransactionTestCase):
+    def test_heartbeat_goes_on_while_the_job_is_held(self):
+        user = User.objects.create_user('alice', password='x')
+        enqueue_job(user, JudgeJob.KIND_COMPILE, 'print(1)', 'python')
+        job = claim_next_job('w1')
+        claimed_at = job.heartbeat_at
+        with lease(job, interval=0.05):
+            time.sleep(0.3)
+        beat_at = JudgeJob.objects.get(pk=job.pk).heartbeat_at
+        self.assertGreater(beat_at, claimed_at)
+        # Stopped with the block
+        time.sleep(0.15)
+        self.assertEqual(JudgeJob.objects.get(pk=job.pk).heartbeat_at, beat_at)
+
+
+class AsyncJudgingTests(BlobStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('looper', password='x')
+        self.challenge = CodingChallenge.objects.create(title='Double', description='', created_by=self.user)
+        replace_test_cases(self.challenge, [('2\n', '4\n'), ('5\n', '10\n'), ('7\n', '14\n')])
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def post(self, path, body):
+        return AsyncRequestFactory().post(path, json.dumps(body), content_type='application/json', headers=self.auth)
+
+    async def test_views_judge_on_the_event_loop(self):
+        response = await solve_challenge_async(self.post('/', {'code': 'print(int(input()) * 2)'}), self.challenge.pk)
+        self.assertEqual(response.status_code, 200)
+        payload = json.loads(response.content)
+        self.assertTrue(payload['all_tests_passed'])
+        self.assertEqual([result['test_case'] for result in payload['test_results']], [1, 2, 3])
+        self.assertTrue(await ChallengeSolution.objects.filter(user=self.user, is_correct=True).aexists())
+
+        response = await compile_code_async(self.post('/', {'code': 'print(input()[::-1])', 'stdin': 'abc'}))
+        self.assertEqual(json.loads(response.content)['result']['stdout'], 'cba\n')
+        with self.settings(JUDGE_CPU_TIME_LIMIT=0.5, JUDGE_WALL_TIME_LIMIT=1):
+            response = await compile_code_async(self.post('/', {'code': 'import time; time.sleep(5)'}))
+        self.assertEqual(response.status_code, 408)
+
+    async def test_run_is_killed_when_output_cannot_match(self):
+        result = await arun_process(['yes'], '', 10, expected_output='n')
+        self.assertFalse(result['matched'])
+        result = await arun_process(['python', '-c', 'print(input() * 2)'], 'ab', 10,
+                                    expected_output='abab', limits=ResourceLimits(cpu_time=5))
+        self.assertTrue(result['matched'])
+        self.assertIsNotNone(result['usage']['cpu_time'])
+
+
+class AdmissionTests(TestCase):
+    async def test_waiting_users_take_turns_and_overflow_is_refused(self):
+        scheduler = Scheduler(max_active=1, max_active_per_user=1, max_waiting_per_user=2, max_wait=5)
+        order = []
+
+        async def submit(key):
+            async with scheduler.aadmit(key):
+                order.append(key)
+                await asyncio.sleep(0)
+
+        holding = scheduler.aadmit('greedy')
+        await holding.__aenter__()
+        waiting = [asyncio.create_task(submit(key)) for key in ('greedy', 'greedy', 'other')]
+        await asyncio.sleep(0)
+        with self.assertRaises(Overloaded) as refused:
+            async with scheduler.aadmit('greedy'):
+                pass
+        self.assertEqual(refused.exception.queue_position, 4)
+        self.assertGreaterEqual(refused.exception.retry_after, 1)
+
+        await holding.__aexit__(None, None, None)
+        await asyncio.gather(*waiting)
+        self.assertEqual(order, ['other', 'greedy', 'greedy'])
+
+        scheduler.max_wait = 0.05
+        async with scheduler.aadmit('greedy'):
+            with self.assertRaises(Overloaded) as timed_out:
+                async with scheduler.aadmit('other'):
+                    pass
+        self.assertEqual(timed_out.exception.queue_position, 1)
+
+    @override_settings(JUDGE_MAX_QUEUED_PER_USER=1)
+    def test_queue_quota_answers_429_with_retry_after(self):
+        user = User.objects.create_user('flooder', password='x')
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/api/compile/', {'code': 'print(1)', 'async': True}, format='json')
+        self.assertEqual(response.status_code, 202)
+        response = client.post('/api/compile/', {'code': 'print(2)', 'async': True}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.data['queue_position'], 1)
+        self.assertEqual(response['Retry-After'], str(response.data['retry_after']))
+        self.assertEqual(JudgeJob.objects.filter(user=user).count(), 1)
+
+
+class QueueQuotaTests(TransactionTestCase):
+    @override_settings(JUDGE_MAX_QUEUED_PER_USER=1)
+    def test_concurrent_submissions_cannot_both_take_the_last_place(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # Threads on the shared in-memory test database fail on a lock instead of waiting for it
+            self.skipTest('needs a database that waits for locks')
+        user = User.objects.create_user('racer')
+        checked = threading.Event()
+        create = JudgeJob.objects.create
+
+        def create_after_the_other_checks(**fields):
+            # Without the lock the other submission would see no job of ours yet and pass too
+            checked.wait(0.5)
+            return create(**fields)
+
+        def submit():
+            try:
+                return enqueue_job(user, JudgeJob.KIND_COMPILE, 'print(1)', 'python')
+            except Overloaded as e:
+                return e
+            finally:
+                connection.close()
+
+        with mock.patch.object(JudgeJob.objects, 'create', side_effect=create_after_the_other_checks):
+            first = threading.Thread(target=submit)
+            first.start()
+            time.sleep(0.1)
+            outcome = submit()
+            checked.set()
+            first.join()
+        self.assertIsInstance(outcome, Overloaded)
+        self.assertEqual(JudgeJob.objects.filter(user=user).count(), 1)
+
+
+class RejudgeTests(BlobStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', password='x')
+        self.challenge = CodingChallenge.objects.create(title='Double', description='', created_by=self.admin)
+        replace_test_cases(self.challenge, [('2\n', '4\n'), ('5\n', '10\n')])
+
+        # Verdicts as the old, wrong test data had them
+        self.users = []
+        for name, code, was_correct in [('doubler', 'print(int(input()) * 2)', False),
+                                        ('squarer', 'print(int(input()) ** 2)', True)]:
+            user = User.objects.create_user(name, password='x')
+            UserProfile.objects.create(user=user, points=1, challenges_completed=int(was_correct))
+            ChallengeSolution.objects.create(user=user, challenge=self.challenge, code=code,
+                                             language='python', is_correct=was_correct)
+            self.users.append(user)
+
+    def test_queued_rejudge_updates_verdicts_and_counters(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post('/api/rejudge/', {'challenges': [self.challenge.pk]}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data[0]['kind'], JudgeJob.KIND_REJUDGE)
+
+        job = process_job(claim_next_job('test'))
+        self.assertEqual(job.status, JudgeJob.STATUS_DONE)
+        self.assertEqual((job.result['judged'], job.result['changed'], job.result['errors']), (2, 2, 0))
+
+        doubler, squarer = self.users
+        for user, correct in [(doubler, True), (squarer, False)]:
+            solution = ChallengeSolution.objects.get(user=user)
+            self.assertEqual(solution.is_correct, correct)
+            self.assertIsNotNone(solution.wall_time)
+            profile = UserProfile.objects.get(user=user)
+            self.assertEqual((profile.challenges_completed, profile.points), (int(correct), 1))
+
+    def test_rejudge_is_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        response = client.post('/api/rejudge/', {'challenges': [self.challenge.pk]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_rejudge_needs_integer_ids(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        for ids in [[], [str(self.challenge.pk)], [True], self.challenge.pk]:
+            response = client.post('/api/rejudge/', {'challenges': ids}, format='json')
+            self.assertEqual(response.status_code, 400, ids)
+        self.assertFalse(JudgeJob.objects.exists())
+
+
+@override_settings(JUDGE_METRICS_DIR='')
+class BenchmarkTests(BlobStoreMixin, TransactionTestCase):
+    def test_scenarios_report_latency_and_phases(self):
+        benchmark = Benchmark(['python'], ['trivial', 'compile_error'], ['compile', 'solve'],
+                              requests=2, concurrency=2)
+        results = benchmark.run()
+
+        self.assertEqual(sorted(results), [
+            'compile/python/compile_error', 'compile/python/trivial',
+            'solve/python/compile_error', 'solve/python/trivial',
+        ])
+        for name, summary in results.items():
+            with self.subTest(scenario=name):
+                self.assertEqual((summary['requests'], summary['unexpected']), (2, 0))
+                self.assertGreater(summary['mean_phase_ms']['run'], 0)
+                self.assertGreater(summary['mean_phase_ms']['db'], 0)
+                self.assertLessEqual(summary['latency_ms']['p50'], summary['latency_ms']['p99'])
+        # The benchmark users and everything they submitted are gone
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Submission.objects.exists())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.metrics_dir)
+        settings_override = self.settings(JUDGE_METRICS_DIR=self.metrics_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        registry = mock.patch.object(metrics, 'REGISTRY', metrics.Registry())
+        registry.start()
+        self.addCleanup(registry.stop)
+        for name in ('_published_at', '_pending'):
+            state = mock.patch.object(metrics, name, None)
+            state.start()
+            self.addCleanup(state.stop)
+
+        self.user = User.objects.create_user('observer', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_judged_submission_is_counted_logged_and_exported(self):
+        with self.assertLogs('compiler.metrics', 'INFO') as logs:
+            response = self.client.post('/api/compile/', {'code': 'print(1)', 'language': 'python'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        logged = json.loads(logs.records[-1].getMessage().split(' ', 1)[1])
+        self.assertEqual((logged['submission'], logged['verdict']), (response.data['submission']['id'], 'ok'))
+        self.assertIn('run', logged['phases'])
+
+        # A queue worker's counts, as it would have published them
+        with open(os.path.join(self.metrics_dir, 'worker-1.json'), 'w') as f:
+            json.dump({'counters': [['judge_verdicts_total', {'kind': 'compile', 'language': 'python', 'verdict': 'ok'}, 2]],
+                       'histograms': []}, f)
+        JudgeJob.objects.create(user=self.user, kind=JudgeJob.KIND_COMPILE, language='python', code='')
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('judge_verdicts_total{kind="compile",language="python",verdict="ok"} 3', body)
+        self.assertIn('judge_phase_seconds_count{phase="run"} 1', body)
+        self.assertIn('judge_queue_jobs{status="queued"} 1', body)
+
+    def snapshot(self, count):
+        return {'counters': [['judge_verdicts_total', {'kind': 'compile', 'language': 'python', 'verdict': 'ok'}, count]],
+                'histograms': []}
+
+    def verdicts(self, registry):
+        return registry.counters[('judge_verdicts_total', (('kind', 'compile'), ('language', 'python'),
+                                                           ('verdict', 'ok')))]
+
+    @override_settings(JUDGE_METRICS_PUBLISH_INTERVAL=60)
+    def test_publishing_is_throttled(self):
+        own = metrics._own_file(self.metrics_dir)
+        with mock.patch.object(metrics, '_write', wraps=metrics._write) as write:
+            metrics.publish()
+            metrics.publish()
+            metrics.publish()
+            self.assertEqual(write.call_count, 1)
+            self.assertIsNotNone(metrics._pending)
+            metrics.inc('judge_verdicts_total', kind='compile', language='python', verdict='ok')
+            metrics.flush()
+            self.assertEqual(write.call_count, 2)
+        self.assertIsNone(metrics._pending)
+        published = metrics.Registry()
+        with open(own) as f:
+            published.merge(json.load(f))
+        self.assertEqual(self.verdicts(published), 1)
+
+    def test_files_of_exited_processes_are_merged(self):
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        host = socket.gethostname()
+        for name, count in ((f'{host}-{exited.pid}-a.json', 2), (f'{host}-exited.json', 3),
+                            (f'other-host-{exited.pid}-b.json', 4)):
+            with open(os.path.join(self.metrics_dir, name), 'w') as f:
+                json.dump(self.snapshot(count), f)
+        metrics.inc('judge_verdicts_total', kind='compile', language='python', verdict='ok')
+        metrics.flush()
+
+        self.assertEqual(sorted(name for name in os.listdir(self.metrics_dir) if not name.startswith('.')),
+                         sorted([f'{host}-exited.json', f'other-host-{exited.pid}-b.json',
+                                 os.path.basename(metrics._own_file(self.metrics_dir))]))
+        with open(os.path.join(self.metrics_dir, f'{host}-exited.json')) as f:
+            merged = metrics.Registry()
+            merged.merge(json.load(f))
+        self.assertEqual(self.verdicts(merged), 5)
+        self.assertEqual(self.verdicts(metrics.collect()), 10)
+
+    def test_files_in_a_directory_others_can_write_to_are_ignored(self):
+        metrics.inc('judge_verdicts_total', kind='compile', language='python', verdict='ok')
+        with open(os.path.join(self.metrics_dir, 'planted.json'), 'w') as f:
+            json.dump({'counters': [['judge_verdicts_total', {'kind': 'compile', 'language': 'python', 'verdict': 'ok'}, 99]],
+                       'histograms': []}, f)
+        os.chmod(self.metrics_dir, 0o777)
+        with self.assertLogs('compiler.metrics', 'ERROR'):
+            total = metrics.collect()
+        self.assertEqual(total.counters[('judge_verdicts_total', (('kind', 'compile'), ('language', 'python'),
+                                                                  ('verdict', 'ok')))], 1)
+
+    def test_metrics_are_local_only(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_X_FORWARDED_FOR='203.0.113.9').status_code, 403)
+
+
+class HistoryListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('historian', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        challenge = CodingChallenge.objects.create(title='Echo', description='', created_by=self.user)
+        ChallengeSolution.objects.create(user=self.user, challenge=challenge, code='print(1)' * 1000, language='python')
+        for _ in range(3):
+            Submission.objects.create(user=self.user, language='python', code='print(1)', stdout='1\n' * 5000)
+
+    def assertSlimList(self, url, omitted, query_count):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), query_count)
+        for column in omitted:
+            self.assertNotIn(f'."{column}"', queries[-1]['sql'])
+        return response.data
+
+    def test_solution_list_leaves_code_behind(self):
+        data = self.assertSlimList('/api/my-solutions/', ['code'], 1)
+        self.assertEqual(data[0]['challenge_title'], 'Echo')
+        self.assertNotIn('code', data[0])
+        detail = self.client.get(f"/api/my-solutions/{data[0]['id']}/").data
+        self.assertEqual(detail['code'], 'print(1)' * 1000)
+
+    def test_submission_list_leaves_code_and_output_behind(self):
+        data = self.assertSlimList('/api/submissions/', ['code', 'stdin', 'stdout', 'stderr'], 2)  # page + COUNT(*)
+        self.assertEqual(data['count'], 3)
+        detail = self.client.get(f"/api/submissions/{data['results'][0]['id']}/").data
+        self.assertEqual(detail['stdout'], '1\n' * 5000)
+
+    @override_settings(JUDGE_OUTPUT_COMPRESS_MIN_BYTES=1024)
+    def test_large_output_is_compressed_at_rest(self):
+        submission = Submission.objects.create(user=self.user, language='python', code='', stdout='x' * 5000, stderr='e')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT stdout, stderr FROM compiler_submission WHERE id = %s', [submission.pk])
+            stdout, stderr = cursor.fetchone()
+        self.assertLess(len(stdout), 100)
+        self.assertEqual(bytes(stderr), b'e')
+        submission.refresh_from_db()
+        self.assertEqual((submission.stdout, submission.stderr), ('x' * 5000, 'e'))
@@ -0,0 +1,42 @@
+import contextlib
+import contextvars
+import time
+from collections import defaultdict
+
+from . import metrics
+
+# Seconds spent per judge phase ("write", "compile", "run", "db") by the
+# request being recorded on this thread; None when nobody is recording
+_phases = contextvars.ContextVar("judge_phases", default=None)
+
+
+@contextlib.contextmanager
+def record_phases():
+    """Collect the time spent in each ``phase()`` entered on this thread into the yielded dict.
+
+    Recordings nest: an inner one's times are added to the outer one when it ends.
+    """
+    parent = _phases.get()
+    phases = defaultdict(float)
+    token = _phases.set(phases)
+    try:
+        yield phases
+    finally:
+        _phases.reset(token)
+        if parent is not None:
+            for name, seconds in phases.items():
+                parent[name] += seconds
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Time the block as phase ``name``: into the active ``record_phases()``, if any, and the metrics."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe("judge_phase_seconds", elapsed, phase=name)
+        phases = _phases.get()
+        if phases is not None:
+            phases[name] += elapsed
@@ -0,0 +1,106 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+from .artifacts import toolchain_version
+from .runners import UnsupportedLanguage, get_runner
+
+KEY_PREFIX = "verdict:"
+
+
+# ----- Key -----
+def normalize_source(code):
+    """``code`` with line endings and trailing whitespace at its end made uniform.
+
+    Nothing inside the program changes, as trailing spaces on a line can be
+    part of a string literal.
+    """
+    return code.replace("\r\n", "\n").replace("\r", "\n").rstrip() + "\n"
+
+
+def test_set_hash(challenge, test_cases):
+    """Content address of what a run is judged against: the test data, in order, and the checker.
+
+    Test data is content-addressed in the blob store, so editing a
+    challenge's tests (or its checker) changes the hash on its own.
+    """
+    digest = hashlib.sha256()
+    for test_case in test_cases:
+        digest.update(f"{test_case.input_blob}:{test_case.output_blob}\n".encode())
+    checker_code = hashlib.sha256(challenge.checker_code.encode()).hexdigest() if challenge.checker_code else ""
+    for part in (challenge.checker, challenge.checker_tolerance, challenge.checker_language, checker_code):
+        digest.update(f"{part}\0".encode())
+    return digest.hexdigest()
+
+
+def verdict_key(challenge, test_cases, code, language, limits):
+    """Cache key of judging ``code`` on ``challenge``; ``None`` when the language isn't supported.
+
+    The compile command is taken with the challenge's compile profile filled in.
+    """
+    try:
+        runner = get_runner(language)
+    except UnsupportedLanguage:
+        return None
+    digest = hashlib.sha256()
+    parts = [runner.name, "\0".join(runner.run_command)]
+    if runner.compile_command:
+        compile_args = runner.compile_args(challenge.compile_profile)
+        parts += [toolchain_version(compile_args[0]), "\0".join(compile_args)]
+    parts += [
+        hashlib.sha256(normalize_source(code).encode()).hexdigest(),
+        test_set_hash(challenge, test_cases),
+        limits.cpu_time, limits.wall_time, limits.memory, limits.file_size, limits.processes, limits.disk_quota,
+    ]
+    for part in parts:
+        digest.update(f"{part}\0".encode())
+    return KEY_PREFIX + digest.hexdigest()
+
+
+# ----- Memo -----
+def _enabled():
+    return getattr(settings, "JUDGE_VERDICT_CACHE_ENABLED", False)
+
+
+def memoizable(compile_error, outcomes):
+    """Whether judging the same code again would certainly give the same results.
+
+    Runs that errored, timed out or hit a limit depend on how busy the judge
+    was, so they are judged again; so is a fail-fast result, whose skipped
+    cases depend on which ran first.
+    """
+    if compile_error is not None:
+        return True
+    return all(outcome is not None and "error" not in outcome and "limit_exceeded" not in outcome
+               for outcome in outcomes)
+
+
+def lookup_verdict(key):
+    """``(compile_error, outcomes)`` judged earlier under ``key``, or ``None``."""
+    if key is None or not _enabled():
+        return None
+    entry = cache.get(key)
+    metrics.inc("judge_cache_requests_total", cache="verdict", result="miss" if entry is None else "hit")
+    return entry
+
+
+async def alookup_verdict(key):
+    if key is None or not _enabled():
+        return None
+    entry = await cache.aget(key)
+    metrics.inc("judge_cache_requests_total", cache="verdict", result="miss" if entry is None else "hit")
+    return entry
+
+
+def remember_verdict(key, compile_error, outcomes):
+    if key is None or not _enabled() or not memoizable(compile_error, outcomes):
+        return
+    cache.set(key, (compile_error, outcomes), timeout=getattr(settings, "JUDGE_VERDICT_CACHE_SECONDS", 86400))
+
+
+async def aremember_verdict(key, compile_error, outcomes):
+    if key is None or not _enabled() or not memoizable(compile_error, outcomes):
+        return
+    await cache.aset(key, (compile_error, outcomes), timeout=getattr(settings, "JUDGE_VERDICT_CACHE_SECONDS", 86400))
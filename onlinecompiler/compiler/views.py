@@ -1,27 +1,50 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions, generics
-from django.contrib.auth.models import User
-from django.db.models import Count
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.parsers import MultiPartParser
 from django.conf import settings
-from django.db import transaction
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.permissions import AllowAny
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
-from .models import Submission, CodingChallenge, ChallengeSolution, UserProfile
+from .models import Submission, CodingChallenge, ChallengeSolution, JudgeJob
 from .serializers import (
     SignupSerializer,
     SubmissionSerializer,
-    UserSerializer,
+    LeaderboardEntrySerializer,
     CodingChallengeSerializer,
-    ChallengeSolutionSerializer
+    ChallengeSolutionSerializer,
+    ChallengeSolutionListSerializer,
+    SubmissionListSerializer,
+    JudgeJobSerializer
 )
 
-import subprocess
-import tempfile
-import os
+from .admission import Overloaded, aadmit, admit
+from .challenge_cache import cached_response
+from .challenge_data import InvalidTestBundle, read_test_bundle, replace_test_cases
+from .judge import ajudge_compile, ajudge_solution, judge_compile, judge_solution
+from .leaderboard import get_ranking, load_entries, rank_of
+from .judge_queue import enqueue_job, queue_depth, wants_async
+from .live import job_event_stream, wait_until_finished
+from . import metrics
+
+import functools
 import json
+import tarfile
+import zipfile
+
+# ----- Admission -----
+def _overloaded(e, response_class=Response):
+    """``429 Too Many Requests`` for an ``Overloaded`` submission, with ``Retry-After`` and its queue position."""
+    return response_class(e.payload(), status=status.HTTP_429_TOO_MANY_REQUESTS,
+                          headers={"Retry-After": str(e.retry_after)})
 
 # ----- Custom Token Serializer -----
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -65,111 +88,40 @@ class CompileCodeView(APIView):
         language = request.data.get("language", "python").lower()
         user_input = request.data.get("stdin", "")
 
-        result_data = {}
         try:
-            if language == "python":
-                with tempfile.NamedTemporaryFile(suffix=".py", delete=False) as tmp_file:
-                    tmp_file.write(code.encode())
-                    tmp_filename = tmp_file.name
-                result = subprocess.run(
-                    ["python", tmp_filename],
-                    input=user_input,  # Fixed: removed .encode()
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                os.remove(tmp_filename)
-                result_data = {
-                    "stdout": result.stdout,
-                    "stderr": result.stderr,
-                    "returncode": result.returncode
-                }
-
-            elif language == "java":
-                with tempfile.TemporaryDirectory() as tmpdir:
-                    java_file = os.path.join(tmpdir, "Main.java")
-                    with open(java_file, "w") as f:
-                        f.write(code)
-                    compile_proc = subprocess.run(
-                        ["javac", java_file],
-                        capture_output=True, text=True
-                    )
-                    if compile_proc.returncode != 0:
-                        result_data = {
-                            "stdout": compile_proc.stdout,
-                            "stderr": compile_proc.stderr,
-                            "returncode": compile_proc.returncode
-                        }
-                    else:
-                        run_proc = subprocess.run(
-                            ["java", "-cp", tmpdir, "Main"],
-                            input=user_input,  # Fixed: removed .encode()
-                            capture_output=True, text=True,
-                            timeout=5
-                        )
-                        result_data = {
-                            "stdout": run_proc.stdout,
-                            "stderr": run_proc.stderr,
-                            "returncode": run_proc.returncode
-                        }
-
-            elif language in ["c++", "cpp"]:
-                with tempfile.TemporaryDirectory() as tmpdir:
-                    cpp_file = os.path.join(tmpdir, "main.cpp")
-                    with open(cpp_file, "w") as f:
-                        f.write(code)
-                    exe_file = os.path.join(tmpdir, "main.out")
-                    compile_proc = subprocess.run(
-                        ["g++", cpp_file, "-o", exe_file],
-                        capture_output=True, text=True
-                    )
-                    if compile_proc.returncode != 0:
-                        result_data = {
-                            "stdout": compile_proc.stdout,
-                            "stderr": compile_proc.stderr,
-                            "returncode": compile_proc.returncode
-                        }
-                    else:
-                        run_proc = subprocess.run(
-                            [exe_file],
-                            input=user_input,  # Fixed: removed .encode()
-                            capture_output=True, text=True,
-                            timeout=5
-                        )
-                        result_data = {
-                            "stdout": run_proc.stdout,
-                            "stderr": run_proc.stderr,
-                            "returncode": run_proc.returncode
-                        }
-            else:
-                return Response({"error": "Unsupported language."}, status=status.HTTP_400_BAD_REQUEST)
-
-        except subprocess.TimeoutExpired:
-            return Response({"error": f"{language.capitalize()} code execution timed out."}, status=status.HTTP_408_REQUEST_TIMEOUT)
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        submission = Submission.objects.create(
-            user=request.user,
-            language=language,
-            code=code,
-            stdin=user_input,
-            stdout=result_data.get("stdout", ""),
-            stderr=result_data.get("stderr", ""),
-            returncode=result_data.get("returncode", 0)
-        )
-
-        submission_data = SubmissionSerializer(submission).data
-        return Response({"result": result_data, "submission": submission_data})
+            if wants_async(request.data):
+                job = enqueue_job(request.user, JudgeJob.KIND_COMPILE, code, language, stdin=user_input)
+                return Response(JudgeJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+            with admit(request.user):
+                payload, status_code = judge_compile(request.user, code, language, user_input)
+        except Overloaded as e:
+            return _overloaded(e)
+        return Response(payload, status=status_code)
 
 # ----- Leaderboard -----
+class LeaderboardPagination(LimitOffsetPagination):
+    default_limit = 50
+    max_limit = 200
+
+    me = None  # The requesting user's rank, from the same ranking as the page
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data["me"] = self.me
+        return response
+
 class LeaderboardView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        users = User.objects.filter(profile__isnull=False).order_by('-profile__points')
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        # Paginate the cached ranking, then load stats for just this page
+        ranking = get_ranking()
+        paginator = LeaderboardPagination()
+        paginator.me = rank_of(request.user, ranking)
+        entries = paginator.paginate_queryset(ranking["order"], request, view=self)
+        serializer = LeaderboardEntrySerializer(load_entries(entries), many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 # ----- Coding Challenges Views -----
 class CodingChallengeListCreate(generics.ListCreateAPIView):
@@ -182,8 +134,16 @@ class CodingChallengeListCreate(generics.ListCreateAPIView):
     
     def get_queryset(self):
         if self.request.user.is_superuser:
-            return CodingChallenge.objects.all()
-        return CodingChallenge.objects.filter(is_active=True)
+            queryset = CodingChallenge.objects.all()
+        else:
+            queryset = CodingChallenge.objects.filter(is_active=True)
+        difficulty = self.request.query_params.get('difficulty')
+        if difficulty:
+            queryset = queryset.filter(difficulty=difficulty)
+        return queryset
+    
+    def list(self, request, *args, **kwargs):
+        return cached_response(request, functools.partial(super().list, request, *args, **kwargs))
     
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
@@ -201,99 +161,43 @@ class CodingChallengeDetail(generics.RetrieveUpdateDestroyAPIView):
         if self.request.user.is_superuser:
             return CodingChallenge.objects.all()
         return CodingChallenge.objects.filter(is_active=True)
+    
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(request, functools.partial(super().retrieve, request, *args, **kwargs))
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['include_test_cases'] = True
+        return context
+
+class ChallengeTestBundleView(APIView):
+    """Replace a challenge's test cases with the ``<name>.in``/``<name>.out`` pairs of an uploaded zip or tar."""
+    permission_classes = [IsSuperUser]
+    parser_classes = [MultiPartParser]
+    
+    def post(self, request, pk):
+        try:
+            challenge = CodingChallenge.objects.get(pk=pk)
+        except CodingChallenge.DoesNotExist:
+            return Response({"error": "Challenge not found."}, status=status.HTTP_404_NOT_FOUND)
+        
+        bundle = request.FILES.get("file")
+        if bundle is None:
+            return Response({"error": "Upload the test bundle as \"file\"."}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Large uploads arrive as a temporary file and are copied into the
+        # blob store member by member
+        try:
+            cases = replace_test_cases(challenge, read_test_bundle(bundle))
+        except (InvalidTestBundle, zipfile.BadZipFile, tarfile.TarError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({"challenge": challenge.pk, "test_cases": len(cases)}, status=status.HTTP_200_OK)
 
 # ----- Challenge Solution Execution (Fixed input handling) -----
 class ChallengeSolutionView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
-    def execute_code(self, code, language, input_data):
-        result_data = {}
-        try:
-            if language == "python":
-                with tempfile.NamedTemporaryFile(suffix=".py", delete=False) as tmp_file:
-                    tmp_file.write(code.encode())
-                    tmp_filename = tmp_file.name
-                result = subprocess.run(
-                    ["python", tmp_filename],
-                    input=input_data,  # Fixed: removed .encode()
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                os.remove(tmp_filename)
-                result_data = {
-                    "stdout": result.stdout.strip(),
-                    "stderr": result.stderr,
-                    "returncode": result.returncode
-                }
-
-            elif language == "java":
-                with tempfile.TemporaryDirectory() as tmpdir:
-                    java_file = os.path.join(tmpdir, "Main.java")
-                    with open(java_file, "w") as f:
-                        f.write(code)
-                    compile_proc = subprocess.run(
-                        ["javac", java_file],
-                        capture_output=True, text=True
-                    )
-                    if compile_proc.returncode != 0:
-                        result_data = {
-                            "stdout": "",
-                            "stderr": compile_proc.stderr,
-                            "returncode": compile_proc.returncode
-                        }
-                    else:
-                        run_proc = subprocess.run(
-                            ["java", "-cp", tmpdir, "Main"],
-                            input=input_data,  # Fixed: removed .encode()
-                            capture_output=True, text=True,
-                            timeout=5
-                        )
-                        result_data = {
-                            "stdout": run_proc.stdout.strip(),
-                            "stderr": run_proc.stderr,
-                            "returncode": run_proc.returncode
-                        }
-
-            elif language in ["c++", "cpp"]:
-                with tempfile.TemporaryDirectory() as tmpdir:
-                    cpp_file = os.path.join(tmpdir, "main.cpp")
-                    with open(cpp_file, "w") as f:
-                        f.write(code)
-                    exe_file = os.path.join(tmpdir, "main.out")
-                    compile_proc = subprocess.run(
-                        ["g++", cpp_file, "-o", exe_file],
-                        capture_output=True, text=True
-                    )
-                    if compile_proc.returncode != 0:
-                        result_data = {
-                            "stdout": "",
-                            "stderr": compile_proc.stderr,
-                            "returncode": compile_proc.returncode
-                        }
-                    else:
-                        run_proc = subprocess.run(
-                            [exe_file],
-                            input=input_data,  # Fixed: removed .encode()
-                            capture_output=True, text=True,
-                            timeout=5
-                        )
-                        result_data = {
-                            "stdout": run_proc.stdout.strip(),
-                            "stderr": run_proc.stderr,
-                            "returncode": run_proc.returncode
-                        }
-            else:
-                result_data = {"error": "Unsupported language."}
-                
-        except subprocess.TimeoutExpired:
-            result_data = {"error": f"{language.capitalize()} code execution timed out."}
-        except Exception as e:
-            result_data = {"error": str(e)}
-            
-        return result_data
-    
-    @transaction.atomic
     def post(self, request, challenge_id):
         try:
             challenge = CodingChallenge.objects.get(pk=challenge_id, is_active=True)
@@ -302,63 +206,247 @@ class ChallengeSolutionView(APIView):
             
         code = request.data.get("code", "")
         language = request.data.get("language", "python").lower()
-        test_cases = challenge.test_cases
         
-        if not test_cases:
+        if not challenge.cases.exists():
             return Response({"error": "No test cases available for this challenge."}, status=status.HTTP_400_BAD_REQUEST)
-            
-        all_passed = True
-        test_results = []
-        
-        for i, test_case in enumerate(test_cases):
-            input_data = test_case.get("input", "")
-            expected_output = test_case.get("output", "").strip()
-            
-            result = self.execute_code(code, language, input_data)
-            
-            if "error" in result:
-                return Response(result, status=status.HTTP_400_BAD_REQUEST)
-                
-            actual_output = result.get("stdout", "").strip()
-            test_passed = actual_output == expected_output and result.get("returncode") == 0
-            
-            if not test_passed:
-                all_passed = False
-                
-            if i == 0 or request.user.is_superuser:
-                test_results.append({
-                    "test_case": i + 1,
-                    "passed": test_passed,
-                    "input": input_data,
-                    "expected_output": expected_output,
-                    "actual_output": actual_output
-                })
-            else:
-                test_results.append({"test_case": i + 1, "passed": test_passed})
         
-        solution, created = ChallengeSolution.objects.update_or_create(
-            user=request.user,
-            challenge=challenge,
-            defaults={"code": code, "language": language, "is_correct": all_passed}
-        )
+        try:
+            if wants_async(request.data):
+                job = enqueue_job(request.user, JudgeJob.KIND_SOLVE, code, language, challenge=challenge)
+                return Response(JudgeJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+            with admit(request.user):
+                payload, status_code = judge_solution(request.user, challenge, code, language)
+        except Overloaded as e:
+            return _overloaded(e)
+        return Response(payload, status=status_code)
+
+class RejudgeView(APIView):
+    """Queue a re-judge of every stored solution of the given challenges, one job per challenge."""
+    permission_classes = [IsSuperUser]
+    
+    def post(self, request):
+        ids = request.data.get("challenges")
+        if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            return Response({"error": "Give the challenges to re-judge as a list of ids."}, status=status.HTTP_400_BAD_REQUEST)
         
-        if all_passed and created:
-            profile, _ = UserProfile.objects.get_or_create(user=request.user)
-            profile.points += 1
-            profile.save()
-            
-        solution_data = ChallengeSolutionSerializer(solution).data
+        challenges = CodingChallenge.objects.filter(pk__in=ids).order_by("pk")
+        missing = set(ids) - {challenge.pk for challenge in challenges}
+        if missing:
+            return Response({"error": f"Challenges not found: {sorted(missing)}"}, status=status.HTTP_404_NOT_FOUND)
         
-        return Response({
-            "solution": solution_data,
-            "all_tests_passed": all_passed,
-            "test_results": test_results
-        })
+        # Always queued: a challenge with thousands of solutions outlives any request
+        jobs = [enqueue_job(request.user, JudgeJob.KIND_REJUDGE, "", "", challenge=challenge) for challenge in challenges]
+        return Response(JudgeJobSerializer(jobs, many=True).data, status=status.HTTP_202_ACCEPTED)
+
+# ----- Judge Jobs -----
+class JudgeJobDetailView(APIView):
+    """A job as it is now. ``?wait=`` is ignored here: a waiting request would hold one of few threads.
+
+    ``job_detail_async`` honours it under ASGI.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, pk):
+        jobs = JudgeJob.objects.all() if request.user.is_superuser else JudgeJob.objects.filter(user=request.user)
+        try:
+            job = jobs.get(pk=pk)
+        except JudgeJob.DoesNotExist:
+            return Response({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(JudgeJobSerializer(job).data)
+
+# ----- Async Views (ASGI) -----
+# Plain Django async views rather than APIViews, which can only run in a
+# thread. They authenticate with the same JWTs and answer with the same bodies.
+
+async def _jwt_user(request, raw_token=None):
+    """``(user, None)`` for the request's ``Authorization: Bearer`` token (else ``raw_token``), or ``(None, 401 response)``."""
+    authenticator = JWTAuthentication()
+    header = authenticator.get_header(request)
+    if header:
+        raw_token = authenticator.get_raw_token(header)
+    if not raw_token:
+        return None, JsonResponse({"detail": "Authentication credentials were not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+    try:
+        return await sync_to_async(authenticator.get_user)(authenticator.get_validated_token(raw_token)), None
+    except (InvalidToken, AuthenticationFailed) as e:
+        return None, JsonResponse({"detail": str(e.default_detail)}, status=status.HTTP_401_UNAUTHORIZED)
+
+def _json_body(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+# Seconds a client may long-poll a job for
+JOB_MAX_WAIT = 30
+
+@require_GET
+async def job_detail_async(request, pk):
+    """``JudgeJobDetailView`` where ``?wait=N`` holds the request open until the verdict is in or N seconds pass.
+
+    The wait is a subscription to the job watcher (see ``live``), so it holds
+    no thread and no database connection.
+    """
+    user, denied = await _jwt_user(request)
+    if denied:
+        return denied
+    
+    jobs = JudgeJob.objects.all() if user.is_superuser else JudgeJob.objects.filter(user=user)
+    try:
+        job = await jobs.aget(pk=pk)
+    except JudgeJob.DoesNotExist:
+        return JsonResponse({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        wait = min(float(request.GET.get("wait", 0)), JOB_MAX_WAIT)
+    except ValueError:
+        wait = 0
+    if wait > 0 and not job.is_finished:
+        job = await wait_until_finished(job, wait)
+        if job is None:
+            return JsonResponse({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+    return JsonResponse(JudgeJobSerializer(job).data)
+
+@csrf_exempt
+@require_POST
+async def compile_code_async(request):
+    """``CompileCodeView`` with the build and run awaited, so a waiting request holds no thread."""
+    user, denied = await _jwt_user(request)
+    if denied:
+        return denied
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({"error": "Expected a JSON object."}, status=status.HTTP_400_BAD_REQUEST)
+    
+    code = data.get("code", "")
+    language = data.get("language", "python").lower()
+    user_input = data.get("stdin", "")
+    
+    try:
+        if wants_async(data):
+            job = await sync_to_async(enqueue_job)(user, JudgeJob.KIND_COMPILE, code, language, stdin=user_input)
+            return JsonResponse(JudgeJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+        async with aadmit(user):
+            payload, status_code = await ajudge_compile(user, code, language, user_input)
+    except Overloaded as e:
+        return _overloaded(e, JsonResponse)
+    return JsonResponse(payload, status=status_code)
+
+@csrf_exempt
+@require_POST
+async def solve_challenge_async(request, challenge_id):
+    """``ChallengeSolutionView`` with the build and runs awaited, so a waiting request holds no thread."""
+    user, denied = await _jwt_user(request)
+    if denied:
+        return denied
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({"error": "Expected a JSON object."}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        challenge = await CodingChallenge.objects.aget(pk=challenge_id, is_active=True)
+    except CodingChallenge.DoesNotExist:
+        return JsonResponse({"error": "Challenge not found or inactive."}, status=status.HTTP_404_NOT_FOUND)
+    
+    code = data.get("code", "")
+    language = data.get("language", "python").lower()
+    
+    if not await challenge.cases.aexists():
+        return JsonResponse({"error": "No test cases available for this challenge."}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        if wants_async(data):
+            job = await sync_to_async(enqueue_job)(user, JudgeJob.KIND_SOLVE, code, language, challenge=challenge)
+            return JsonResponse(JudgeJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+        async with aadmit(user):
+            payload, status_code = await ajudge_solution(user, challenge, code, language)
+    except Overloaded as e:
+        return _overloaded(e, JsonResponse)
+    return JsonResponse(payload, status=status_code)
+
+async def job_events_view(request, pk):
+    """Stream a job's progress and verdict as Server-Sent Events; see ``live.job_event_stream``.
+
+    Also takes ``?access_token=`` for browsers' EventSource, which can't set headers.
+    """
+    user, denied = await _jwt_user(request, request.GET.get("access_token"))
+    if denied:
+        return denied
+    
+    jobs = JudgeJob.objects.all() if user.is_superuser else JudgeJob.objects.filter(user=user)
+    try:
+        job = await jobs.aget(pk=pk)
+    except JudgeJob.DoesNotExist:
+        return JsonResponse({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        last_event_id = int(request.headers.get("Last-Event-ID", ""))
+    except ValueError:
+        last_event_id = None
+    response = StreamingHttpResponse(job_event_stream(job, last_event_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx would otherwise hold events back
+    return response
 
 # ----- User Solutions -----
 class UserSolutionsView(generics.ListAPIView):
+    serializer_class = ChallengeSolutionListSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        # Code stays behind; the detail endpoint serves it
+        return (ChallengeSolution.objects.filter(user=self.request.user)
+                .select_related('user', 'challenge')
+                .only('id', 'user__username', 'challenge__title', 'language', 'is_correct',
+                      'cpu_time', 'wall_time', 'peak_memory_kb', 'created_at')
+                .order_by('-created_at'))
+
+class UserSolutionDetailView(generics.RetrieveAPIView):
     serializer_class = ChallengeSolutionSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return ChallengeSolution.objects.filter(user=self.request.user)
\ No newline at end of file
+        return ChallengeSolution.objects.filter(user=self.request.user).select_related('user', 'challenge')
+
+# ----- Submissions -----
+class SubmissionPagination(LimitOffsetPagination):
+    default_limit = 50
+    max_limit = 200
+
+class SubmissionListView(generics.ListAPIView):
+    serializer_class = SubmissionListSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SubmissionPagination
+    
+    def get_queryset(self):
+        # Code, stdin and output stay behind; the detail endpoint serves them
+        return (Submission.objects.filter(user=self.request.user)
+                .only('id', 'language', 'returncode', 'cpu_time', 'wall_time', 'peak_memory_kb', 'created_at')
+                .order_by('-created_at'))
+
+class SubmissionDetailView(generics.RetrieveAPIView):
+    serializer_class = SubmissionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        if self.request.user.is_superuser:
+            return Submission.objects.all()
+        return Submission.objects.filter(user=self.request.user)
+
+# ----- Metrics -----
+def metrics_view(request):
+    """Judge metrics of every process on this node, in the Prometheus text format.
+
+    Only answered for clients in ``JUDGE_METRICS_ALLOWED_IPS`` that didn't come
+    through a proxy, since a proxy on the same host would make every client
+    look local.
+    """
+    allowed = getattr(settings, "JUDGE_METRICS_ALLOWED_IPS", ["127.0.0.1", "::1"])
+    if request.META.get("REMOTE_ADDR") not in allowed or "HTTP_X_FORWARDED_FOR" in request.META:
+        return HttpResponseForbidden()
+    gauges = [("judge_queue_jobs", {"status": job_status}, n) for job_status, n in queue_depth().items()]
+    return HttpResponse(metrics.render(metrics.collect(), gauges), content_type="text/plain; version=0.0.4")
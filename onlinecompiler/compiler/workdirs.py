@@ -0,0 +1,205 @@
+import atexit
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import uuid
+
+from django.conf import settings
+
+from .datadir import data_path, private_dir
+
+logger = logging.getLogger(__name__)
+
+RAM_ROOT = "/dev/shm"
+
+
+# ----- Root -----
+def _usable(path):
+    """Whether programs can be written to and executed from ``path``."""
+    try:
+        flags = os.statvfs(path).f_flag
+    except OSError:
+        return False
+    return os.access(path, os.W_OK | os.X_OK) and not flags & (os.ST_NOEXEC | os.ST_RDONLY)
+
+
+def default_root():
+    """``JUDGE_WORKDIR_ROOT``, else ``/dev/shm`` when it can hold executables, else ``work`` under ``JUDGE_DATA_DIR``.
+
+    The directory on ``/dev/shm`` is named after this user and must be
+    private (see ``datadir.private_dir``): programs are built and run from
+    it. When another user got there first, the data directory is used.
+    """
+    root = getattr(settings, "JUDGE_WORKDIR_ROOT", "")
+    if root:
+        return root
+    if _usable(RAM_ROOT):
+        root = os.path.join(RAM_ROOT, f"judge-work-{os.geteuid()}")
+        try:
+            return private_dir(root)
+        except OSError:
+            logger.exception("Work directories are not kept in memory")
+    return data_path("work")
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def directory_size(path):
+    """Bytes used by the files under ``path``; files removed while walking are skipped."""
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+    return total
+
+
+def link_tree(source, target):
+    """Hard-link everything under ``source`` into the existing directory ``target``, copying what can't be linked.
+
+    The files are made read-only first: a link shares its file with the
+    original, so a run may replace its own link but not change the file.
+    """
+    for dirpath, dirnames, filenames in os.walk(source):
+        destination = os.path.normpath(os.path.join(target, os.path.relpath(dirpath, source)))
+        for name in dirnames:
+            os.mkdir(os.path.join(destination, name))
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            mode = os.lstat(path).st_mode
+            if stat.S_ISREG(mode) and mode & 0o222:
+                os.chmod(path, stat.S_IMODE(mode) & ~0o222)
+            try:
+                os.link(path, os.path.join(destination, name), follow_symlinks=False)
+            except OSError:
+                shutil.copy2(path, os.path.join(destination, name), follow_symlinks=False)
+
+
+def _empty(path):
+    """Remove everything inside ``path`` but keep ``path`` itself."""
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+# ----- Pool -----
+class WorkdirPool:
+    """Work directories created once per process and emptied between submissions.
+
+    The process keeps ``size`` directories under ``<root>/<pid>-<id>/``.
+    ``acquire()`` hands out a free one, or a one-off extra directory when all
+    are taken, so callers never wait; ``release()`` empties it for the next
+    submission (the one-offs are removed). On a RAM-backed root this turns
+    a submission's directory create/delete into a few unlinks in memory.
+    Directories left behind by processes that died are removed when the next
+    pool starts, and a process removes its own when it exits. The root and
+    the process's directory are private (see ``datadir.private_dir``), so
+    nobody else can swap a program between its compile and its runs.
+    """
+
+    def __init__(self, root, size):
+        self.root = root
+        self.home = os.path.join(root, f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        self._lock = threading.Lock()
+        private_dir(root)
+        self._sweep()
+        private_dir(self.home)
+        self._slots = set()
+        self._free = []
+        for i in range(size):
+            path = os.path.join(self.home, f"slot-{i}")
+            os.mkdir(path)
+            self._slots.add(path)
+            self._free.append(path)
+
+    def _sweep(self):
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+        for name in names:
+            pid, _, _ = name.partition("-")
+            if pid.isdigit() and not pid_alive(int(pid)):
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return tempfile.mkdtemp(prefix="extra-", dir=self.home)
+
+    def release(self, path):
+        if path not in self._slots:
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        try:
+            _empty(path)
+        except OSError:
+            # Couldn't be emptied; swap in a fresh directory rather than hand out leftovers
+            shutil.rmtree(path, ignore_errors=True)
+            os.makedirs(path, exist_ok=True)
+        with self._lock:
+            self._free.append(path)
+
+    def close(self):
+        shutil.rmtree(self.home, ignore_errors=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_workdir_pool():
+    """This process's pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkdirPool(default_root(), getattr(settings, "JUDGE_WORKDIR_POOL_SIZE", 8))
+        return _pool
+
+
+def _forget_parent_pool():
+    # A forked worker must not hand out (or delete) its parent's directories
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_parent_pool)
+
+
+@atexit.register
+def close_workdir_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
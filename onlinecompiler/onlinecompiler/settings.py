@@ -1,6 +1,8 @@
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'replace-this-with-a-strong-secret-key'
@@ -49,14 +51,63 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'onlinecompiler.wsgi.application'
 
-# Database (use SQLite for simplicity)
-DATABASES = {
+# Database profile: DATABASE_PROFILE=sqlite (default, WAL journal) or postgres
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'sqlite')
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 60))  # seconds; 0 closes after each request
+
+if DATABASE_PROFILE == 'postgres':
+    # Needs psycopg: pip install "psycopg[binary]"
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'onlinecompiler'),
+            'USER': os.environ.get('POSTGRES_USER', 'onlinecompiler'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': 20,  # wait this long for the write lock instead of failing with "database is locked"
+                # Take the write lock when a transaction starts. A deferred transaction
+                # that reads and then writes (select_for_update is a no-op here) can't
+                # wait for the lock and fails at once when another writer got in first
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+SQLITE_WAL = os.environ.get('SQLITE_WAL', '1') == '1'  # WAL lets readers run alongside the judge's writes
+
+# Judge: private (0700) working data of this host, whose programs the judge runs: compiled artifacts and
+# runtime helpers. Directories other users can write to are refused
+JUDGE_DATA_DIR = os.environ.get('JUDGE_DATA_DIR', str(BASE_DIR / 'judge-data'))
+
+# Cache (file-based so every gunicorn worker and judge process sees the same entries). Its entries are unpickled
+# when read, so by default it lives in JUDGE_DATA_DIR and a directory other users can write to is refused
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'compiler.filecache.PrivateFileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(JUDGE_DATA_DIR, 'cache')),
     }
 }
 
+# Challenge list and details, cached in CACHES per audience until a challenge changes, with ETag / Last-Modified.
+# A file or shared cache keeps every server process in step; LocMemCache only suits a single process
+CHALLENGE_CACHE_ENABLED = os.environ.get('CHALLENGE_CACHE_ENABLED', '1') == '1'
+CHALLENGE_CACHE_SECONDS = int(os.environ.get('CHALLENGE_CACHE_SECONDS', 60 * 60))
+
+# Leaderboard ranking, cached in CACHES and updated in place as points change; rebuilt at the latest after this
+LEADERBOARD_CACHE_SECONDS = int(os.environ.get('LEADERBOARD_CACHE_SECONDS', 300))
+
 # Django REST Framework + JWT
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -86,3 +137,116 @@ AUTH_PASSWORD_VALIDATORS = [
 # Static files
 STATIC_URL = '/static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Judge: how each language is built and run is compiler.runners.DEFAULT_LANGUAGES. More languages, or
+# different flags, can be given as a JSON object of the same shape in JUDGE_LANGUAGES_FILE; its entries
+# replace or extend the defaults
+JUDGE_LANGUAGES_FILE = os.environ.get('JUDGE_LANGUAGES_FILE')
+
+# Judge: on-disk cache of compiled artifacts, keyed by language, compiler version, flags and source
+JUDGE_ARTIFACT_CACHE_ENABLED = os.environ.get('JUDGE_ARTIFACT_CACHE_ENABLED', '1') == '1'
+JUDGE_ARTIFACT_CACHE_DIR = os.environ.get('JUDGE_ARTIFACT_CACHE_DIR', os.path.join(JUDGE_DATA_DIR, 'artifacts'))
+JUDGE_ARTIFACT_CACHE_MAX_BYTES = int(os.environ.get('JUDGE_ARTIFACT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Judge: opt-in long-lived javac compiling Java submissions in-process over a UNIX socket, replaced
+# after this many compiles; plain javac is used whenever it is off or can't answer
+JUDGE_JAVAC_SERVER = os.environ.get('JUDGE_JAVAC_SERVER', '0') == '1'
+JUDGE_JAVAC_SERVER_MAX_COMPILES = int(os.environ.get('JUDGE_JAVAC_SERVER_MAX_COMPILES', 500))
+
+# Judge: precompiled C++ headers, built in the background once per compiler version and compile profile.
+# Every C++ submission includes them, so their directory must be private like JUDGE_DATA_DIR
+JUDGE_CPP_PCH_ENABLED = os.environ.get('JUDGE_CPP_PCH_ENABLED', '1') == '1'
+JUDGE_CPP_PCH_DIR = os.environ.get('JUDGE_CPP_PCH_DIR', os.path.join(JUDGE_DATA_DIR, 'pch'))
+
+# Judge: verdicts of solutions, kept in CACHES and keyed by language, source, test data, checker and limits
+JUDGE_VERDICT_CACHE_ENABLED = os.environ.get('JUDGE_VERDICT_CACHE_ENABLED', '1') == '1'
+JUDGE_VERDICT_CACHE_SECONDS = int(os.environ.get('JUDGE_VERDICT_CACHE_SECONDS', 24 * 60 * 60))
+
+# Judge: queued submissions, drained by `python manage.py judge_worker`
+JUDGE_ASYNC_DEFAULT = os.environ.get('JUDGE_ASYNC_DEFAULT', '0') == '1'  # queue even when the client doesn't send "async"
+JUDGE_WORKERS = int(os.environ.get('JUDGE_WORKERS', 2))
+JUDGE_QUEUE_POLL_INTERVAL = float(os.environ.get('JUDGE_QUEUE_POLL_INTERVAL', 0.5))
+JUDGE_QUEUE_HEARTBEAT_INTERVAL = float(os.environ.get('JUDGE_QUEUE_HEARTBEAT_INTERVAL', 10))
+JUDGE_QUEUE_STALE_AFTER = int(os.environ.get('JUDGE_QUEUE_STALE_AFTER', 60))  # seconds without a heartbeat
+JUDGE_MAX_QUEUED_PER_USER = int(os.environ.get('JUDGE_MAX_QUEUED_PER_USER', 20))  # queued or running; 0 = no quota
+
+# Judge: admission of /api/compile/ and /solve/ judgings. Every server process has a scheduler of its own, so the
+# JUDGE_PROCESS_MAX_* caps hold per process, not per host. Beyond them judgings wait (fairly between users, staff
+# getting JUDGE_STAFF_WEIGHT turns to everyone else's one) or get 429 with Retry-After
+JUDGE_ADMISSION_ENABLED = os.environ.get('JUDGE_ADMISSION_ENABLED', '1') == '1'
+JUDGE_PROCESS_MAX_ACTIVE = int(os.environ.get('JUDGE_PROCESS_MAX_ACTIVE', os.cpu_count() or 1))
+JUDGE_PROCESS_MAX_ACTIVE_PER_USER = int(os.environ.get('JUDGE_PROCESS_MAX_ACTIVE_PER_USER', 2))
+JUDGE_PROCESS_MAX_WAITING = int(os.environ.get('JUDGE_PROCESS_MAX_WAITING', 100))
+JUDGE_PROCESS_MAX_WAITING_PER_USER = int(os.environ.get('JUDGE_PROCESS_MAX_WAITING_PER_USER', 4))
+JUDGE_MAX_WAIT_SECONDS = float(os.environ.get('JUDGE_MAX_WAIT_SECONDS', 10))
+JUDGE_STAFF_WEIGHT = int(os.environ.get('JUDGE_STAFF_WEIGHT', 2))
+
+# Judge: with JUDGE_ASYNC_VIEWS (for ASGI servers) /api/compile/ and /solve/ await their runs on the event loop.
+# Each server process lets at most JUDGE_ASYNC_MAX_RUNS programs execute at once; split the host's cores between processes
+JUDGE_ASYNC_VIEWS = os.environ.get('JUDGE_ASYNC_VIEWS', '0') == '1'
+JUDGE_ASYNC_MAX_RUNS = int(os.environ.get('JUDGE_ASYNC_MAX_RUNS', os.cpu_count() or 1))
+
+# Judge: live job events at /api/jobs/<id>/events/ (serve through asgi.py so open streams hold no thread)
+JUDGE_EVENTS_POLL_INTERVAL = float(os.environ.get('JUDGE_EVENTS_POLL_INTERVAL', 0.25))
+JUDGE_EVENTS_PUBLISH_INTERVAL = float(os.environ.get('JUDGE_EVENTS_PUBLISH_INTERVAL', 0.25))  # worker side; at most one write per job
+JUDGE_EVENTS_MAX_SECONDS = int(os.environ.get('JUDGE_EVENTS_MAX_SECONDS', 300))  # then the client reconnects
+
+# Judge: test cases of one submission run concurrently, at most this many at a time
+JUDGE_TEST_WORKERS = int(os.environ.get('JUDGE_TEST_WORKERS', os.cpu_count() or 1))
+JUDGE_FAIL_FAST = os.environ.get('JUDGE_FAIL_FAST', '0') == '1'  # stop at the first failing test case
+
+# Judge: opt-in pre-warmed runners, e.g. JUDGE_WARM_RUNTIMES=python,java
+WARM_RUNTIME_DEFAULTS = {
+    'python': {'max_runs': 500},  # fork-server recycled after this many runs
+    'java': {'size': 2, 'max_runs': 100},  # persistent JVMs, each recycled after this many runs
+}
+JUDGE_WARM_RUNTIMES = {}
+for language in filter(None, (name.strip() for name in os.environ.get('JUDGE_WARM_RUNTIMES', '').split(','))):
+    if language not in WARM_RUNTIME_DEFAULTS:
+        raise ImproperlyConfigured(
+            f"JUDGE_WARM_RUNTIMES: unknown runtime {language!r}; choose from {', '.join(WARM_RUNTIME_DEFAULTS)}."
+        )
+    JUDGE_WARM_RUNTIMES[language] = WARM_RUNTIME_DEFAULTS[language]
+
+# Judge: work directories are reused from a per-process pool, on /dev/shm when it allows executables (else under
+# JUDGE_DATA_DIR). Their root must be private like JUDGE_DATA_DIR. The quota caps all files a run leaves in its directory (0 = unlimited)
+JUDGE_WORKDIR_ROOT = os.environ.get('JUDGE_WORKDIR_ROOT', '')
+JUDGE_WORKDIR_POOL_SIZE = int(os.environ.get('JUDGE_WORKDIR_POOL_SIZE', 8))
+JUDGE_WORKDIR_QUOTA_BYTES = int(os.environ.get('JUDGE_WORKDIR_QUOTA_BYTES', 64 * 1024 * 1024))
+
+# Judge: test case inputs and expected outputs, stored by content hash
+JUDGE_BLOB_DIR = os.environ.get('JUDGE_BLOB_DIR', str(BASE_DIR / 'testdata'))
+
+# Judge: stored submission output of at least this size is compressed ("gzip", "zstd" or "none"; zstd needs zstandard)
+JUDGE_OUTPUT_COMPRESSION = os.environ.get('JUDGE_OUTPUT_COMPRESSION', 'gzip')
+JUDGE_OUTPUT_COMPRESS_MIN_BYTES = int(os.environ.get('JUDGE_OUTPUT_COMPRESS_MIN_BYTES', 1024))
+
+# Judge: a run writing more than this to stdout or stderr is killed; only the head and tail are kept
+JUDGE_OUTPUT_LIMIT_BYTES = int(os.environ.get('JUDGE_OUTPUT_LIMIT_BYTES', 16 * 1024 * 1024))
+JUDGE_OUTPUT_KEEP_BYTES = int(os.environ.get('JUDGE_OUTPUT_KEEP_BYTES', 64 * 1024))
+
+# Judge: per-run resource limits (0 = unlimited); challenges can override CPU time and memory
+JUDGE_CPU_TIME_LIMIT = float(os.environ.get('JUDGE_CPU_TIME_LIMIT', 5))  # CPU seconds
+JUDGE_WALL_TIME_LIMIT = float(os.environ.get('JUDGE_WALL_TIME_LIMIT', 5))  # seconds; raised to twice the CPU limit if lower
+JUDGE_MEMORY_LIMIT_MB = int(os.environ.get('JUDGE_MEMORY_LIMIT_MB', 256))  # address space (heap for Java)
+JUDGE_FILE_SIZE_LIMIT_BYTES = int(os.environ.get('JUDGE_FILE_SIZE_LIMIT_BYTES', 16 * 1024 * 1024))
+JUDGE_PROCESS_LIMIT = int(os.environ.get('JUDGE_PROCESS_LIMIT', 0))  # counts all of the judge user's processes; set only under a dedicated user
+JUDGE_COMPILE_TIMEOUT = float(os.environ.get('JUDGE_COMPILE_TIMEOUT', 30))  # seconds per compile (not 0); compiles get the file size and process limits too
+
+# Judge: metrics for /metrics. Every process publishes its own to JUDGE_METRICS_DIR (empty = this process only),
+# which must be private like JUDGE_DATA_DIR: /metrics adds up every file in it
+JUDGE_METRICS_DIR = os.environ.get('JUDGE_METRICS_DIR', os.path.join(JUDGE_DATA_DIR, 'metrics'))
+JUDGE_METRICS_PUBLISH_INTERVAL = float(os.environ.get('JUDGE_METRICS_PUBLISH_INTERVAL', 5))  # seconds; at most one write per process
+JUDGE_METRICS_ALLOWED_IPS = os.environ.get('JUDGE_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# One JSON line per judged submission (logger "compiler.metrics") plus the queue workers' logs
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'compiler': {'handlers': ['console'], 'level': os.environ.get('JUDGE_LOG_LEVEL', 'INFO')},
+    },
+}
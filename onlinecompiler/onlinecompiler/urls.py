@@ -1,13 +1,23 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenRefreshView
 from compiler.views import (
     SignupView, CompileCodeView, LeaderboardView,
-    CodingChallengeListCreate, CodingChallengeDetail,
-    ChallengeSolutionView, UserSolutionsView,
+    CodingChallengeListCreate, CodingChallengeDetail, ChallengeTestBundleView,
+    ChallengeSolutionView, RejudgeView, UserSolutionsView, UserSolutionDetailView, JudgeJobDetailView,
+    SubmissionListView, SubmissionDetailView, compile_code_async, solve_challenge_async, job_detail_async,
+    job_events_view, metrics_view,
     LoginView, TokenObtainPairView # Import our new LoginView
 )
 
+# Under ASGI, judge (and long-poll jobs) on the event loop instead of in a thread per request
+if settings.JUDGE_ASYNC_VIEWS:
+    compile_view, solve_view, job_view = compile_code_async, solve_challenge_async, job_detail_async
+else:
+    compile_view, solve_view = CompileCodeView.as_view(), ChallengeSolutionView.as_view()
+    job_view = JudgeJobDetailView.as_view()
+
 urlpatterns = [
     path('admin/', admin.site.urls),
 
@@ -18,16 +28,30 @@ urlpatterns = [
 
     # User endpoints
     path('api/signup/', SignupView.as_view(), name='signup'),
-    path('api/compile/', CompileCodeView.as_view(), name='compile'),
+    path('api/compile/', compile_view, name='compile'),
     path('api/leaderboard/', LeaderboardView.as_view(), name='leaderboard'),
     
     # Challenge endpoints
     path('api/challenges/', CodingChallengeListCreate.as_view(), name='challenges'),
     path('api/challenges/<int:pk>/', CodingChallengeDetail.as_view(), name='challenge-detail'),
-    path('api/challenges/<int:challenge_id>/solve/', ChallengeSolutionView.as_view(), name='solve-challenge'),
+    path('api/challenges/<int:pk>/test-bundle/', ChallengeTestBundleView.as_view(), name='challenge-test-bundle'),
+    path('api/challenges/<int:challenge_id>/solve/', solve_view, name='solve-challenge'),
+    path('api/rejudge/', RejudgeView.as_view(), name='rejudge'),
+    
+    # Queued submissions (poll with ?wait=<seconds>, or stream the events)
+    path('api/jobs/<int:pk>/', job_view, name='judge-job'),
+    path('api/jobs/<int:pk>/events/', job_events_view, name='judge-job-events'),
     
     # User solutions
     path('api/my-solutions/', UserSolutionsView.as_view(), name='my-solutions'),
+    path('api/my-solutions/<int:pk>/', UserSolutionDetailView.as_view(), name='my-solution-detail'),
+    
+    # Submission history (list is slim; detail has code and output)
+    path('api/submissions/', SubmissionListView.as_view(), name='submissions'),
+    path('api/submissions/<int:pk>/', SubmissionDetailView.as_view(), name='submission-detail'),
+    
+    # Prometheus scrape target, local clients only
+    path('metrics', metrics_view, name='metrics'),
     
     # Include compiler URLs
     path('api/', include('compiler.urls')),